@@ -41,25 +41,12 @@
 # to find the signal in the noise.
 
 import os
-import csv
 import sys
 import math
 import argparse
 import warnings
 
-import astropy as ap
-import astropy.io.fits
-
-import matplotlib as mpl
-if "--animate" in sys.argv or "--ani" in sys.argv:
-	mpl.use("TkAgg") # Hack to fix OS X.
-if not os.getenv("DISPLAY"):
-	mpl.use("Agg") # Hack to fix no display.
-import matplotlib.pyplot as plt
-import matplotlib.animation
-
 import numpy as np
-import scipy as sp
 
 import shapely as shp
 import shapely.ops
@@ -69,6 +56,10 @@ import shapely.wkt
 
 import utils
 
+from k2halo import cache
+from k2halo import progress
+from k2halo import profiling
+
 DEFAULT_CROP_FRACTION = 0.2
 
 def percentile_sample(sample, pmin=1.0, pmax=95.0):
@@ -76,69 +67,58 @@ def percentile_sample(sample, pmin=1.0, pmax=95.0):
 		warnings.filterwarnings('ignore', message="(.*)invalid value(.*)")
 		return np.percentile(sample[sample > 0], [pmin, pmax])
 
-# XXX: I don't like the fact that we pregenerate the dithered pixels and then
-#      pass them to smoother. Surely there's a nicer method.
-
-def pixels(shape, config):
-	pxs = np.empty(shape, dtype=object)
-
-	for x, y in utils.positions(pxs):
-		pxs[x, y] = shp.geometry.box(x - config.dither, y - config.dither, x + config.dither, y + config.dither)
-
-	return pxs
-
-def smoother(aperture, pxs, config):
-	smooth = np.zeros_like(pxs, dtype=float)
-
-	for x, y in utils.positions(smooth):
-		smooth[x, y] = pxs[x, y].intersection(aperture).area
-
-	return smooth
-
-def out_csv(flximg, aperture, config):
-	FIELDS = ["cadence", "t", "flux", "x", "y"]
-
+def photometry(flximg, aperture, config, tracer=progress.NULL):
 	flxs = flximg["FLUX"]
-	time = flximg["TIME"]
-	cadn = flximg["CADENCENO"]
 	trac = flximg["TRACK"]
 
-	xs = time
 	ys = []
 
-	pxs = pixels(flxs.shape[1:], config)
-	for i, flx in enumerate(flxs):
-		# XXX: Output some information to convince people we haven't frozen.
-		sys.stdout.write(".")
-		sys.stdout.flush()
-
-		# Smooth and weight using the aperture.
-		_aperture = shp.affinity.translate(aperture, *-trac[i])
-		flx *= smoother(_aperture, pxs, config)
-
-		# TODO: We need to allow certain percentiles rather than just summing.
-		#       The only question is whether that would by physically valid.
-		ys.append(np.sum(flx))
-
-	sys.stdout.write("DONE\n")
-	sys.stdout.flush()
+	pxs = utils.pixels(flxs.shape[1:], config.dither)
+	with tracer.stage("photometry"), tracer.progress("photometry", len(flxs)) as frames:
+		for i, flx in enumerate(flxs):
+			# Smooth and weight using the aperture.
+			_aperture = shp.affinity.translate(aperture, *-trac[i])
+			flx *= utils.smoother(_aperture, pxs)
+
+			# TODO: We need to allow certain percentiles rather than just summing.
+			#       The only question is whether that would by physically valid.
+			ys.append(np.sum(flx))
+			frames.update()
+
+	return {
+		"cadence": flximg["CADENCENO"],
+		"t": flximg["TIME"],
+		"flux": np.array(ys),
+		"x": trac[:,0],
+		"y": trac[:,1],
+	}
+
+def out_csv(data, config):
+	FIELDS = ["cadence", "t", "flux", "x", "y"]
 
 	# Save photometry data.
 	with open(config.ofile, "w", newline='') as cfile:
-		utils.csv_column_write(cfile, [cadn, time, ys, trac[:,0], trac[:,1]], fieldnames=FIELDS)
+		utils.csv_column_write(cfile, [data[field] for field in FIELDS], fieldnames=FIELDS)
 
 # XXX: We **REALLY** don't need this **AT ALL**.
 #      It needs to be killed so we can make the rest of the code useful.
-def plot_ani(fig, flximg, aperture, config):
+def plot_ani(flximg, aperture, config):
+	plt = utils.pyplot(backend="TkAgg") # Hack to fix OS X.
+	import matplotlib.colors
+	import matplotlib.animation
+
 	flxs = flximg["FLUX"]
 	trac = flximg["TRACK"]
 	vmin, vmax = percentile_sample(flxs)
 
+	# XXX: We can fix this. It looks ghastly and only exists for animate.
+	fig = plt.figure(figsize=flxs[0].shape[::-1], dpi=50)
+
 	ax = fig.add_subplot(111)
 	ax.set_title("Centroid Tracking and Annulus Animation")
 	ax.set_xlim(left=-0.5, right=flxs.shape[1]-0.5)
 	ax.set_ylim(bottom=-0.5, top=flxs.shape[2]-0.5)
-	im = ax.matshow(np.zeros(flxs.shape[1:]), cmap="gray", norm=mpl.colors.LogNorm(vmin=vmin, vmax=vmax), origin="lower", interpolation="none")
+	im = ax.matshow(np.zeros(flxs.shape[1:]), cmap="gray", norm=matplotlib.colors.LogNorm(vmin=vmin, vmax=vmax), origin="lower", interpolation="none")
 	pl, = ax.plot([], [], "r+", mew=5, ms=40)
 	txt = ax.text(0.05, 0.05, "", fontsize=26, color="w", backgroundcolor="k", transform=ax.transAxes)
 	fill, = ax.plot([], [], "kx", mew=6, ms=50)
@@ -147,7 +127,7 @@ def plot_ani(fig, flximg, aperture, config):
 	for x, y in utils.positions(apxs):
 		apxs[x, y] = not aperture.intersection(shp.geometry.box(x, y, x + 1, y + 1)).is_empty
 
-	pxs = pixels(flxs.shape[1:], config)
+	pxs = utils.pixels(flxs.shape[1:], config.dither)
 	def animate(i):
 		if i >= flxs.shape[0]:
 			raise StopIteration
@@ -159,7 +139,7 @@ def plot_ani(fig, flximg, aperture, config):
 
 		# Smooth and weight using the aperture.
 		_aperture = shp.affinity.translate(aperture, *-trac[i])
-		flx *= smoother(_aperture, pxs, config)
+		flx *= utils.smoother(_aperture, pxs)
 
 		flx[flx == 0] = np.min(flx[flx != 0])
 
@@ -172,43 +152,44 @@ def plot_ani(fig, flximg, aperture, config):
 		#return [im, pl, fill, txt]
 		return [im, pl, txt]
 
-	ani = mpl.animation.FuncAnimation(fig, animate, interval=15, frames=flxs.shape[0], blit=True, repeat=False)
+	ani = matplotlib.animation.FuncAnimation(fig, animate, interval=15, frames=flxs.shape[0], blit=True, repeat=False)
 
 	if config.ofile:
-		ani.save(config.ofile, writer=mpl.animation.writers['ffmpeg'](fps=15, bitrate=5000), dpi=50)
+		ani.save(config.ofile, writer=matplotlib.animation.writers['ffmpeg'](fps=15, bitrate=5000), dpi=50)
 	else:
 		plt.show()
 
-def main(fits, config):
+def main(fits, config, tracer=progress.NULL):
 	with open(config.maskfile) as mfile:
 		# Straight from shapely.
 		poly = shp.wkt.loads(mfile.read())
 
+	track = None
 	if config.track is not None:
 		with open(config.track) as tfile:
-			# TODO: Fix this by using the utils version?
-			def parse_row(cadence, x, y):
-				return (cadence, float(x), float(y))
-
-			# TODO: Fix this by not using fieldnames=XYZ.
-			rows = csv.DictReader(tfile)
-
-			# First row specifies the polarity.
-			_, mx, my = parse_row(**next(rows))
-			track = np.array([{"cadence": cadence, "x": x*mx, "y": y*my} for (cadence, x, y) in (parse_row(**row) for row in rows)])
-
-	with ap.io.fits.open(fits) as img:
-		flximg = utils.filter_img(img, track=track, frame=config.maskframe)
-
-		# XXX: We can fix this. It looks ghastly and only exists for animate.
-		fig = plt.figure(figsize=flximg["FLUX"][0].shape[::-1], dpi=50)
-
-		if config.plot_type == "ani":
-			plot_ani(fig, flximg, aperture=poly, config=config)
-		elif config.plot_type == "csv":
-			if not config.ofile:
-				raise ValueError("Must specify --save when using --csv.")
-			out_csv(flximg, aperture=poly, config=config)
+			track = utils.read_track(tfile)
+
+	def load():
+		with tracer.stage("load"), utils.open_fits(fits) as img:
+			return utils.filter_img(img, track=track, frame=config.maskframe)
+
+	if config.plot_type == "ani":
+		plot_ani(load(), aperture=poly, config=config)
+	elif config.plot_type == "csv":
+		if not config.ofile:
+			raise ValueError("Must specify --save when using --csv.")
+
+		# The photometry only depends on the inputs and the options which
+		# aren't paths, so it's cached on those.
+		store = cache.from_config(config)
+		key = None
+		if store is not None:
+			inputs = [cache.input_key(path) for path in (utils.resolve_fits(fits), config.maskfile, config.track) if path is not None]
+			key = cache.digest("clever", inputs, cache.config_key(config, ignore=["file", "ofile", "maskfile", "track"]))
+
+		data = cache.cached(store, key, lambda: photometry(load(), aperture=poly, config=config, tracer=tracer))
+		with tracer.stage("write"):
+			out_csv(data, config=config)
 
 if __name__ == "__main__":
 	def __wrapped_main__():
@@ -218,6 +199,8 @@ if __name__ == "__main__":
 		parser.add_argument("-mf", "--mask-frame", dest="maskframe", type=int, default=0, help="Frame number that the mask file is based on (default: 0).")
 		parser.add_argument("-d", "--dither", dest="dither", type=float, default=2, help="Level of dither to mask edges.")
 		parser.add_argument("-s", "--save", dest="ofile", type=str, default=None, help="The output file.")
+		cache.add_arguments(parser)
+		progress.add_arguments(parser)
 
 		# XXX: We should really remove this.
 		o_type = parser.add_mutually_exclusive_group(required=True)
@@ -226,7 +209,9 @@ if __name__ == "__main__":
 
 		parser.add_argument("file", nargs=1)
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
-		main(fits=config.file[0], config=config)
+		with progress.from_config(config) as tracer:
+			main(fits=config.file[0], config=config, tracer=tracer)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
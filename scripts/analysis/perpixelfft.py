@@ -15,56 +15,48 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+# Plots (or saves) the spectrum of every pixel in a postage stamp, which is
+# handy for seeing where in the stamp a signal is actually coming from. The
+# spectra are computed for the whole (time, y, x) cube at once by
+# k2halo.periodogram.pixel_spectra. With --cube the spectra are saved as a .npz
+# of "frequency" (µHz), "amplitude" (frequency, y, x), "mask" and "mean" (both
+# (y, x)), for mapping a frequency band across the stamp later.
+#
+# Amplitudes are in flux units, so a sinusoid of amplitude A peaks at A (for
+# --method=fft they are |rfft| * 2/N over N frames). This script used to plot
+# the raw FFT magnitudes, which are N/2 times larger, so plots and cubes from
+# before that change can't be compared with newer ones without rescaling.
+
 import sys
-import math
+import argparse
 
 import numpy as np
-import matplotlib.pyplot as plt
-
-import scipy as sp
-import scipy.fftpack
-
-import astropy as ap
-import astropy.io.fits
 
 import utils
 
-def img_perpixel_fft(img):
-	flx = img["FLUX"]
-	time = img["TIME"]
-	ws = np.mean(np.diff(time[~np.isnan(time)]))
-
-	if flx.dtype.byteorder != "=":
-		flx = flx.astype(flx.dtype.newbyteorder("="))
-
-	for y in reversed(range(flx.shape[1])):
-		for x in range(flx.shape[2]):
-			data = flx[:, y, x]
-
-			if np.any(np.isnan(data)):
-				yield None
-				continue
+from k2halo import profiling
 
-			fx = np.linspace(0, 1 / ws, data.size / 2)[1:]
-			fy = sp.fftpack.fft(data)[1:fx.size+1]
+def img_perpixel_fft(img, method="fft", mult=1, upper=None):
+	return utils.pixel_spectra(img["TIME"], img["FLUX"], method=method, mult=mult, upper=upper)
 
-			yield (fx, fy, x, y)
+def plot_fft(img, freqs, spectra, mask, output=None):
+	plt = utils.pyplot()
 
-def plot_fft(img, output=None):
 	flx = img["FLUX"]
+	mflxs = np.mean(flx, axis=0)
 
 	width = flx.shape[1]
 	height = flx.shape[2]
 
 	#plt.rcParams["figure.figsize"] = (128, 128)
-	for i, fft in enumerate(img_perpixel_fft(img)):
-		if fft is None:
+	pixels = ((x, y) for y in reversed(range(width)) for x in range(height))
+	for i, (x, y) in enumerate(pixels):
+		# Saturated pixels are constant, so there's nothing to plot on a log
+		# scale.
+		if not mask[y, x] or not spectra[:, y, x].any():
 			continue
 
-		fx, fy, x, y = fft
-		fy = np.abs(fy)
-
-		mflx = np.mean(flx[:, y, x])
+		mflx = mflxs[y, x]
 
 		if mflx > 200000:
 			style = "black"
@@ -79,7 +71,7 @@ def plot_fft(img, output=None):
 
 		plt.subplot(width, height, i + 1)
 		#plt.ylim(ymin=1e1, ymax=1e10)
-		plt.loglog(fx, fy, style)
+		plt.loglog(freqs, spectra[:, y, x], style)
 		plt.axis("off")
 		plt.grid("on")
 
@@ -88,20 +80,37 @@ def plot_fft(img, output=None):
 	else:
 		plt.show()
 
-def main():
-	if len(sys.argv) < 2 or len(sys.argv) > 3:
-		print("invalid number of arguments")
-		sys.exit(1)
-
-	inp = sys.argv[1]
-	out = None
+def save_cube(path, img, freqs, spectra, mask):
+	with np.errstate(invalid="ignore"):
+		mean = np.mean(img["FLUX"], axis=0)
+	np.savez(path, frequency=freqs, amplitude=spectra, mask=mask, mean=mean)
 
-	if len(sys.argv) == 3:
-		out = sys.argv[2]
+def main(ifile, config):
+	with utils.open_fits(ifile) as img:
+		# Keep the NaNs, so the pixels outside the stamp are masked rather
+		# than given the spectrum of a constant.
+		img = utils.filter_img(img, start=config.start, end=config.end, fill_nan=False)
+		freqs, spectra, mask = img_perpixel_fft(img, method=config.method, mult=config.mult, upper=config.upper)
 
-	with ap.io.fits.open(inp) as img:
-		flx = utils.filter_img(img)
-		plot_fft(flx, out)
+	if config.cube:
+		save_cube(config.cube, img, freqs, spectra, mask)
+	if config.ofile or not config.cube:
+		plot_fft(img, freqs, spectra, mask, config.ofile)
 
 if __name__ == "__main__":
-	main()
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Compute the amplitude spectrum of every pixel of a Kepler/K2 postage stamp, and plot them as a grid or save them as a (frequency, y, x) cube. Frequencies are in µHz and amplitudes in flux units (a sinusoid of amplitude A peaks at A), not raw FFT magnitudes.")
+		parser.add_argument("-m", "--method", dest="method", choices=sorted(utils.SPECTRUM_METHODS), default="fft", help="Use a single FFT over the frames, or a Lomb-Scargle periodogram for gapped data (default: fft). Both give amplitudes in flux units; for fft that is |rfft| * 2/N over N frames.")
+		parser.add_argument("-sm", "--sampling", dest="mult", type=float, default=1, help="The multiplicative factor to the minimal sampling rate for --method=lombscargle, higher is oversampling (default: 1).")
+		parser.add_argument("-uf", "--upper-frequency", dest="upper", type=float, default=None, help="Upper frequency (in µHz) to compute up to (default: nyquist).")
+		parser.add_argument("-sc", "--start", dest="start", type=int, default=None, help="Start cadence (default: None).")
+		parser.add_argument("-ec", "--end", dest="end", type=int, default=None, help="End cadence (default: None).")
+		parser.add_argument("-c", "--cube", dest="cube", type=str, default=None, help="Save the spectra as a .npz cube (frequency in µHz, amplitude in flux units) rather than plotting them (unless --save is also given).")
+		parser.add_argument("-s", "--save", dest="ofile", type=str, default=None, help="The output file for the plot (default: show it).")
+		parser.add_argument("file", nargs=1)
+
+		profiling.add_arguments(parser)
+		config = parser.parse_args()
+		main(ifile=config.file[0], config=config)
+
+	profiling.main(__wrapped_main__)
@@ -49,9 +49,6 @@ import numpy as np
 import numpy.fft
 import numpy.ma
 
-import astropy as ap
-import astropy.io.fits
-
 import utils
 
 DEFAULT_PMIN = 1.0
@@ -196,7 +193,7 @@ def plot_fft(ax, flximg, start=0, end=-1, logy=False, logx=False, crop=True, **k
 
 def main(fits, plot_type, sigma=None, sigma_fraction=DEFAULT_FRACTION, **kwargs):
 	fits = fits[0]
-	with ap.io.fits.open(fits) as img:
+	with utils.open_fits(fits) as img:
 		flximg = utils.filter_img(img)
 		fig = plt.figure(figsize=flximg["FLUX"][0].shape[::-1], dpi=30)
 		ax = fig.add_subplot(111)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2015 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Runs the whole analysis over every target in a data/ tree, so that nobody
+# has to run each stage by hand for each target:
+#
+#   track       -- pre/trackframe.py     -> xy_<epic>.csv
+#   mask        -- pre/maskgen.py --init -> ap_<epic>.txt
+#   photometry  -- analysis/clever.py    -> phot_<epic>.csv
+#   highpass    -- post/highpass.py      -> highpass_<epic>.csv
+#   periodogram -- post/dofft.py         -> fft_<epic>.csv
+#
+# Like make, a stage is only run if its output is older than any of its
+# inputs, so re-running after downloading a new campaign only processes the
+# new targets. Tracks and masks are often made (or tweaked) by hand, so they
+# are only generated if they don't exist yet. Targets are processed in
+# parallel, and a summary of each target is written as a CSV file.
+
+import os
+import sys
+import time
+import shlex
+import argparse
+import subprocess
+import concurrent.futures
+
+import utils
+
+from k2halo import datatree
+from k2halo import profiling
+
+SCRIPTS = os.path.dirname(os.path.realpath(__file__))
+
+# (name, script, inputs, output, arguments, regenerate) for each stage, in
+# dependency order. inputs, output and arguments are format strings over the
+# target's files (see target_files). If regenerate is False, an existing
+# output is never rebuilt (without --force).
+STAGES = [
+	("track", "pre/trackframe.py", ["fits"], "track", ["-o", "{track}", "{fits}"], False),
+	("mask", "pre/maskgen.py", ["fits"], "mask", ["--init", "-f", "{fits}"], False),
+	("photometry", "analysis/clever.py", ["fits", "track", "mask"], "phot", ["--csv", "-m", "{mask}", "-t", "{track}", "-s", "{phot}", "{fits}"], True),
+	("highpass", "post/highpass.py", ["phot"], "highpass", ["-s", "{highpass}", "{phot}"], True),
+	("periodogram", "post/dofft.py", ["highpass"], "fft", ["-s", "{fft}", "{highpass}"], True),
+]
+
+# Stages which write their output to stdout rather than taking a path.
+STDOUT_STAGES = {"mask"}
+
+# Stages which take the k2halo.progress options, and so can add their timings
+# to a --trace file.
+TRACED_STAGES = {"track", "mask", "photometry"}
+
+FIELDS = ["star", "target", "status", "ran", "skipped", "seconds", "error"]
+
+def target_files(target):
+	files = {
+		"track": "xy_%d.csv",
+		"mask": "ap_%d.txt",
+		"phot": "phot_%d.csv",
+		"highpass": "highpass_%d.csv",
+		"fft": "fft_%d.csv",
+	}
+	files = {name: os.path.join(target["dir"], fmt % (target["epic"],)) for name, fmt in files.items()}
+
+	# downloaddata.py --no-decompress leaves the FITS file gzipped, which
+	# astropy can read just as well.
+	files["fits"] = utils.resolve_fits(os.path.join(target["dir"], target["fits"]))
+	return files
+
+def out_of_date(output, inputs):
+	if not os.path.exists(output):
+		return True
+	mtime = os.path.getmtime(output)
+	return any(os.path.getmtime(path) > mtime for path in inputs)
+
+# Runs a stage, with its output going to a temporary file which is only
+# renamed into place if the stage succeeds. Otherwise a half-written output
+# would look up to date on the next run.
+def run_stage(script, args, files, output, to_stdout, log):
+	tmp = files[output] + ".tmp"
+	args = [arg.format(**dict(files, **{output: tmp})) for arg in args]
+
+	cmd = [sys.executable, os.path.join(SCRIPTS, script)] + args
+	log.write("$ %s\n" % (" ".join(cmd),))
+	log.flush()
+
+	try:
+		if to_stdout:
+			with open(tmp, "w") as f:
+				subprocess.run(cmd, stdout=f, stderr=log, check=True)
+		else:
+			subprocess.run(cmd, stdout=log, stderr=log, check=True)
+		os.replace(tmp, files[output])
+	except:
+		if os.path.exists(tmp):
+			os.unlink(tmp)
+		raise
+
+# Runs every out-of-date stage for $target, stopping at the first failure.
+# This is what the worker processes run, so it only returns plain data.
+def process_target(target, config):
+	files = target_files(target)
+	result = {"star": target["star"], "target": target["target"], "status": "ok", "ran": [], "skipped": [], "error": ""}
+
+	start = time.time()
+	if not os.path.exists(files["fits"]):
+		result.update({"status": "missing", "error": "no FITS file (run downloaddata.py)"})
+	else:
+		with open(os.path.join(target["dir"], "campaign.log"), "a") as log:
+			for name, script, inputs, output, args, regenerate in STAGES:
+				path = files[output]
+				inputs = [files[inp] for inp in inputs]
+
+				stale = out_of_date(path, inputs) if regenerate else not os.path.exists(path)
+				if not (config.force or stale):
+					result["skipped"].append(name)
+					continue
+
+				args = config.stage_args.get(name, []) + args
+				if config.trace is not None and name in TRACED_STAGES:
+					args = ["--trace", config.trace] + args
+				try:
+					run_stage(script, args, files, output, name in STDOUT_STAGES, log)
+				except subprocess.CalledProcessError as err:
+					result.update({"status": "failed", "error": "%s exited with %d" % (name, err.returncode)})
+					break
+				result["ran"].append(name)
+
+	result["seconds"] = time.time() - start
+	return result
+
+def main(path, outf, config):
+	targets = list(datatree.targets(path))
+
+	start = time.time()
+	with concurrent.futures.ProcessPoolExecutor(max_workers=config.jobs) as pool:
+		futures = [pool.submit(process_target, target, config) for target in targets]
+
+		results = []
+		for future in concurrent.futures.as_completed(futures):
+			result = future.result()
+			results.append(result)
+			sys.stderr.write("[%d/%d] %s/%s: %s\n" % (len(results), len(targets), result["star"], result["target"], result["status"]))
+	elapsed = time.time() - start
+
+	# Keep the summary in the same order as the data tree.
+	order = {(target["star"], target["target"]): idx for idx, target in enumerate(targets)}
+	results.sort(key=lambda result: order[result["star"], result["target"]])
+
+	utils.csv_column_write(outf, [
+		[result["star"] for result in results],
+		[result["target"] for result in results],
+		[result["status"] for result in results],
+		[" ".join(result["ran"]) for result in results],
+		[" ".join(result["skipped"]) for result in results],
+		["%.2f" % (result["seconds"],) for result in results],
+		[result["error"] for result in results],
+	], FIELDS)
+
+	failed = sum(result["status"] == "failed" for result in results)
+	ran = sum(len(result["ran"]) for result in results)
+	sys.stderr.write("%d targets (%d stages run, %d failed) in %.1fs: %.2f targets/min\n" % (len(results), ran, failed, elapsed, 60 * len(results) / max(elapsed, 1e-9)))
+
+if __name__ == "__main__":
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Run the track, mask, photometry, high-pass and periodogram stages for every target in a data tree, skipping stages which are up to date.")
+		parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=os.cpu_count(), help="Number of targets to process in parallel (default: number of CPUs).")
+		parser.add_argument("-f", "--force", dest="force", action="store_true", default=False, help="Re-run every stage, even if its output is up to date.")
+		parser.add_argument("-a", "--stage-args", dest="stage_args", action="append", default=[], help="Extra arguments for a stage, as stage=\"args\" (for example highpass=\"-w 401 -o 6\").")
+		parser.add_argument("--trace", dest="trace", type=str, default=None, help="Append JSON traces of the track, mask and photometry stages to this file (see etc/tracestat.py).")
+		parser.add_argument("-s", "--save", dest="out", type=str, default=None, help="The output file for the summary (default: stdout).")
+		parser.add_argument("path", help="The data tree (containing stars.json).")
+
+		profiling.add_arguments(parser)
+		config = parser.parse_args()
+
+		stage_args = {}
+		for arg in config.stage_args:
+			name, _, args = arg.partition("=")
+			if name not in {stage[0] for stage in STAGES}:
+				parser.error("unknown stage %r" % (name,))
+			stage_args.setdefault(name, []).extend(shlex.split(args))
+		config.stage_args = stage_args
+
+		outf = config.out
+		if outf == None:
+			outf = sys.stdout
+		else:
+			outf = open(outf, "w", newline="")
+		main(path=config.path, outf=outf, config=config)
+
+	profiling.main(__wrapped_main__)
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Times the kernels which dominate the run time of the pipeline on a fixed,
+# seeded synthetic target (see k2halo.synthetic and fakedata.py --corpus), so
+# that optimisations can be measured rather than guessed at. Each benchmark is
+# run --repeat times and (like importtime.py) the fastest run is what counts.
+#
+# The results can be saved as a JSON baseline with --save, and with
+# --baseline the results are compared against a saved baseline: if any
+# benchmark is more than --threshold percent slower than its baseline, or
+# fails when it has a baseline, we exit with a non-zero status. Benchmarks
+# which fail without a baseline (a missing optional dependency, say) are just
+# skipped. Baselines are only comparable on the same machine with the same
+# target size.
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+import platform
+import tempfile
+import collections
+import importlib.util
+
+import numpy
+
+import utils
+
+from k2halo import synthetic
+from k2halo import profiling
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir)
+
+DEFAULT_SIZE = "small"
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 20
+
+# Benchmarks which do something per frame only use this many frames, so that
+# the larger sizes don't take forever.
+FRAME_LIMIT = 200
+
+# Maps benchmark names to functions which take a Target and return the
+# function to be timed (so that setup isn't included in the timing). If each
+# run needs fresh inputs, they can instead return (setup, fn), and every run
+# times fn(setup()) without the setup().
+BENCHMARKS = collections.OrderedDict()
+
+def benchmark(name):
+	def register(fn):
+		BENCHMARKS[name] = fn
+		return fn
+	return register
+
+# Imports one of the scripts (which aren't in a package) as a module.
+def load_script(path):
+	name = os.path.splitext(os.path.basename(path))[0]
+	spec = importlib.util.spec_from_file_location("benchmark_" + name, os.path.join(SCRIPTS_DIR, path))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+# The inputs of the benchmarks, loaded from the files of a synthetic target
+# when they are first needed.
+class Target(object):
+	def __init__(self, files):
+		self.files = files
+		self._cache = {}
+
+	def _get(self, name, load):
+		if name not in self._cache:
+			self._cache[name] = load()
+		return self._cache[name]
+
+	@property
+	def track(self):
+		def load():
+			with open(self.files["track"]) as f:
+				return utils.read_track(f)
+		return self._get("track", load)
+
+	# A fresh HDUList each time, since filter_img modifies the TIME column.
+	# The table is read here rather than in the first timed run.
+	def fits(self):
+		img = utils.open_fits(self.files["fits"])
+		img[1].data
+		return img
+
+	@property
+	def frames(self):
+		return self._get("frames", lambda: utils.filter_img(self.fits(), track=self.track, end=FRAME_LIMIT, fill_nan=False))
+
+	@property
+	def aperture(self):
+		def load():
+			import shapely.wkt
+			with open(self.files["aperture"]) as f:
+				return shapely.wkt.loads(f.read())
+		return self._get("aperture", load)
+
+	@property
+	def truth_csv(self):
+		def load():
+			with open(self.files["truth"], newline="") as f:
+				return f.read()
+		return self._get("truth_csv", load)
+
+	@property
+	def truth(self):
+		return self._get("truth", lambda: utils.csv_column_read(io.StringIO(self.truth_csv), ["cadence", "t", "flux"], casts=[int, float, float]))
+
+	@property
+	def spectrum(self):
+		return self._get("spectrum", lambda: periodogram(*self.truth[1:]))
+
+# The periodogram of a light curve up to 300µHz (which is below the Nyquist
+# frequency, which lombscargle_amplitude warns about).
+def periodogram(times, fluxs):
+	with warnings.catch_warnings():
+		warnings.simplefilter("ignore", UserWarning)
+		return utils.lombscargle_amplitude(times, utils.to_ppm(fluxs), upper=300)
+
+@benchmark("filter_img")
+def bench_filter_img(target):
+	track = target.track
+	return target.fits, lambda img: utils.filter_img(img, track=track)
+
+@benchmark("csv_column_read")
+def bench_csv_column_read(target):
+	text = target.truth_csv
+	return lambda: utils.csv_column_read(io.StringIO(text), ["cadence", "t", "flux"], casts=[int, float, float])
+
+@benchmark("csv_column_write")
+def bench_csv_column_write(target):
+	cols = target.truth
+	return lambda: utils.csv_column_write(io.StringIO(), cols, ["cadence", "t", "flux"])
+
+@benchmark("lombscargle_amplitude")
+def bench_lombscargle(target):
+	_, times, fluxs = target.truth
+	return lambda: periodogram(times, fluxs)
+
+@benchmark("clever.smoother")
+def bench_smoother(target):
+	import shapely.affinity
+
+	flxs = target.frames["FLUX"]
+	trac = target.frames["TRACK"]
+	aperture = target.aperture
+	pxs = utils.pixels(flxs.shape[1:], 0.5)
+
+	def run():
+		for i in range(len(flxs)):
+			utils.smoother(shapely.affinity.translate(aperture, *-trac[i]), pxs)
+	return run
+
+@benchmark("clever.out_csv")
+def bench_out_csv(target):
+	clever = load_script("analysis/clever.py")
+
+	cadns, times, fluxs = target.truth
+	data = {"cadence": cadns, "t": times, "flux": fluxs, "x": numpy.zeros_like(times), "y": numpy.zeros_like(times)}
+
+	tmp = tempfile.NamedTemporaryFile(suffix=".csv")
+	config = argparse.Namespace(ofile=tmp.name)
+	return lambda: clever.out_csv(data, config)
+
+@benchmark("trackframe.flux_similarity")
+def bench_flux_similarity(target):
+	trackframe = load_script("pre/trackframe.py")
+
+	flxs = utils.fill_nan_frames(target.frames["FLUX"])
+	H = trackframe.hanning(flxs.shape[1:])
+	base, flux = flxs[0], H * (flxs[1] - flxs[1].mean()) / flxs[1].std()
+	return lambda: trackframe.flux_similarity(numpy.array([0.1, -0.2]), base, flux, H)
+
+@benchmark("maskgen.postage_stamp")
+def bench_postage_stamp(target):
+	flxs = target.frames["FLUX"]
+	return lambda: utils.postage_stamp(flxs)
+
+@benchmark("maskgen.moving_mask")
+def bench_moving_mask(target):
+	maskgen = load_script("pre/maskgen.py")
+
+	img = target.frames
+	aperture = target.aperture
+	return lambda: maskgen.moving_mask(None, img, aperture)
+
+@benchmark("outliers.reject_outliers")
+def bench_reject_outliers(target):
+	_, times, fluxs = target.truth
+	return lambda: utils.reject_outliers(times, fluxs, sigma=4, passes=3)
+
+@benchmark("echelle.bin_spectrum")
+def bench_echelle(target):
+	freqs, spectrum = target.spectrum
+	bins = int(numpy.ptp(freqs) // 0.1)
+	return lambda: utils.bin_spectrum(freqs, spectrum, 0.1, bins)
+
+@benchmark("perpixelfft.pixel_spectra")
+def bench_pixel_spectra(target):
+	img = target.frames
+	return lambda: utils.pixel_spectra(img["TIME"], img["FLUX"])
+
+# Runs $bench (as returned by a BENCHMARKS function) once to warm up and then
+# $repeat times, returning the fastest and median times.
+def measure(bench, repeat):
+	setup, fn = bench if isinstance(bench, tuple) else (None, bench)
+
+	runs = []
+	for _ in range(repeat + 1):
+		args = () if setup is None else (setup(),)
+		start = time.perf_counter()
+		fn(*args)
+		runs.append(time.perf_counter() - start)
+	runs = runs[1:]
+	return {"min": min(runs), "median": float(numpy.median(runs))}
+
+def metadata(config):
+	return {
+		"size": config.size,
+		"seed": config.seed,
+		"repeat": config.repeat,
+		"python": platform.python_version(),
+		"numpy": numpy.__version__,
+		"machine": platform.machine(),
+		"node": platform.node(),
+	}
+
+def main(config):
+	baseline = None
+	if config.baseline is not None:
+		with open(config.baseline) as f:
+			baseline = json.load(f)
+		if baseline["meta"]["size"] != config.size:
+			sys.stderr.write("warning: baseline was run with size %s, not %s\n" % (baseline["meta"]["size"], config.size))
+
+	# Generate the target, unless it's already in the corpus.
+	tmpdir = None
+	corpus = config.corpus
+	if corpus is None:
+		tmpdir = tempfile.TemporaryDirectory()
+		corpus = tmpdir.name
+
+	files = synthetic.target_files(corpus, config.size)
+	if not all(os.path.exists(path) for path in files.values()):
+		os.makedirs(os.path.dirname(files["fits"]), exist_ok=True)
+		sys.stderr.write("generating %s target in %s\n" % (config.size, corpus))
+		synthetic.generate(files, synthetic.parse_size(config.size), synthetic.target_seed(config.size, config.seed))
+
+	target = Target(files)
+	results = collections.OrderedDict()
+	slower = []
+	failed = []
+
+	print("%-28s %12s %12s %12s %8s" % ("benchmark", "min (ms)", "median (ms)", "base (ms)", "change"))
+	for name in config.benchmarks:
+		try:
+			result = measure(BENCHMARKS[name](target), config.repeat)
+		except Exception as err:
+			status = "skipped"
+			if baseline is not None and name in baseline["results"]:
+				status = "FAILED"
+				failed.append(name)
+			print("%-28s %s: %s: %s" % (name, status, type(err).__name__, err))
+			continue
+
+		results[name] = result
+		base = change = ""
+		if baseline is not None and name in baseline["results"]:
+			previous = baseline["results"][name]["min"]
+			ratio = result["min"] / previous - 1
+			base = "%.2f" % (previous * 1e3,)
+			change = "%+.1f%%" % (ratio * 100,)
+			if ratio * 100 > config.threshold:
+				slower.append(name)
+
+		print("%-28s %12.2f %12.2f %12s %8s" % (name, result["min"] * 1e3, result["median"] * 1e3, base, change))
+
+	if config.save is not None:
+		with open(config.save, "w") as f:
+			json.dump({"meta": metadata(config), "results": results}, f, indent=2)
+
+	if failed:
+		sys.stderr.write("failed, but have a baseline: %s\n" % (", ".join(failed),))
+	if slower:
+		sys.stderr.write("more than %g%% slower than the baseline: %s\n" % (config.threshold, ", ".join(slower)))
+	if failed or slower:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Benchmark the pipeline's kernels on a synthetic target, and compare the results against a saved baseline.")
+		parser.add_argument("-sz", "--size", dest="size", type=str, default=DEFAULT_SIZE, help="Size of the synthetic target, as for fakedata.py (default: %s)." % (DEFAULT_SIZE,))
+		parser.add_argument("--seed", dest="seed", type=int, default=0, help="Base seed of the synthetic target (default: 0).")
+		parser.add_argument("-C", "--corpus", dest="corpus", type=str, default=None, help="Corpus directory (from fakedata.py --corpus) to take the target from, or to generate it in (default: a temporary directory).")
+		parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=DEFAULT_REPEAT, help="Number of runs of each benchmark (default: %d)." % (DEFAULT_REPEAT,))
+		parser.add_argument("-b", "--baseline", dest="baseline", type=str, default=None, help="JSON baseline (from --save) to compare against.")
+		parser.add_argument("-t", "--threshold", dest="threshold", type=float, default=DEFAULT_THRESHOLD, help="Maximum slowdown against the baseline in percent (default: %d)." % (DEFAULT_THRESHOLD,))
+		parser.add_argument("-s", "--save", dest="save", type=str, default=None, help="Save the results as a JSON baseline.")
+		parser.add_argument("-l", "--list", dest="list", action="store_const", const=True, default=False, help="List the benchmarks and exit.")
+		parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS), help="Benchmarks to run (default: all of them).")
+
+		profiling.add_arguments(parser)
+		config = parser.parse_args()
+
+		if config.list:
+			print("\n".join(BENCHMARKS))
+			return
+
+		for name in config.benchmarks:
+			if name not in BENCHMARKS:
+				parser.error("unknown benchmark '%s'" % (name,))
+
+		main(config)
+
+	profiling.main(__wrapped_main__)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Inspects and trims the result cache used by clever.py, trackframe.py,
+# dofft.py and pipeline.py (see k2halo.cache).
+
+import sys
+import time
+import argparse
+
+import utils
+
+from k2halo import cache
+from k2halo import profiling
+
+def human_size(size):
+	for unit in ["B", "K", "M", "G"]:
+		if size < 1024:
+			return "%.1f%s" % (size, unit)
+		size /= 1024
+	return "%.1fT" % (size,)
+
+def human_time(when):
+	if when is None:
+		return "-"
+	return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(when))
+
+def stats(store, config):
+	info = store.stats()
+	print("path:     %s" % (info["path"],))
+	print("entries:  %d" % (info["entries"],))
+	print("size:     %s / %s" % (human_size(info["size"]), human_size(info["max_size"])))
+	print("oldest:   %s" % (human_time(info["oldest"]),))
+	print("newest:   %s" % (human_time(info["newest"]),))
+
+def prune(store, config):
+	removed = store.evict(config.cache_size)
+	print("removed %d entries" % (removed,))
+
+def clear(store, config):
+	removed = store.evict(0)
+	print("removed %d entries" % (removed,))
+
+def main(config):
+	store = cache.Cache(config.cache_dir, max_size=config.cache_size)
+	config.func(store, config)
+
+if __name__ == "__main__":
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Show statistics about, or remove entries from, the on-disk result cache.")
+		parser.add_argument("-C", "--cache-dir", dest="cache_dir", type=str, default=cache.DEFAULT_CACHE_DIR, help="The cache directory (default: %s)." % (cache.DEFAULT_CACHE_DIR,))
+		parser.add_argument("--cache-size", dest="cache_size", type=cache.parse_size, default=cache.DEFAULT_CACHE_SIZE, help="Maximum size of the cache (default: 1G).")
+
+		subparsers = parser.add_subparsers(dest="command")
+		subparsers.required = True
+		subparsers.add_parser("stats", help="Show the number of entries and size of the cache.").set_defaults(func=stats)
+		subparsers.add_parser("prune", help="Remove least recently used entries until the cache is under --cache-size.").set_defaults(func=prune)
+		subparsers.add_parser("clear", help="Remove every entry in the cache.").set_defaults(func=clear)
+
+		profiling.add_arguments(parser)
+		config = parser.parse_args()
+		main(config)
+
+	profiling.main(__wrapped_main__)
@@ -23,23 +23,26 @@ import numpy
 
 import utils
 
+from k2halo import profiling
+
 FIELDS = ["cadence", "t", "flux"]
 CASTS = [int, float, float]
 
+# Each row is the start of a segment between two dropped gaps: its first
+# (compressed) time in the output, its real time and the shift between them.
+MAPPING_FIELDS = ["compressed", "t", "shift"]
+
 
 def main(inf, outf, config):
 	with open(inf, "r", newline="") as f:
 		cadns, times, fluxs = utils.csv_column_read(f, FIELDS, casts=CASTS, start=config.start, end=config.end)
 
-	diffs = numpy.diff(times).copy()
-	assert(numpy.all(diffs >= 0))
-
-	for idx, gap in zip(*numpy.where(diffs > config.width), diffs[diffs > config.width]):
-		# We only remove the gap to the scale of the median.
-		gap -= gap % numpy.median(diffs)
+	# Save the mapping from compressed times back to real times.
+	if config.mapping is not None:
+		with open(config.mapping, "w", newline="") as f:
+			utils.csv_column_write(f, utils.gap_table(times, config.width), MAPPING_FIELDS)
 
-		# Remove the gap. This isn't a concurrent modification because the diffs aren't views.
-		times[idx+1:] -= gap
+	times = utils.drop_gaps(times, config.width)
 
 	# Output the FFT.
 	utils.csv_column_write(outf, [cadns, times, fluxs], FIELDS)
@@ -50,9 +53,11 @@ if __name__ == "__main__":
 		parser.add_argument("-w", "--width", dest="width", type=float, required=True, help="Minimum width of gap to drop in days.")
 		parser.add_argument("-sc", "--start", dest="start", type=int, default=None, help="Start cadence (default: None).")
 		parser.add_argument("-ec", "--end", dest="end", type=int, default=None, help="End cadence (default: None).")
+		parser.add_argument("-m", "--mapping", dest="mapping", type=str, default=None, help="Also write a table mapping compressed times back to real times to this file (default: None).")
 		parser.add_argument("-s", "--save", dest="out", type=str, default=None, help="The output file (default: stdout).")
 		parser.add_argument("file", nargs=1)
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 
 		outf = config.out
@@ -62,5 +67,5 @@ if __name__ == "__main__":
 			outf = open(outf, "w", newline="")
 		main(inf=config.file[0], outf=outf, config=config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
 
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Serves a directory laid out like MAST's target pixel file archive (see
+# k2halo.fakeserver), so downloaddata.py can be pointed at it with --archive
+# and --prf-url. The fault options make it misbehave like real servers do, to
+# see how the downloader copes.
+#
+# With --check, this instead builds a small data tree and archive in a
+# temporary directory and runs downloaddata.py against a stand-in for each of
+# the cases it has to handle (interrupted downloads, partial files which
+# don't fit the server's copy, corrupt leftover .gz files, servers which
+# ignore Range, transient errors and so on), checking that every file comes
+# out intact. If any case fails, we exit with a non-zero status.
+
+import io
+import os
+import sys
+import gzip
+import json
+import time
+import tarfile
+import argparse
+import tempfile
+import subprocess
+
+import numpy
+
+import utils
+
+from k2halo import datatree
+from k2halo import fakeserver
+from k2halo import profiling
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir)
+
+PRF_PATH = "prf.tar.gz"
+
+STAR = "alpha_Fake"
+TARGETS = {"1.201234567": {"campaign": 2}, "2.201234599": {"campaign": 2}}
+
+# Writes a data tree with TARGETS under $tree, and the archive they come
+# from (gzipped FITS-sized random data, and an empty PRF tarball) under
+# $root. Returns {target: (uncompressed contents, target dict)}.
+def populate(tree, root, seed=0):
+	rng = numpy.random.default_rng(seed)
+
+	os.makedirs(os.path.join(tree, STAR))
+	with open(os.path.join(tree, datatree.DATA_JSON), "w") as f:
+		json.dump({"stars": [STAR]}, f)
+	with open(os.path.join(tree, STAR, datatree.STAR_JSON), "w") as f:
+		json.dump({"targets": TARGETS}, f)
+
+	files = {}
+	for target in datatree.targets(tree):
+		data = rng.integers(0, 256, size=20 * 2880, dtype=numpy.uint8).tobytes()
+		path = os.path.join(root, datatree.archive_path(target))
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(path, "wb") as f:
+			f.write(gzip.compress(data, mtime=0))
+		files[target["target"]] = (data, target)
+
+	with tarfile.open(os.path.join(root, PRF_PATH), "w:gz") as tf:
+		info = tarfile.TarInfo("README")
+		info.size = 0
+		tf.addfile(info, io.BytesIO())
+	return files
+
+def downloaddata(server, tree, *args):
+	cmd = [sys.executable, os.path.join(SCRIPTS_DIR, "pre", "downloaddata.py"), "--archive", server.url, "--prf-url", server.url + "/" + PRF_PATH] + list(args) + [tree]
+	return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+
+# Each check gets a fresh tree, archive and server (built with the keyword
+# arguments to fakeserver.archive), calls $prepare(tree, root, files) to
+# set up any leftovers from a previous run, runs downloaddata.py and then
+# $verify(server, files), which returns an error message or None. Every
+# check also requires the run to succeed and every file to be intact.
+CHECKS = []
+
+def check(name, prepare=None, verify=None, **faults):
+	CHECKS.append((name, prepare, verify, faults))
+
+def part_path(target):
+	return os.path.join(target["dir"], target["fits"] + ".gz.part")
+
+def leave_part(fn):
+	def prepare(tree, root, files):
+		for data, target in files.values():
+			with open(os.path.join(root, datatree.archive_path(target)), "rb") as f:
+				gz = f.read()
+			os.makedirs(target["dir"], exist_ok=True)
+			with open(part_path(target), "wb") as f:
+				f.write(fn(gz))
+	return prepare
+
+# Leaves a complete-looking .gz (as from a run interrupted while
+# decompressing) with the contents $fn(gz).
+def leave_gz(fn):
+	def prepare(tree, root, files):
+		for data, target in files.values():
+			with open(os.path.join(root, datatree.archive_path(target)), "rb") as f:
+				gz = f.read()
+			os.makedirs(target["dir"], exist_ok=True)
+			with open(os.path.join(target["dir"], target["fits"] + ".gz"), "wb") as f:
+				f.write(fn(gz))
+	return prepare
+
+def statuses(server, files):
+	return {name: [entry["status"] for entry in server.requests("/" + datatree.archive_path(target))] for name, (_, target) in files.items()}
+
+def expect(want):
+	def verify(server, files):
+		for name, got in statuses(server, files).items():
+			if got != want:
+				return "%s: expected statuses %s, got %s" % (name, want, got)
+	return verify
+
+check("download", verify=expect([200]))
+check("dropped connection is resumed", drop_after=10000, verify=expect([200, 206]))
+check("partial file is resumed", prepare=leave_part(lambda gz: gz[:len(gz) // 2]), verify=expect([206]))
+check("complete partial file is kept", prepare=leave_part(lambda gz: gz), verify=expect([416]))
+check("oversized partial file is restarted", prepare=leave_part(lambda gz: gz + b"junk"), verify=expect([416, 200]))
+check("ignored range is restarted", prepare=leave_part(lambda gz: gz[:len(gz) // 2]), ignore_offset=True, verify=expect([206, 200]))
+check("transient errors are retried", fail=2, verify=expect([503, 503, 200]))
+check("leftover gzip is decompressed", prepare=leave_gz(lambda gz: gz), verify=expect([]))
+check("corrupt leftover gzip is fetched again", prepare=leave_gz(lambda gz: b"\x1f\x8b\x08\x00" + b"garbage" * 100), verify=expect([200]))
+check("truncated leftover gzip is fetched again", prepare=leave_gz(lambda gz: gz[:len(gz) // 2]), verify=expect([200]))
+
+def run_check(name, prepare, verify, faults):
+	with tempfile.TemporaryDirectory(prefix="fakearchive-") as tmp:
+		tree = os.path.join(tmp, "data")
+		root = os.path.join(tmp, "archive")
+		files = populate(tree, root)
+
+		with fakeserver.archive(root, **faults) as server:
+			if prepare is not None:
+				prepare(tree, root, files)
+			proc = downloaddata(server, tree)
+			if proc.returncode != 0:
+				return "downloaddata.py failed:\n" + proc.stdout
+
+			for name, (data, target) in files.items():
+				path = os.path.join(target["dir"], target["fits"])
+				if not os.path.exists(path):
+					return "%s: missing" % (name,)
+				with open(path, "rb") as f:
+					if f.read() != data:
+						return "%s: corrupted" % (name,)
+				if os.path.exists(part_path(target)):
+					return "%s: left a .part behind" % (name,)
+
+			if verify is not None:
+				return verify(server, files)
+
+	return None
+
+def main(config):
+	failed = 0
+	for name, prepare, verify, faults in CHECKS:
+		start = time.perf_counter()
+		error = run_check(name, prepare, verify, faults)
+		status = "ok" if error is None else "FAILED"
+		sys.stdout.write("%-40s %6s (%.1fs)\n" % (name, status, time.perf_counter() - start))
+		if error is not None:
+			failed += 1
+			sys.stdout.write("".join("    %s\n" % (line,) for line in error.splitlines()))
+		sys.stdout.flush()
+
+	if failed:
+		sys.exit(1)
+
+def serve(config):
+	server = fakeserver.archive(config.root, port=config.port, fail=config.fail, drop_after=config.drop_after, ignore_offset=config.ignore_offset)
+	with server:
+		sys.stderr.write("Serving %s on %s (PRF tarball at %s/%s)\n" % (config.root, server.url, server.url, PRF_PATH))
+		try:
+			while True:
+				time.sleep(3600)
+		except KeyboardInterrupt:
+			pass
+
+if __name__ == "__main__":
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Serve a local stand-in for the MAST target pixel file archive, or check downloaddata.py against one.")
+		parser.add_argument("--check", dest="check", action="store_true", default=False, help="Run downloaddata.py against stand-ins for each of the failures it must handle.")
+		parser.add_argument("-p", "--port", dest="port", type=int, default=8000, help="Port to serve on (default: 8000).")
+		parser.add_argument("--fail", dest="fail", type=int, default=0, help="Return 503 for the first N requests for each file (default: 0).")
+		parser.add_argument("--drop-after", dest="drop_after", type=int, default=None, help="Drop the connection after sending this many bytes of each file, the first time it is requested.")
+		parser.add_argument("--ignore-offset", dest="ignore_offset", action="store_true", default=False, help="Answer Range requests with the whole file.")
+		parser.add_argument("root", nargs="?", default=None, help="The archive directory to serve (laid out as in datatree.archive_path).")
+
+		profiling.add_arguments(parser)
+		config = parser.parse_args()
+		if config.check:
+			main(config)
+		elif config.root is None:
+			parser.error("either --check or an archive directory is required")
+		else:
+			serve(config)
+
+	profiling.main(__wrapped_main__)
@@ -15,19 +15,23 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import csv
+import os
 import sys
+import json
 import argparse
-import warnings
 
 import numpy as np
 import numpy.random
 
 import utils
 
+from k2halo import profiling
+
 FIELDS = ["cadence", "t", "flux"]
 CASTS = [int, float, float]
 
+DEFAULT_SIZES = ["tiny", "small", "campaign"]
+
 def fake_data(cadn, time):
 	return 0.5 * np.sin(53*time) + 0.15 * np.sin(82*time + 132)
 
@@ -49,6 +53,37 @@ def main(outf, config):
 
 	utils.csv_column_write(outf, [cadns, times, fluxs], FIELDS)
 
+# Generates a benchmark corpus in $config.corpus, with one directory for each
+# of $config.sizes containing a synthetic target pixel file (tpf.fits), its
+# track (xy.csv), a halo aperture (aperture.wkt) and the ground-truth light
+# curve (truth.csv), as well as an index.json describing all of them. The seed
+# of each size only depends on --seed and the size, so regenerating one size
+# gives the same files.
+def corpus(config):
+	from k2halo import synthetic
+
+	index = {}
+	for size in config.sizes:
+		shape = synthetic.parse_size(size)
+		seed = synthetic.target_seed(size, config.seed)
+
+		path = os.path.join(config.corpus, size)
+		os.makedirs(path, exist_ok=True)
+		files = synthetic.target_files(config.corpus, size)
+
+		sys.stderr.write("generating %s (%dx%dx%d) in %s\n" % (size, shape[0], shape[1], shape[2], path))
+		index[size] = synthetic.generate(files, shape, seed)
+		index[size]["files"] = {key: os.path.relpath(name, config.corpus) for key, name in files.items()}
+
+	# Merge with any sizes already generated.
+	ipath = os.path.join(config.corpus, "index.json")
+	if os.path.exists(ipath):
+		with open(ipath) as f:
+			index = dict(json.load(f), **index)
+
+	with open(ipath, "w") as f:
+		json.dump(index, f, indent=2, sort_keys=True)
+
 if __name__ == "__main__":
 	def __wrapped_main__():
 		parser = argparse.ArgumentParser(description="Given the results of several photometric analyses, decorrelate the data using a given type.")
@@ -57,9 +92,18 @@ if __name__ == "__main__":
 		parser.add_argument("-st", "--start-time", dest="start", type=float, default=0, help="Start time (default: 0).")
 		parser.add_argument("-et", "--end-time", dest="end", type=float, default=30, help="End time (default: 30).")
 		parser.add_argument("-s", "--save", dest="out", type=str, default=None, help="The output file (default: stdout).")
+		parser.add_argument("-C", "--corpus", dest="corpus", type=str, default=None, help="Generate a benchmark corpus of synthetic target pixel files in this directory instead of a light curve.")
+		parser.add_argument("-sz", "--size", dest="sizes", action="append", default=None, help="Size of target to generate in the corpus, either a name (tiny, small, campaign, large, huge) or RxCxN such as 10x10x1k. Can be given more than once (default: %s)." % (", ".join(DEFAULT_SIZES),))
+		parser.add_argument("--seed", dest="seed", type=int, default=0, help="Base seed for the corpus (default: 0).")
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 
+		if config.corpus is not None:
+			config.sizes = config.sizes or DEFAULT_SIZES
+			corpus(config)
+			return
+
 		outf = config.out
 		if outf == None:
 			outf = sys.stdout
@@ -68,4 +112,4 @@ if __name__ == "__main__":
 
 		main(outf=outf, config=config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
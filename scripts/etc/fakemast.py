@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Serves recorded MAST search responses (see k2halo.fakeserver), so that
+# find_interesting.py can be pointed at it with --epic-url and --data-url.
+# With --upstream, searches which haven't been recorded are passed on to the
+# real MAST and appended to the recording, so a recording can be made by
+# running a search once against the stand-in.
+#
+# With --check, this instead runs find_interesting.py against a stand-in
+# with a small made-up recording, checking that transient errors are retried,
+# that repeated searches are answered from the cache and that truncated
+# results are warned about. If any case fails, we exit with a non-zero status.
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import utils
+
+from k2halo import fakeserver
+from k2halo import profiling
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir)
+
+EPIC_PATH = "/k2/epic/search.php"
+DATA_PATH = "/k2/data_search/search.php"
+
+# The made-up sky used by --check: bright stars with their V magnitudes, and
+# the postage stamps around each of them.
+BRIGHTS = [
+	({"EPIC": 201000001, "RA": "11 02 03.1", "Dec": "+01 02 03.4", "HIP": 5001}, 4.2),
+	({"EPIC": 201000002, "RA": "11 12 13.1", "Dec": "+01 12 13.4"}, 4.9),
+	({"EPIC": 201000003, "RA": "11 22 23.1", "Dec": "+01 22 23.4", "HIP": 5003}, 5.7),
+]
+
+NEARS = {
+	201000001: [
+		{"K2 ID": 201000101, "Dataset Name": "KTWO201000101-C01", "Campaign": 1, "Ang Sep (')": 0.5},
+		{"K2 ID": 201000102, "Dataset Name": "KTWO201000102-C01", "Campaign": 1, "Ang Sep (')": 2.25},
+	],
+	201000002: [],
+	201000003: [
+		{"K2 ID": 201000301, "Dataset Name": "KTWO201000301-C10", "Campaign": 10, "Ang Sep (')": 4.0},
+	],
+}
+
+MAGNITUDES = {"<=6": 6, "<=5": 5}
+
+def recording(path, params, rows):
+	body = json.dumps(rows) if rows else "no rows found\n"
+	return {"method": "POST", "path": path, "params": params, "status": 200, "body": body}
+
+# The recorded responses for the made-up sky. Only the params which pick the
+# response are recorded, see fakeserver.load_recordings.
+def recordings():
+	recs = []
+	for search, limit in MAGNITUDES.items():
+		rows = [bright for bright, vmag in BRIGHTS if vmag <= limit]
+		recs.append(recording(EPIC_PATH, [["extra_column_name_1", "vmag"], ["extra_column_value_1", search]], rows))
+	for bright, _ in BRIGHTS:
+		recs.append(recording(DATA_PATH, [["ra", bright["RA"]], ["dec", bright["Dec"]]], NEARS[bright["EPIC"]]))
+	return recs
+
+def expected(search):
+	return [{
+		"bright": bright["EPIC"],
+		"hip": bright.get("HIP", None),
+		"campaigns": sorted(set(near["Campaign"] for near in NEARS[bright["EPIC"]])),
+		"nears": [{
+			"epic": near["K2 ID"],
+			"dsname": near["Dataset Name"],
+			"campaign": near["Campaign"],
+			"ang_sep": near["Ang Sep (')"],
+		} for near in NEARS[bright["EPIC"]]],
+	} for bright, vmag in BRIGHTS if vmag <= MAGNITUDES[search]]
+
+# Runs find_interesting.py against $server, returning an error message or
+# None. The output must match the made-up sky, and a warning is only allowed
+# if $warn.
+def find_interesting(server, tmp, search="<=6", warn=False, *args):
+	outfile = os.path.join(tmp, "interesting.json")
+	cmd = [sys.executable, os.path.join(SCRIPTS_DIR, "pre", "find_interesting.py"),
+		"--epic-url", server.url + EPIC_PATH, "--data-url", server.url + DATA_PATH,
+		"-C", os.path.join(tmp, "cache"), "--backoff", "0.05", "-m", search] + list(args) + [outfile]
+	proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+	if proc.returncode != 0:
+		return "find_interesting.py failed:\n" + proc.stdout
+	if ("warning:" in proc.stdout) != warn:
+		return "expected %s warning:\n%s" % ("a" if warn else "no", proc.stdout)
+
+	with open(outfile) as f:
+		data = json.load(f)["data"]
+	for entry in data:
+		entry["campaigns"] = sorted(entry["campaigns"])
+	if data != expected(search):
+		return "unexpected output for %s: %s" % (search, json.dumps(data))
+	return None
+
+# Each check gets a fresh cache and server (built with the keyword arguments
+# to fakeserver.recorded), and calls $run(server, tmp), which returns an
+# error message or None.
+CHECKS = []
+
+def check(name, **faults):
+	def wrap(run):
+		CHECKS.append((name, run, faults))
+		return run
+	return wrap
+
+def statuses(server, path):
+	return [entry["status"] for entry in server.requests(path)]
+
+@check("search")
+def search(server, tmp):
+	error = find_interesting(server, tmp)
+	if error is None and len(server.requests()) != 1 + len(BRIGHTS):
+		error = "expected %d requests, got %d" % (1 + len(BRIGHTS), len(server.requests()))
+	return error
+
+@check("transient errors are retried", fail=2)
+def transient(server, tmp):
+	error = find_interesting(server, tmp)
+	if error is None:
+		for path in (EPIC_PATH, DATA_PATH):
+			got = statuses(server, path)
+			if got.count(503) != 2 or got.count(200) != len(got) - 2:
+				return "%s: expected two 503s and the rest 200, got %s" % (path, got)
+	return error
+
+@check("repeated search is cached")
+def cached(server, tmp):
+	error = find_interesting(server, tmp)
+	if error is None:
+		before = len(server.requests())
+		error = find_interesting(server, tmp)
+		if error is None and len(server.requests()) != before:
+			error = "expected no requests, got %d" % (len(server.requests()) - before,)
+	return error
+
+@check("new magnitude reuses cone searches")
+def magnitude(server, tmp):
+	error = find_interesting(server, tmp)
+	if error is None:
+		before = len(server.requests(DATA_PATH))
+		error = find_interesting(server, tmp, "<=5")
+		if error is None and len(server.requests(DATA_PATH)) != before:
+			error = "expected no data searches, got %d" % (len(server.requests(DATA_PATH)) - before,)
+	return error
+
+@check("truncated results are warned about")
+def truncated(server, tmp):
+	return find_interesting(server, tmp, "<=6", True, "--max-records", str(len(BRIGHTS)))
+
+def run_check(run, faults):
+	with tempfile.TemporaryDirectory(prefix="fakemast-") as tmp:
+		with fakeserver.recorded(recordings(), **faults) as server:
+			return run(server, tmp)
+
+def main(config):
+	failed = 0
+	for name, run, faults in CHECKS:
+		start = time.perf_counter()
+		error = run_check(run, faults)
+		status = "ok" if error is None else "FAILED"
+		sys.stdout.write("%-40s %6s (%.1fs)\n" % (name, status, time.perf_counter() - start))
+		if error is not None:
+			failed += 1
+			sys.stdout.write("".join("    %s\n" % (line,) for line in error.splitlines()))
+		sys.stdout.flush()
+
+	if failed:
+		sys.exit(1)
+
+def serve(config):
+	recs = []
+	if config.recording is not None and os.path.exists(config.recording):
+		recs = fakeserver.load_recordings(config.recording)
+
+	server = fakeserver.recorded(recs, port=config.port, fail=config.fail, upstream=config.upstream, record=config.recording)
+	with server:
+		sys.stderr.write("Serving %d recorded responses on %s (use --epic-url %s%s --data-url %s%s)\n" % (len(recs), server.url, server.url, EPIC_PATH, server.url, DATA_PATH))
+		try:
+			while True:
+				time.sleep(3600)
+		except KeyboardInterrupt:
+			pass
+
+if __name__ == "__main__":
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Serve recorded MAST search responses, or check find_interesting.py against them.")
+		parser.add_argument("--check", dest="check", action="store_true", default=False, help="Run find_interesting.py against a stand-in with a made-up recording.")
+		parser.add_argument("-p", "--port", dest="port", type=int, default=8000, help="Port to serve on (default: 8000).")
+		parser.add_argument("--fail", dest="fail", type=int, default=0, help="Return 503 for the first N requests to each search (default: 0).")
+		parser.add_argument("--upstream", dest="upstream", default=None, help="Pass searches without a recorded response on to this server (such as https://archive.stsci.edu), recording its response.")
+		parser.add_argument("recording", nargs="?", default=None, help="The JSON lines file of recorded responses (see k2halo.fakeserver.load_recordings).")
+
+		profiling.add_arguments(parser)
+		config = parser.parse_args()
+		if config.check:
+			main(config)
+		elif config.recording is None:
+			parser.error("either --check or a recording is required")
+		else:
+			serve(config)
+
+	profiling.main(__wrapped_main__)
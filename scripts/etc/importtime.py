@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Our pipelines run 5-10 of these scripts per target, so for the simple
+# numeric filters the interpreter and import time is usually more than the
+# time spent doing any actual work. This runs each script with --help (which
+# exits straight after everything at the top of the file has been imported)
+# under `python -X importtime` and reports how long it took to start up, as
+# well as the slowest top-level imports. If any script takes longer than the
+# budget, we exit with a non-zero status.
+
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+import utils
+
+from k2halo import profiling
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir)
+
+DEFAULT_BUDGET = 150
+DEFAULT_SCRIPTS = [
+	"post/ppm.py",
+	"post/variance.py",
+	"post/highpass.py",
+	"post/outliers.py",
+	"post/decorrelate.py",
+	"post/dofft.py",
+	"etc/dropgaps.py",
+	"etc/raw2psd.py",
+]
+
+# import time: self [us] | cumulative | imported package
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+# Returns a list of (cumulative µs, module) for all of the top-level imports,
+# which together make up the total import time of the script.
+def toplevel_imports(stderr):
+	imports = []
+	for line in stderr.splitlines():
+		match = IMPORTTIME_RE.match(line)
+		if match is None:
+			continue
+
+		_, cumulative, indent, module = match.groups()
+		if len(indent) == 1:
+			imports.append((int(cumulative), module))
+	return imports
+
+def startup(script, python=sys.executable):
+	path = os.path.join(SCRIPTS_DIR, script)
+
+	start = time.perf_counter()
+	proc = subprocess.run([python, "-X", "importtime", path, "--help"], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+	wall = time.perf_counter() - start
+
+	if proc.returncode != 0:
+		raise RuntimeError("%s --help failed: %s" % (script, proc.stderr.strip()))
+
+	return wall, toplevel_imports(proc.stderr)
+
+def main(config):
+	over = []
+
+	print("%-24s %10s %10s  %s" % ("script", "wall (ms)", "import (ms)", "slowest imports"))
+	for script in config.scripts:
+		# We take the fastest of the runs, since we're interested in how long
+		# the script takes rather than how noisy the machine is.
+		runs = [startup(script) for _ in range(config.repeat)]
+		wall, imports = min(runs, key=lambda run: run[0])
+
+		total = sum(cumulative for cumulative, _ in imports)
+		slowest = sorted(imports, reverse=True)[:config.top]
+		print("%-24s %10.1f %10.1f  %s" % (script, wall * 1e3, total / 1e3, ", ".join("%s (%.1f)" % (module, cumulative / 1e3) for cumulative, module in slowest)))
+
+		if wall * 1e3 > config.budget:
+			over.append(script)
+
+	if over:
+		sys.stderr.write("over the %dms budget: %s\n" % (config.budget, ", ".join(over)))
+		sys.exit(1)
+
+if __name__ == "__main__":
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Measure the startup time (interpreter + imports) of the given scripts using `python -X importtime`.")
+		parser.add_argument("-b", "--budget", dest="budget", type=int, default=DEFAULT_BUDGET, help="Maximum startup time of each script in ms (default: %d)." % (DEFAULT_BUDGET,))
+		parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=5, help="Number of runs of each script (default: 5).")
+		parser.add_argument("-n", "--top", dest="top", type=int, default=3, help="Number of slowest imports to show (default: 3).")
+		parser.add_argument("scripts", nargs="*", default=DEFAULT_SCRIPTS, help="Scripts to measure, relative to scripts/ (default: the numeric filters).")
+
+		profiling.add_arguments(parser)
+		config = parser.parse_args()
+		main(config)
+
+	profiling.main(__wrapped_main__)
@@ -15,38 +15,37 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import os
 import sys
 import argparse
 
 import utils
-import numpy
-
-def main(ifile, config):
-	with open(ifile) as f:
-		ts, Vs = utils.csv_column_read(f, ["t", "V"], casts=[float, float])
-
-	# For any given spectral band, the apparent magnitude is given by:
-	#   m_x = -5 log_{100} (\frac{F_x}{F_{x,0}})
-	# And a difference (m_1 - m_2) is given by:
-	#   dm  = -5 log_{100} (\frac{F_1}{F_2})
-	# Which means that F (as a fraction of some reference F_{x,0}) is given by:
-	#   F   = 100^{\frac{m}{5}}
 
+# For any given spectral band, the apparent magnitude is given by:
+#   m_x = -5 log_{100} (\frac{F_x}{F_{x,0}})
+# And a difference (m_1 - m_2) is given by:
+#   dm  = -5 log_{100} (\frac{F_1}{F_2})
+# Which means that F (as a fraction of some reference F_{x,0}) is given by:
+#   F   = 100^{\frac{m}{5}}
+def mag2flux(Vs, inverse=False):
 	fluxs = 100 ** (Vs / 5.0)
 
-	if config.inverse:
+	if inverse:
 		fluxs = 1.0 / fluxs
 
+	return fluxs
+
+def main(ifile, config):
 	out = sys.stdout
 	if config.ofile:
-		out = open(config.ofile)
+		out = open(config.ofile, "w", newline="")
 
-	utils.csv_column_write(out, [ts, fluxs], ["t", "flux"])
+	with open(ifile, newline="") as f:
+		utils.csv_transform(f, out, {"flux": (["V"], lambda Vs: mag2flux(Vs, inverse=config.inverse))}, keep=["t"], size=config.chunk_size)
 	out.close()
 
 if __name__ == "__main__":
 	parser = argparse.ArgumentParser(description="Generates a HR diagram from a file output from find_interesting.py.")
+	parser.add_argument("-cs", "--chunk-size", dest="chunk_size", type=int, default=100000, help="Number of rows converted at a time (default: 100000).")
 	parser.add_argument("-s", "--save", dest="ofile", type=str, default=None, help="The output file.")
 	parser.add_argument("-i", "--inverse", dest="inverse", action="store_const", default=False, const=True, help="Invert the flux, which should be done if m = m_target - m_ref.")
 	parser.add_argument("--no-inverse", dest="inverse", action="store_const", default=False, const=False, help="Do not invert the flux, which should be done if m = m_ref - m_target. (default)")
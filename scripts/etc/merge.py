@@ -15,21 +15,21 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import csv
 import sys
-import math
 import argparse
 
 import numpy
 
 import utils
 
+from k2halo import combine
+from k2halo import profiling
+
 FIELDS = ["t", "flux"]
 CASTS = [float, float]
 
 def main(files, outf, config):
-	TIME = []
-	FLUX = []
+	series = []
 
 	# We split the filename into <fname>[:<start>:<end>].
 	for fname in files:
@@ -48,32 +48,22 @@ def main(files, outf, config):
 		with open(fname, "r", newline="") as f:
 			times, fluxs = utils.csv_column_read(f, FIELDS, casts=CASTS)
 
-		# Times.
-		offset = times - times.min()
-
-		# Allow negative slices.
-		if end < 0:
-			end = offset.max() + (end + 1)
+		# The slice is found by bisection, so the file has to be sorted.
+		if numpy.any(numpy.diff(times) < 0):
+			order = numpy.argsort(times, kind="stable")
+			times = times[order]
+			fluxs = fluxs[order]
 
-		# Filter.
-		filt = (start <= offset) & (offset <= end)
-		times = times[filt]
-		fluxs = fluxs[filt]
+		# Filter (negative ends count back from the end).
+		rnge = combine.time_slice(times, start, end)
+		series.append([times[rnge], fluxs[rnge]])
 
-		# Append.
-		TIME = numpy.append(TIME, times)
-		FLUX = numpy.append(FLUX, fluxs)
+	# Merge the (sorted) series by time.
+	TIME, FLUX = combine.merge(series)
 
 	# Fake the cadence numbers.
 	CADN = numpy.arange(TIME.shape[0]) + 1
 
-	# We need to sort by the time. This is a bit of a pain, because the operation
-	# of "sorting rows" isn't a thing in numpy. We need to switch out to Python
-	# lists.
-	tosort = numpy.array([TIME, FLUX]).T
-	tosort = sorted(list(tosort), key=lambda arr: arr[0])
-	TIME, FLUX = numpy.array(tosort).T
-
 	utils.csv_column_write(outf, [CADN, TIME, FLUX], ["cadence"] + FIELDS)
 
 if __name__ == "__main__":
@@ -85,6 +75,7 @@ if __name__ == "__main__":
 		parser.add_argument("-s", "--save", dest="out", type=str, default=None, help="The output file (default: stdout).")
 		parser.add_argument("files", nargs='+')
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 
 		outf = config.out
@@ -95,4 +86,4 @@ if __name__ == "__main__":
 
 		main(files=config.files, outf=outf, config=config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
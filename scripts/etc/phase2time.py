@@ -15,39 +15,32 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import os
 import sys
 import argparse
 
 import utils
-import numpy
 
 def main(ifile, config):
 	out = sys.stdout
 	if config.ofile:
-		out = open(config.ofile)
+		out = open(config.ofile, "w", newline="")
 
-	with open(ifile) as f:
-		first = f.readline().strip()
-		fields = first.split(",")
+	def phase2time(ts):
+		return ts * config.period + config.offset
 
+	with open(ifile, newline="") as f:
 		try:
-			t_idx = fields.index("t")
-		except ValueError:
-			sys.stderr.write("No 't' entry in CSV.\n")
+			utils.csv_transform(f, out, {"t": (["t"], phase2time)}, size=config.chunk_size, lineterminator="\n")
+		except ValueError as err:
+			sys.stderr.write("%s.\n" % (err,))
 			sys.exit(1)
-
-		out.write(first + "\n")
-		for line in f:
-			entries = line.strip().split(",")
-			entries[t_idx] = "%.17g" % (float(entries[t_idx]) * config.period + config.offset,)
-			out.write(",".join(entries) + "\n")
-		out.flush()
+	out.flush()
 
 if __name__ == "__main__":
 	parser = argparse.ArgumentParser(description="Generates a HR diagram from a file output from find_interesting.py.")
 	parser.add_argument("-p", "--period", dest="period", type=float, default=1.0, help="Period to expand the phase to.")
 	parser.add_argument("-O", "--offset", dest="offset", type=float, default=0.0, help="Offset to add to the phase (in terms of _time_ not phase).")
+	parser.add_argument("-cs", "--chunk-size", dest="chunk_size", type=int, default=100000, help="Number of rows converted at a time (default: 100000).")
 	parser.add_argument("-s", "--save", dest="ofile", type=str, default=None, help="The output file.")
 	parser.add_argument("csv", nargs=1)
 
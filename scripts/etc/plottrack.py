@@ -21,28 +21,12 @@ import math
 import argparse
 import itertools
 
-import matplotlib as mpl
-mpl.use("TkAgg")
-if not os.getenv("DISPLAY"):
-	mpl.use("Agg") # Hack to fix no display.
-import matplotlib.pyplot as plt
-
-mpl.rcParams.update({
-	"backend": "ps",
-	"text.latex.preamble": [r"\usepackage{gensymb}"],
-	"axes.labelsize": 13, # fontsize for x and y labels (was 10)
-	"axes.titlesize": 13,
-	"font.size": 13, # was 10
-	"legend.fontsize": 13, # was 10
-	"xtick.labelsize": 13,
-	"ytick.labelsize": 13,
-	"font.family": "serif", # ???
-})
-
 import numpy
 
 import utils
 
+from k2halo import profiling
+
 FIELDS = ["cadence", "x", "y"]
 CASTS = [str, float, float]
 
@@ -70,6 +54,7 @@ def plot_track(ax, config, ifile):
 		ax.set_ylabel(r"{x, y} offset (px)")
 
 def main(ifiles, config):
+	plt = utils.pyplot(backend="TkAgg", rcparams=utils.RCPARAMS)
 	fig = plt.figure(figsize=(5.7, 4.5), dpi=50)
 	ax = utils.latexify(fig.add_subplot(111))
 	for ifile in ifiles:
@@ -96,8 +81,9 @@ if __name__ == "__main__":
 		parser.add_argument("--timeseries", dest="collapse", action="store_false", default=True, help="Plot a timeseries rather than collapsed version.")
 		parser.add_argument("csv", nargs='+')
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 
 		main(config.csv, config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
@@ -23,6 +23,8 @@ import numpy as np
 
 import utils
 
+from k2halo import profiling
+
 def main(inf, outf, config):
 	FIELDS = ["frequency", "amplitude"]
 	CASTS = [float, float]
@@ -44,6 +46,7 @@ if __name__ == "__main__":
 		parser.add_argument("-s", "--save", dest="out", type=str, default=None, help="The output file (default: stdout).")
 		parser.add_argument("file", nargs=1)
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 
 		outf = config.out
@@ -53,5 +56,5 @@ if __name__ == "__main__":
 			outf = open(outf, "w", newline="")
 		main(inf=config.file[0], outf=outf, config=config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
 
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Repacks Kepler/K2 target pixel files so that they take up less space on disk
+# without having to be decompressed before use. The frames are moved into
+# tile-compressed (lossless) image HDUs, one tile per frame, which every
+# script that reads target pixel files through k2halo understands. See
+# k2halo.io.repack_tpf for the layout.
+
+import os
+import sys
+import argparse
+
+import utils
+
+from k2halo import io
+from k2halo import profiling
+
+def main(inf, outf, config):
+	with utils.open_fits(inf) as img:
+		io.repack_tpf(img, outf, compression_type=config.compression, overwrite=config.force)
+
+	# open_fits also accepts $inf.gz when only that exists.
+	before, after = os.path.getsize(io.resolve_fits(inf)), os.path.getsize(outf)
+	sys.stderr.write("%s: %d -> %d bytes (%.1f%%)\n" % (inf, before, after, 100 * after / before))
+
+if __name__ == "__main__":
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Repack a Kepler/K2 target pixel file (.fits or .fits.gz) into a tile-compressed FITS file which the analysis scripts can read directly.")
+		parser.add_argument("-c", "--compression", dest="compression", type=str, default="GZIP_2", help="The tile compression algorithm, which must be lossless for floating point data (default: GZIP_2).")
+		parser.add_argument("-f", "--force", dest="force", action="store_true", default=False, help="Overwrite the output file if it exists.")
+		parser.add_argument("input", help="The target pixel file to repack.")
+		parser.add_argument("output", help="The repacked output file.")
+
+		profiling.add_arguments(parser)
+		config = parser.parse_args()
+		main(inf=config.input, outf=config.output, config=config)
+
+	profiling.main(__wrapped_main__)
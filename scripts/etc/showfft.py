@@ -18,24 +18,10 @@
 import os
 import argparse
 
-import matplotlib as mpl
-mpl.use("TkAgg")
-import matplotlib.pyplot as plt
-
-mpl.rcParams.update({
-	"backend": "ps",
-	"text.latex.preamble": [r"\usepackage{gensymb}"],
-	"axes.labelsize": 13, # fontsize for x and y labels (was 10)
-	"axes.titlesize": 13,
-	"font.size": 13, # was 10
-	"legend.fontsize": 13, # was 10
-	"xtick.labelsize": 13,
-	"ytick.labelsize": 13,
-	"font.family": "serif", # ???
-})
-
 import utils
 
+from k2halo import profiling
+
 def plot_fft(fig, config):
 	CASTS = [float, float]
 	FIELDS = ["frequency", config.pgtype]
@@ -66,10 +52,11 @@ def plot_fft(fig, config):
 		if config.maxy > config.miny >= 0:
 			ax.set_ylim([config.miny, config.maxy])
 
-	plt.legend()
+	ax.legend()
 	fig.tight_layout()
 
 def main(config):
+	plt = utils.pyplot(backend="TkAgg", rcparams=utils.RCPARAMS)
 	plot_fft(plt.figure(figsize=(10, 6 * len(config.ifiles)), dpi=80), config)
 
 	if config.ofile:
@@ -100,8 +87,9 @@ if __name__ == "__main__":
 		parser.add_argument("-s", "--save", dest="ofile", type=str, default=None, help="The output file.")
 		parser.add_argument("csv", nargs="+")
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 		config.ifiles = config.csv
 		main(config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
@@ -26,6 +26,8 @@ import astropy.io.fits
 
 import utils
 
+from k2halo import profiling
+
 # Indexing of Kepler channels is a follows:
 # * Each channel belongs to a module and has a number,
 #   represented in the form MOD <module>.<number>.
@@ -152,7 +154,8 @@ if __name__ == "__main__":
 		parser.add_argument("-o", "--output", dest="outf", type=str, required=True, help="The output file.")
 		parser.add_argument("ffi", nargs=1)
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 		main(fits=config.ffi[0], outf=config.outf, config=config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Summarises the JSON traces written by scripts with --trace (see
+# k2halo.progress), usually from a whole campaign.py --trace batch. For each
+# script and stage this reports the total and mean wall clock and CPU time
+# and the slowest frame rates, followed by the slowest runs overall, so it's
+# easy to see both which stage the time goes on and which targets are slow.
+
+import sys
+import json
+import argparse
+import collections
+
+import utils
+
+from k2halo import profiling
+
+SORT_KEYS = {"wall", "cpu", "peak_rss"}
+
+def read_traces(files):
+	for path in files:
+		with open(path) as f:
+			for lineno, line in enumerate(f, 1):
+				line = line.strip()
+				if not line:
+					continue
+				try:
+					yield json.loads(line)
+				except ValueError:
+					# A run which was killed half way through writing.
+					sys.stderr.write("%s:%d: skipping malformed trace\n" % (path, lineno))
+
+def stage_table(traces):
+	stages = collections.OrderedDict()
+	for trace in traces:
+		for stage in trace["stages"]:
+			key = (trace["script"], stage["name"])
+			total = stages.setdefault(key, {"runs": 0, "wall": 0.0, "cpu": 0.0, "fps": []})
+			total["runs"] += 1
+			total["wall"] += stage["wall"]
+			total["cpu"] += stage["cpu"]
+		for name, frames in trace.get("frames", {}).items():
+			key = (trace["script"], name)
+			if key in stages:
+				stages[key]["fps"].append(frames["fps"])
+	return stages
+
+def format_rss(rss):
+	if rss is None:
+		return "-"
+	return "%.1fM" % (rss / 2**20,)
+
+def main(outf, config):
+	traces = list(read_traces(config.files))
+	if not traces:
+		sys.stderr.write("no traces found\n")
+		sys.exit(1)
+
+	wall = sum(trace["wall"] for trace in traces)
+	outf.write("%d runs, %.1fs wall clock (%.1fs CPU)\n\n" % (len(traces), wall, sum(trace["cpu"] for trace in traces)))
+
+	outf.write("%-16s %-12s %6s %10s %10s %9s %6s %12s\n" % ("script", "stage", "runs", "wall", "cpu", "mean", "%", "min frames/s"))
+	for (script, name), total in stage_table(traces).items():
+		fps = "%.1f" % (min(total["fps"]),) if total["fps"] else "-"
+		outf.write("%-16s %-12s %6d %9.1fs %9.1fs %8.2fs %5.1f%% %12s\n" % (script, name, total["runs"], total["wall"], total["cpu"], total["wall"] / total["runs"], 100 * total["wall"] / max(wall, 1e-9), fps))
+
+	key = lambda trace: trace.get(config.sort) or 0
+	outf.write("\nslowest %d runs by %s:\n" % (min(config.top, len(traces)), config.sort))
+	for trace in sorted(traces, key=key, reverse=True)[:config.top]:
+		stages = ", ".join("%s %.1fs" % (stage["name"], stage["wall"]) for stage in trace["stages"])
+		outf.write("%9.1fs %9.1fs %8s  %s %s [%s] (%s)\n" % (trace["wall"], trace["cpu"], format_rss(trace.get("peak_rss")), trace["script"], " ".join(trace["argv"]), trace["status"], stages))
+
+	failed = [trace for trace in traces if trace["status"] != "ok"]
+	if failed:
+		outf.write("\n%d runs failed:\n" % (len(failed),))
+		for trace in failed:
+			outf.write("  %s %s [%s]\n" % (trace["script"], " ".join(trace["argv"]), trace["status"]))
+
+if __name__ == "__main__":
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Summarise the JSON traces written by --trace, showing where the time goes and which runs were the slowest.")
+		parser.add_argument("-n", "--top", dest="top", type=int, default=10, help="Number of slowest runs to show (default: 10).")
+		parser.add_argument("-S", "--sort", dest="sort", choices=sorted(SORT_KEYS), default="wall", help="What to rank the slowest runs by (default: wall).")
+		parser.add_argument("-s", "--save", dest="ofile", type=str, default=None, help="The output file (default: stdout).")
+		parser.add_argument("files", nargs="+", help="Trace files to summarise.")
+
+		profiling.add_arguments(parser)
+		config = parser.parse_args()
+
+		outf = config.ofile
+		if outf is None:
+			outf = sys.stdout
+		else:
+			outf = open(outf, "w")
+		with outf:
+			main(outf, config)
+
+	profiling.main(__wrapped_main__)
@@ -0,0 +1,46 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2015 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# k2halo is the shared library behind the scripts in scripts/{pre,post,etc,
+# analysis}. Each of those directories used to carry its own copy of utils.py
+# (and some scripts carried their own forks of filter_img), which meant every
+# fix had to be made several times over. Now the kernels live here and the
+# per-directory utils.py is just a shim that re-exports them.
+#
+# The package is split up by what each module needs to import:
+#
+#   k2halo.io          -- CSV columns, tracking data and FITS files.
+#   k2halo.image       -- Filtering of target pixel file frames, and comparing images.
+#   k2halo.periodogram -- Periodograms (per target and per pixel), PSD calibration and binning.
+#   k2halo.geometry    -- Pixel grids and aperture polygons.
+#   k2halo.plot        -- Plot styling.
+#   k2halo.timeseries  -- Light curve filters (high-pass, outliers, folding, ...).
+#   k2halo.pipeline    -- Chaining timeseries filters in one process.
+#   k2halo.cache       -- On-disk cache of intermediate results.
+#   k2halo.datatree    -- Walking the data/ metadata tree.
+#   k2halo.prf         -- Indexed, memory mapped Kepler PRF images.
+#   k2halo.query       -- Rate limited, cached queries to MAST and SIMBAD.
+#   k2halo.catalogue   -- Local EPIC catalogue with a spatial index.
+#   k2halo.combine     -- Aligning and reducing many light curves.
+#   k2halo.synthetic   -- Synthetic target pixel files for benchmarks.
+#   k2halo.progress    -- Progress, stage timings and JSON traces on stderr.
+#   k2halo.profiling   -- The --profile option (cProfile, tracemalloc, sampling).
+#   k2halo.fakeserver  -- Local stand-ins for MAST, for exercising downloads and searches offline.
+#
+# Only numpy is imported at module load time. Anything heavier (scipy,
+# astropy, shapely, matplotlib and friends) is imported inside the functions
+# which need it, so that simple filters don't pay for things they never use.
@@ -0,0 +1,227 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A content-addressed store for intermediate results, so that re-running a
+# computation we've already done is just a file read. Keys are hex digests
+# (see digest) of everything which identifies a result -- the input data and
+# the parameters used -- and values are dicts of numpy arrays, stored as .npz
+# files under the cache directory.
+
+# The cache is bounded in size: every read bumps an entry's mtime, and once a
+# write pushes the total size over the limit the least recently used entries
+# are removed until it is back under EVICT_TO of the limit. Finding the total
+# means walking the whole cache, so that is only done on the first write (and
+# on each eviction), and in between we keep a running total of what we've
+# written. Writes by other processes aren't counted until our next walk.
+
+import os
+import json
+import hashlib
+import tempfile
+
+import numpy
+
+DEFAULT_CACHE_DIR = os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "k2halo")
+DEFAULT_CACHE_SIZE = 1 << 30
+
+# The fraction of the limit to evict down to, so that a full cache isn't
+# walked again on every write.
+EVICT_TO = 0.9
+
+# Hashes each of $parts in order. numpy arrays are hashed by their dtype,
+# shape and contents, bytes are hashed as-is and anything else is hashed as
+# canonical JSON (sorted keys), so {"a": 1, "b": 2} and {"b": 2, "a": 1} have
+# the same digest.
+def digest(*parts):
+	h = hashlib.sha256()
+	for part in parts:
+		if isinstance(part, numpy.ndarray):
+			part = numpy.ascontiguousarray(part)
+			h.update(("ndarray:%s:%r:" % (part.dtype.str, part.shape)).encode("utf-8"))
+			h.update(part.tobytes())
+		elif isinstance(part, bytes):
+			h.update(b"bytes:")
+			h.update(part)
+		else:
+			h.update(b"json:")
+			h.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+		h.update(b"\0")
+	return h.hexdigest()
+
+def file_digest(path, chunk_size=1 << 20):
+	h = hashlib.sha256()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(chunk_size), b""):
+			h.update(chunk)
+	return h.hexdigest()
+
+# Identifies the file at $path by both its contents and its mtime, so that a
+# file which has been rewritten (even with the same contents) is treated as a
+# new input.
+def input_key(path):
+	return digest(file_digest(path), os.stat(path).st_mtime_ns)
+
+# Canonicalises an argparse namespace into something digest can hash. The
+# options listed in $ignore (output files, cache, progress and profiling options
+# and so on) don't affect the result and so aren't part of the key.
+def config_key(config, ignore=()):
+	ignore = set(ignore) | {"cache_dir", "cache_size", "no_cache", "no_progress", "trace", "trace_rss", "profile", "profile_dir"}
+	return {name: value for name, value in vars(config).items() if name not in ignore}
+
+class Cache(object):
+	def __init__(self, path=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+		self.path = path
+		self.max_size = max_size
+		self._size = None
+
+	def _path(self, key, ext=".npz"):
+		return os.path.join(self.path, key[:2], key + ext)
+
+	def entries(self):
+		for root, _, files in os.walk(self.path):
+			for name in files:
+				if not name.endswith((".npz", ".raw")):
+					continue
+				path = os.path.join(root, name)
+				try:
+					st = os.stat(path)
+				except OSError:
+					continue
+				yield path, st.st_size, st.st_mtime
+
+	def _read(self, path, read):
+		try:
+			data = read(path)
+		except (OSError, ValueError):
+			# Missing or corrupt entries are just cache misses.
+			return None
+
+		# Mark the entry as recently used.
+		try:
+			os.utime(path)
+		except OSError:
+			pass
+		return data
+
+	def _write(self, path, write):
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+
+		# Write to a temporary file and then rename it, so that concurrent
+		# readers never see a partially written entry.
+		fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+		try:
+			with os.fdopen(fd, "wb") as f:
+				write(f)
+			os.replace(tmp, path)
+		except:
+			os.unlink(tmp)
+			raise
+
+		if self.max_size is None:
+			return
+		if self._size is None:
+			# Our first write, so we don't know the total yet.
+			self.evict(self.max_size)
+			return
+		self._size += os.path.getsize(path)
+		if self._size > self.max_size:
+			self.evict(int(self.max_size * EVICT_TO))
+
+	def get(self, key):
+		def read(path):
+			with numpy.load(path, allow_pickle=False) as npz:
+				return {name: npz[name] for name in npz.files}
+		return self._read(self._path(key), read)
+
+	def put(self, key, data):
+		self._write(self._path(key), lambda f: numpy.savez(f, **data))
+
+	# Like get and put, but for plain bytes (such as responses from remote
+	# services) rather than dicts of arrays.
+	def get_raw(self, key):
+		def read(path):
+			with open(path, "rb") as f:
+				return f.read()
+		return self._read(self._path(key, ".raw"), read)
+
+	def put_raw(self, key, data):
+		self._write(self._path(key, ".raw"), lambda f: f.write(data))
+
+	# Removes the least recently used entries until the cache is no larger
+	# than $max_size bytes. Returns the number of entries removed.
+	def evict(self, max_size=0):
+		entries = sorted(self.entries(), key=lambda entry: entry[2])
+		total = sum(size for _, size, _ in entries)
+
+		removed = 0
+		for path, size, _ in entries:
+			if total <= max_size:
+				break
+			try:
+				os.unlink(path)
+			except FileNotFoundError:
+				pass
+			total -= size
+			removed += 1
+
+		self._size = total
+		return removed
+
+	def stats(self):
+		entries = list(self.entries())
+		atimes = [atime for _, _, atime in entries]
+		return {
+			"path": self.path,
+			"entries": len(entries),
+			"size": sum(size for _, size, _ in entries),
+			"max_size": self.max_size,
+			"oldest": min(atimes, default=None),
+			"newest": max(atimes, default=None),
+		}
+
+# Returns the cached result for $key, or computes it with $fn() (which must
+# return a dict of numpy arrays) and caches it. $store may be None, in which
+# case $fn() is always called.
+def cached(store, key, fn):
+	if store is not None:
+		data = store.get(key)
+		if data is not None:
+			return data
+
+	data = fn()
+	if store is not None:
+		store.put(key, data)
+	return data
+
+# Parses sizes like "512M" or "2G" (powers of 1024), for --cache-size.
+def parse_size(size):
+	units = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+	size = size.strip().upper().rstrip("B")
+	unit = size[-1:] if size[-1:] in units else ""
+	return int(float(size[:len(size)-len(unit)]) * units[unit])
+
+# The cache options shared by every script which caches its results. Use
+# from_config to get the configured Cache (or None for --no-cache).
+def add_arguments(parser):
+	parser.add_argument("-C", "--cache-dir", dest="cache_dir", type=str, default=DEFAULT_CACHE_DIR, help="Directory to cache results in (default: %s)." % (DEFAULT_CACHE_DIR,))
+	parser.add_argument("--cache-size", dest="cache_size", type=parse_size, default=DEFAULT_CACHE_SIZE, help="Maximum size of the cache, least recently used results are removed first (default: 1G).")
+	parser.add_argument("--no-cache", dest="no_cache", action="store_true", default=False, help="Don't read or write cached results.")
+
+def from_config(config):
+	if config.no_cache:
+		return None
+	return Cache(config.cache_dir, max_size=config.cache_size)
@@ -0,0 +1,153 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A local copy of (part of) the EPIC catalogue, so that neighbour searches
+# don't need a cone search on MAST for every star. Stars are indexed with a
+# KD-tree over their unit vectors on the celestial sphere, where a cone of
+# angular radius r is a ball of radius 2 sin(r/2) (the chord length), so a
+# query is a ball search in the tree and there's no trouble at the poles or
+# where RA wraps around.
+#
+# A catalogue is stored as a .npz of columns: "epic", "ra" and "dec" (in
+# degrees) always, and whatever else was in the source CSV (magnitudes,
+# campaign, HIP number, ...) as floats or strings.
+
+import csv
+import math
+
+import numpy
+
+# Column names used by the various MAST search outputs for the columns we
+# need. Anything else is kept under its own name (lowercased).
+COLUMN_ALIASES = {
+	"epic": ["epic", "k2 id", "id", "ktc_k2_id", "epic id"],
+	"ra": ["ra", "ra (j2000)", "k2_ra", "sci_ra"],
+	"dec": ["dec", "dec (j2000)", "k2_dec", "sci_dec"],
+	"vmag": ["vmag", "v mag"],
+	"k2_avail_flag": ["k2_avail_flag", "k2 avail flag"],
+	"hip": ["hip", "hip id"],
+	"campaign": ["campaign", "sci_campaign"],
+	"dsname": ["dataset name", "sci_data_set_name"],
+}
+
+# Parses a coordinate, either in decimal degrees or sexagesimal ("h m s" or
+# "d m s", with spaces or colons). Sexagesimal RAs are in hours.
+def parse_angle(value, hours=False):
+	value = value.strip()
+	parts = value.replace(":", " ").split()
+	if len(parts) == 1:
+		return float(value)
+
+	sign = -1 if value.startswith("-") else 1
+	angle = sum(abs(float(part)) / 60 ** idx for idx, part in enumerate(parts))
+	if hours:
+		angle *= 15
+	return sign * angle
+
+def unit_vectors(ra, dec):
+	ra = numpy.radians(ra)
+	dec = numpy.radians(dec)
+	return numpy.column_stack([numpy.cos(dec) * numpy.cos(ra), numpy.cos(dec) * numpy.sin(ra), numpy.sin(dec)])
+
+def chord(radius):
+	return 2 * math.sin(math.radians(radius / 60) / 2)
+
+def separation(xyz1, xyz2):
+	# Convert chord lengths back to arcmin.
+	dist = numpy.linalg.norm(xyz1 - xyz2, axis=-1)
+	return 60 * numpy.degrees(2 * numpy.arcsin(numpy.clip(dist / 2, 0, 1)))
+
+# Reads a catalogue CSV (as downloaded from the MAST EPIC or K2 data search)
+# into the columns of a Catalogue.
+def read_csv(f):
+	reader = csv.DictReader(f)
+	fields = {}
+	for field in reader.fieldnames:
+		name = field.strip().lower()
+		for column, aliases in COLUMN_ALIASES.items():
+			if name in aliases:
+				name = column
+				break
+		fields[field] = name
+
+	rows = {name: [] for name in fields.values()}
+	for row in reader:
+		# MAST sometimes sticks a row of column types under the header.
+		if row.get(reader.fieldnames[0], "").strip() in {"", "string", "integer", "float"}:
+			continue
+		for field, name in fields.items():
+			rows[name].append((row[field] or "").strip())
+
+	for name in ("epic", "ra", "dec"):
+		if name not in rows:
+			raise ValueError("catalogue has no %s column" % (name,))
+
+	columns = {
+		"epic": numpy.array(rows.pop("epic"), dtype=numpy.int64),
+		"ra": numpy.array([parse_angle(ra, hours=True) for ra in rows.pop("ra")]),
+		"dec": numpy.array([parse_angle(dec) for dec in rows.pop("dec")]),
+	}
+
+	# Keep the other columns as floats if they all look like numbers.
+	for name, values in rows.items():
+		try:
+			columns[name] = numpy.array([float(value) if value else numpy.nan for value in values])
+		except ValueError:
+			columns[name] = numpy.array(values)
+	return columns
+
+class Catalogue(object):
+	def __init__(self, columns):
+		import scipy.spatial
+
+		self.columns = columns
+		self.xyz = unit_vectors(columns["ra"], columns["dec"])
+		self.tree = scipy.spatial.cKDTree(self.xyz)
+
+	def __len__(self):
+		return len(self.columns["epic"])
+
+	def __getitem__(self, name):
+		return self.columns[name]
+
+	@classmethod
+	def load(cls, path):
+		with numpy.load(path, allow_pickle=False) as npz:
+			return cls({name: npz[name] for name in npz.files})
+
+	def save(self, path):
+		numpy.savez_compressed(path, **self.columns)
+
+	# Returns the indices of the stars within $radius arcmin of each of the
+	# positions ($ras and $decs in degrees, scalars or arrays), sorted by
+	# separation, along with their separations (in arcmin).
+	def neighbours(self, ras, decs, radius):
+		xyz = unit_vectors(numpy.atleast_1d(ras), numpy.atleast_1d(decs))
+		results = []
+		for point, idxs in zip(xyz, self.tree.query_ball_point(xyz, chord(radius))):
+			idxs = numpy.array(idxs, dtype=int)
+			seps = separation(self.xyz[idxs], point)
+			order = numpy.argsort(seps)
+			results.append((idxs[order], seps[order]))
+
+		if numpy.ndim(ras) == 0:
+			return results[0]
+		return results
+
+	# Returns a dict of the columns of row $idx.
+	def row(self, idx):
+		return {name: column[idx].item() for name, column in self.columns.items()}
@@ -0,0 +1,170 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Combining several light curves of the same target cadence by cadence (for
+# instance the light curves from many apertures, as in reduce.py). Inputs are
+# aligned on their cadence numbers and added to a reduction one at a time, so
+# only the per-cadence state of the reduction is kept in memory rather than
+# every input.
+
+import tempfile
+
+import numpy
+
+# Returns a mask of which of $values are in $sorted (which must be sorted).
+def contains(sorted, values):
+	if not len(sorted):
+		return numpy.zeros(len(values), dtype=bool)
+
+	idx = numpy.searchsorted(sorted, values)
+	idx = numpy.minimum(idx, len(sorted) - 1)
+	return sorted[idx] == values
+
+# Returns the (sorted) cadences present in every one of $cadences, which is
+# an iterable of arrays that are only consumed one at a time. Each input is
+# merged against the running intersection with a binary search, so this is a
+# single pass over the inputs.
+def intersect(cadences):
+	common = None
+	for cadns in cadences:
+		if common is None:
+			common = numpy.unique(cadns)
+		else:
+			common = common[contains(numpy.sort(cadns), common)]
+	return common
+
+# Returns the indices of $common (all of which must be in $cadns) in $cadns,
+# so that col[align(cadns, common)] is aligned with $common.
+def align(cadns, common):
+	order = numpy.argsort(cadns, kind="stable")
+	return order[numpy.searchsorted(cadns, common, sorter=order)]
+
+# Scales $values to unit L2 norm (unless they're all zero).
+def normalise(values):
+	norm = numpy.sqrt(numpy.dot(values, values))
+	if norm == 0:
+		return values
+	return values / norm
+
+# The reductions take a number of cadences, have each input added with
+# add(values) and return the reduced values from result().
+
+class Sum(object):
+	def __init__(self, size):
+		self.total = numpy.zeros(size)
+		self.count = 0
+
+	def add(self, values):
+		self.total += values
+		self.count += 1
+
+	def result(self):
+		return self.total
+
+class Mean(Sum):
+	def result(self):
+		return self.total / self.count
+
+# The exact median needs every input, so they are spooled to a temporary file
+# and the median is computed from a memory map of it, $block cadences at a
+# time. If $approximate, a remedian with the given $base is used instead,
+# which only keeps $base inputs for each of log_$base(n) levels: every $base
+# inputs at one level are replaced by their median at the next level, and the
+# result is the median of what's left, weighted by level. With fewer than
+# $base inputs it's the exact median.
+class Median(object):
+	def __init__(self, size, approximate=False, base=15, block=4096):
+		self.size = size
+		self.approximate = approximate
+		self.base = base
+		self.block = block
+		self.count = 0
+
+		self.levels = [[]]
+		self.spool = None
+		if not approximate:
+			self.spool = tempfile.TemporaryFile()
+
+	def add(self, values):
+		values = numpy.asarray(values, dtype=float)
+		self.count += 1
+
+		if not self.approximate:
+			values.tofile(self.spool)
+			return
+
+		self.levels[0].append(values)
+		for level, buf in enumerate(self.levels):
+			if len(buf) < self.base:
+				break
+			if level + 1 == len(self.levels):
+				self.levels.append([])
+			self.levels[level + 1].append(numpy.median(buf, axis=0))
+			buf.clear()
+
+	def result(self):
+		# Nothing was spooled if there are no cadences, and an empty file
+		# can't be memory mapped.
+		if not self.size:
+			return numpy.empty(0)
+		if not self.count:
+			return numpy.full(self.size, numpy.nan)
+
+		if not self.approximate:
+			self.spool.flush()
+			data = numpy.memmap(self.spool, dtype=float, mode="r", shape=(self.count, self.size))
+			return numpy.concatenate([numpy.median(data[:, lo:lo+self.block], axis=0) for lo in range(0, self.size, self.block)])
+
+		if len(self.levels) == 1:
+			return numpy.median(self.levels[0], axis=0)
+
+		# Weighted median of the leftovers at every level.
+		values = numpy.array([values for buf in self.levels for values in buf])
+		weights = numpy.array([self.base ** level for level, buf in enumerate(self.levels) for _ in buf], dtype=float)
+
+		order = numpy.argsort(values, axis=0)
+		cumulative = numpy.cumsum(weights[order], axis=0)
+		middle = numpy.argmax(cumulative >= cumulative[-1] / 2, axis=0)
+		return numpy.take_along_axis(values, order, axis=0)[middle, numpy.arange(self.size)]
+
+# Returns the slice of $times (which must be sorted) whose offset from the
+# first time is within [$start, $end] days. A negative $end counts back from
+# the last time, with -1 being the end.
+def time_slice(times, start=0, end=-1):
+	if not len(times):
+		return slice(0, 0)
+
+	offset = times - times[0]
+	if end < 0:
+		end = offset[-1] + (end + 1)
+
+	lo = numpy.searchsorted(offset, start, side="left")
+	hi = numpy.searchsorted(offset, end, side="right")
+	return slice(lo, hi)
+
+# Merges several time series (each a list of columns, the first of which is
+# the time) into one sorted by time, with ties kept in the order of the inputs.
+# The inputs are concatenated once and put in order with one stable argsort,
+# which takes advantage of the inputs already being sorted runs.
+def merge(series):
+	series = list(series)
+	if not series:
+		return []
+
+	cols = [numpy.concatenate(col) for col in zip(*series)]
+	order = numpy.argsort(cols[0], kind="stable")
+	return [col[order] for col in cols]
@@ -0,0 +1,69 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The data/ tree describes our whole workload: data/stars.json lists the
+# stars, each data/<star>/targets.json lists the targets near that star, and
+# each target gets a directory data/<star>/<N.epic>/ (N being its rank by
+# angular separation) holding its FITS file and everything derived from it.
+
+import os
+import json
+
+DATA_JSON = "stars.json"
+STAR_JSON = "targets.json"
+TARGET_JSON = "target.json"
+
+FITS_NAME = "ktwo%d-c%.2d_lpd-targ.fits"
+
+# Where MAST keeps the (gzipped) FITS file of a target.
+ARCHIVE_URL = "https://archive.stsci.edu/pub/k2/target_pixel_files"
+ARCHIVE_PATH = "c%d/%.9d/%.5d/%s.gz"
+
+def archive_path(target):
+	def lead(x, n):
+		return x - x%n
+	epic = target["epic"]
+	return ARCHIVE_PATH % (target["campaign"], lead(epic, 1e5), lead(epic % 1e5, 1e3), target["fits"])
+
+# The URL of the FITS file of $target (as yielded by targets) in $archive.
+def fits_url(target, archive=ARCHIVE_URL):
+	return archive + "/" + archive_path(target)
+
+# Yields a dict for every target in the data tree at $path, in the order
+# they're listed in the JSON metadata. As well as the targets.json entry for
+# the target (campaign, angsep and so on), each dict has the star name, the
+# target name ("N.epic"), the EPIC number, the target directory and the name
+# of its (uncompressed) FITS file.
+def targets(path):
+	with open(os.path.join(path, DATA_JSON)) as fstars:
+		stars = json.load(fstars)
+
+	for star in stars["stars"]:
+		with open(os.path.join(path, star, STAR_JSON)) as ftargets:
+			star_targets = json.load(ftargets)
+
+		for target, data in star_targets["targets"].items():
+			epic = int(target.split(".")[1])
+			info = dict(data)
+			info.update({
+				"star": star,
+				"target": target,
+				"epic": epic,
+				"dir": os.path.join(path, star, target),
+				"fits": FITS_NAME % (epic, data["campaign"]),
+			})
+			yield info
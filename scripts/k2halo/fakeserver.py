@@ -0,0 +1,278 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Local stand-ins for the remote services we depend on, so that the download
+# and query code can be exercised (see etc/fakearchive.py and etc/fakemast.py)
+# without a network connection and without being at the mercy of MAST's
+# uptime. Each stand-in is an HTTP server on localhost, run in a background
+# thread, which logs every request it gets and can be told to misbehave in the
+# ways real servers do:
+#
+#   fail         -- The first $fail requests for each path get a 503.
+#   drop_after   -- The first response body for each path is cut off after
+#                   this many bytes, as if the connection dropped.
+#
+# Servers are only imported (and started) when they are used.
+
+import os
+import sys
+import json
+import email.utils
+import threading
+import collections
+
+class StandIn(object):
+	def __init__(self, handler, port=0, fail=0, drop_after=None):
+		import http.server
+
+		self.fail = fail
+		self.drop_after = drop_after
+		self.log = []
+		self._counts = collections.Counter()
+		self._dropped = set()
+		self._lock = threading.Lock()
+
+		class Server(http.server.ThreadingHTTPServer):
+			daemon_threads = True
+
+			# Clients hanging up on us (which the downloader does on
+			# purpose when it gets a range it didn't ask for) isn't an
+			# error worth a traceback.
+			def handle_error(self, request, client_address):
+				if not isinstance(sys.exc_info()[1], ConnectionError):
+					super().handle_error(request, client_address)
+
+		self.server = Server(("127.0.0.1", port), handler)
+		self.server.standin = self
+		self._thread = None
+
+	@property
+	def url(self):
+		host, port = self.server.server_address[:2]
+		return "http://%s:%d" % (host, port)
+
+	def start(self):
+		self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
+		if self._thread is not None:
+			self._thread.join()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc):
+		self.stop()
+
+	# Counts a request for $path, returning whether it should fail.
+	def should_fail(self, path):
+		with self._lock:
+			self._counts[path] += 1
+			return self._counts[path] <= self.fail
+
+	# How many bytes of the body for $path to send before dropping the
+	# connection, or None to send all of it.
+	def drop_at(self, path):
+		with self._lock:
+			if self.drop_after is None or path in self._dropped:
+				return None
+			self._dropped.add(path)
+			return self.drop_after
+
+	def record(self, method, path, headers, status):
+		with self._lock:
+			self.log.append({"method": method, "path": path, "headers": headers, "status": status})
+
+	# The logged requests for $path, or all of them.
+	def requests(self, path=None):
+		with self._lock:
+			return [entry for entry in self.log if path is None or entry["path"] == path]
+
+def _handler_base():
+	import http.server
+
+	class Handler(http.server.BaseHTTPRequestHandler):
+		protocol_version = "HTTP/1.1"
+
+		@property
+		def standin(self):
+			return self.server.standin
+
+		def log_message(self, *args):
+			pass
+
+		def reply(self, status, body=b"", headers=None, drop_at=None):
+			self.standin.record(self.command, self.path.split("?")[0], dict(self.headers), status)
+
+			self.send_response(status)
+			for name, value in (headers or {}).items():
+				self.send_header(name, value)
+			self.send_header("Content-Length", str(len(body)))
+			if drop_at is not None:
+				self.send_header("Connection", "close")
+			self.end_headers()
+
+			if self.command == "HEAD":
+				return
+			if drop_at is not None:
+				self.wfile.write(body[:drop_at])
+				self.wfile.flush()
+				self.close_connection = True
+				return
+			self.wfile.write(body)
+
+		# Handles the common fault injection, returning True if the request
+		# has already been answered.
+		def faulty(self, path):
+			if self.standin.should_fail(path):
+				self.reply(503, b"try again later\n")
+				return True
+			return False
+
+	return Handler
+
+# Serves the files under $root like MAST's archive (see datatree.fits_url):
+# with ETag and Last-Modified validators, conditional requests and byte
+# ranges. $ignore_offset makes ranged requests get a 206 for the whole file,
+# like a broken proxy.
+def archive_handler(root, ignore_offset=False):
+	base = _handler_base()
+
+	class ArchiveHandler(base):
+		def do_GET(self):
+			path = self.path.split("?")[0]
+			if self.faulty(path):
+				return
+
+			fpath = os.path.normpath(os.path.join(root, path.lstrip("/")))
+			if not fpath.startswith(os.path.normpath(root) + os.sep) or not os.path.isfile(fpath):
+				return self.reply(404, b"not found\n")
+
+			with open(fpath, "rb") as f:
+				body = f.read()
+			st = os.stat(fpath)
+			headers = {
+				"ETag": '"%x-%x"' % (st.st_mtime_ns, st.st_size),
+				"Last-Modified": email.utils.formatdate(st.st_mtime, usegmt=True),
+				"Accept-Ranges": "bytes",
+			}
+
+			if self.headers.get("If-None-Match") == headers["ETag"]:
+				return self.reply(304, headers=headers)
+
+			ranged = self.headers.get("Range", "")
+			if ranged.startswith("bytes=") and ranged.endswith("-"):
+				start = int(ranged[len("bytes="):-1])
+				if start >= len(body):
+					headers["Content-Range"] = "bytes */%d" % (len(body),)
+					return self.reply(416, headers=headers)
+				if ignore_offset:
+					start = 0
+				headers["Content-Range"] = "bytes %d-%d/%d" % (start, len(body) - 1, len(body))
+				return self.reply(206, body[start:], headers, drop_at=self.standin.drop_at(path))
+
+			self.reply(200, body, headers, drop_at=self.standin.drop_at(path))
+
+		do_HEAD = do_GET
+
+	return ArchiveHandler
+
+def archive(root, port=0, fail=0, drop_after=None, ignore_offset=False):
+	return StandIn(archive_handler(root, ignore_offset=ignore_offset), port=port, fail=fail, drop_after=drop_after)
+
+# Recorded responses are kept as JSON lines of {"method", "path", "params",
+# "status", "body"}, where params is a list of [name, value] pairs (from the
+# query string or the form). A request is answered by the first recording
+# with the same method and path whose params are all in the request, so a
+# hand-written recording only needs the params which matter (the cone search
+# position, say) while a recorded one has every param.
+def load_recordings(path):
+	with open(path) as f:
+		return [json.loads(line) for line in f if line.strip()]
+
+def _matches(recording, method, path, params):
+	if (recording["method"], recording["path"]) != (method, path):
+		return False
+	return not (collections.Counter(map(tuple, recording["params"])) - collections.Counter(params))
+
+# Answers requests from $recordings (a list, see load_recordings). If
+# $upstream is given, requests without a recording are passed on to it and
+# the response is recorded (and appended to the file $record, if given).
+def recorded_handler(recordings, upstream=None, record=None):
+	import urllib.parse
+
+	base = _handler_base()
+
+	class RecordedHandler(base):
+		def _params(self):
+			query = urllib.parse.urlsplit(self.path).query
+			params = urllib.parse.parse_qsl(query, keep_blank_values=True)
+			length = int(self.headers.get("Content-Length") or 0)
+			if length:
+				params += urllib.parse.parse_qsl(self.rfile.read(length).decode("utf-8"), keep_blank_values=True)
+			return params
+
+		def _answer(self):
+			path = self.path.split("?")[0]
+			params = self._params()
+			if self.faulty(path):
+				return
+
+			for recording in recordings:
+				if _matches(recording, self.command, path, params):
+					return self.reply(recording["status"], recording["body"].encode("utf-8"))
+
+			if upstream is None:
+				return self.reply(404, b"no recorded response\n")
+
+			recording = _forward(upstream, self.command, path, params)
+			recordings.append(recording)
+			if record is not None:
+				with open(record, "a") as f:
+					f.write(json.dumps(recording, sort_keys=True) + "\n")
+			self.reply(recording["status"], recording["body"].encode("utf-8"))
+
+		do_GET = _answer
+		do_POST = _answer
+
+	return RecordedHandler
+
+def _forward(upstream, method, path, params):
+	import urllib.error
+	import urllib.parse
+	import urllib.request
+
+	url = upstream.rstrip("/") + path
+	data = None
+	if method == "GET":
+		url += "?" + urllib.parse.urlencode(params)
+	else:
+		data = urllib.parse.urlencode(params).encode("utf-8")
+
+	try:
+		with urllib.request.urlopen(urllib.request.Request(url, data=data, method=method), timeout=60) as r:
+			status, body = r.status, r.read()
+	except urllib.error.HTTPError as err:
+		status, body = err.code, err.read()
+	return {"method": method, "path": path, "params": params, "status": status, "body": body.decode("utf-8")}
+
+def recorded(recordings, port=0, fail=0, upstream=None, record=None):
+	return StandIn(recorded_handler(recordings, upstream=upstream, record=record), port=port, fail=fail)
@@ -0,0 +1,63 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2015 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Pixel and aperture geometry. Apertures are shapely polygons in pixel
+# co-ordinates, where pixel (x, y) covers the unit box [x, x+1] x [y, y+1].
+# shapely is only imported once a polygon actually needs to be built.
+
+import numpy
+
+def positions(ndarray):
+	return zip(*numpy.where(numpy.ones_like(ndarray)))
+
+# XXX: I don't like the fact that we pregenerate the dithered pixels and then
+#      pass them to smoother. Surely there's a nicer method.
+
+# Generates a grid of (dithered) pixel boxes of the given $shape, which can be
+# intersected with an aperture using smoother.
+def pixels(shape, dither):
+	import shapely.geometry
+
+	pxs = numpy.empty(shape, dtype=object)
+
+	for x, y in positions(pxs):
+		pxs[x, y] = shapely.geometry.box(x - dither, y - dither, x + dither, y + dither)
+
+	return pxs
+
+# Weights each pixel in $pxs by the area of its intersection with $aperture.
+def smoother(aperture, pxs):
+	smooth = numpy.zeros_like(pxs, dtype=float)
+
+	for x, y in positions(smooth):
+		smooth[x, y] = pxs[x, y].intersection(aperture).area
+
+	return smooth
+
+# Unions the unit pixel boxes at each of the given (xs, ys) into one polygon.
+def pixel_union(xs, ys):
+	import shapely.ops
+	import shapely.geometry
+
+	polys = [shapely.geometry.box(x, y, x + 1, y + 1) for x, y in zip(xs, ys)]
+	return shapely.ops.unary_union(polys)
+
+# The region of a postage stamp that is never NaN (i.e. the pixels which were
+# actually downloaded from the spacecraft).
+def postage_stamp(flux):
+	ignore = ~numpy.any(numpy.isnan(flux), axis=0)
+	return pixel_union(*numpy.where(ignore))
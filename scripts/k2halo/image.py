@@ -0,0 +1,108 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2015 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+
+from k2halo import io
+
+# Takes a Kepler/K2 target pixel file (as an HDUList) and returns the frames
+# which are actually usable for photometry. Times are converted to absolute
+# BJD, frames without tracking data (if $track is given) or with a non-zero
+# quality flag are dropped, and the result is sliced by [$start:$end].
+#
+# If $fill_nan is set, NaN pixels are replaced with the minimum of their
+# frame. Callers which need to know where the stamp edges are (postage_stamp,
+# for instance) should disable this.
+#
+# $track should be in the form returned by k2halo.io.read_track, and the
+# returned track is made relative to the position in frame $frame.
+def filter_img(img, track=None, frame=0, start=None, end=None, fill_nan=True):
+	flxs = io.tpf_column(img, "FLUX")
+	time = io.tpf_column(img, "TIME")
+	qual = io.tpf_column(img, "QUALITY")
+	cadn = io.tpf_column(img, "CADENCENO")
+	trac = None
+
+	# We need to fix up the times so they are in *absolute* BJD.
+	time += img[1].header["BJDREFI"] + img[1].header["BJDREFF"]
+
+	# Remove frames not in our track data.
+	if track is not None:
+		filt = numpy.isin(cadn, [tr["cadence"] for tr in track])
+
+		flxs = flxs[filt]
+		time = time[filt]
+		qual = qual[filt]
+		cadn = cadn[filt]
+
+		# Fix up track.
+		trac = numpy.array(track)[numpy.isin([tr["cadence"] for tr in track], cadn)]
+		del track
+
+	# Remove bad quality frames.
+	filt = (qual == 0)
+	flxs = flxs[filt]
+	time = time[filt]
+	cadn = cadn[filt]
+	if trac is not None:
+		trac = trac[filt]
+
+	# Deal with NaNs.
+	if fill_nan:
+		flxs = fill_nan_frames(flxs)
+
+	if trac is not None:
+		# We set the first track as being at the given one, because then
+		# the users can deal with specifiying their track point at a time t.
+		trac = numpy.array([(tr["x"], tr["y"]) for tr in trac], dtype=float)
+		trac[:, 0] -= trac[frame, 0]
+		trac[:, 1] -= trac[frame, 1]
+
+	flxs = flxs[start:end]
+	time = time[start:end]
+	cadn = cadn[start:end]
+	if trac is not None:
+		trac = trac[start:end]
+
+	return {
+		"FLUX": flxs,
+		"TIME": time,
+		"CADENCENO": cadn,
+		"TRACK": trac,
+	}
+
+# Replaces every NaN pixel with the minimum (non-NaN) value of its frame. This
+# is done for the whole cube at once, rather than frame-by-frame.
+def fill_nan_frames(flxs):
+	nans = numpy.isnan(flxs)
+	if not nans.any():
+		return flxs
+
+	axes = tuple(range(1, flxs.ndim))
+	mins = numpy.nanmin(flxs, axis=axes, keepdims=True)
+	return numpy.where(nans, mins, flxs)
+
+# The structural similarity (SSIM) of images $a and $b, passing $kwargs on to
+# scikit-image. compare_ssim was renamed to structural_similarity (and later
+# removed), and the old one assumed float images were in [-1, 1], so that is
+# the default $data_range.
+def ssim(a, b, data_range=2, **kwargs):
+	try:
+		from skimage.metrics import structural_similarity
+	except ImportError:
+		from skimage.measure import compare_ssim as structural_similarity
+	return structural_similarity(a, b, data_range=data_range, **kwargs)
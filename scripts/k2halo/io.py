@@ -0,0 +1,216 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2015 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import csv
+import itertools
+
+import numpy
+
+def csv_column_read(f, fieldnames, casts=None, start=None, end=None, reset=False):
+	if casts is None or len(fieldnames) != len(casts):
+		casts = [object] * len(fieldnames)
+
+	def parse_row(row):
+		row = {k: v for k, v in row.items() if k in fieldnames}
+		return [row[key] for key in sorted(row.keys(), key=lambda k: fieldnames.index(k))]
+
+	def safe_cast(cast, *args, **kwargs):
+		try:
+			return cast(*args, **kwargs)
+		except:
+			return None
+
+	if reset:
+		pos = f.tell()
+
+	reader = csv.DictReader(f)
+	rows = [[safe_cast(cast, field) for cast, field in zip(casts, fields)] for fields in (parse_row(row) for row in reader)]
+
+	if reset:
+		f.seek(pos)
+
+	return [numpy.array(col[start:end], dtype=cast) for cast, col in zip(casts, zip(*rows))]
+
+# Like csv_column_read, but yields the columns $size rows at a time so that
+# large files can be processed in bounded memory. $start and $end are row
+# indices as for csv_column_read, but can't be negative.
+def csv_column_chunks(f, fieldnames, casts=None, size=10000, start=None, end=None):
+	import itertools
+
+	if casts is None or len(fieldnames) != len(casts):
+		casts = [object] * len(fieldnames)
+	if (start or 0) < 0 or (end or 0) < 0:
+		raise ValueError("csv_column_chunks does not support negative row indices")
+
+	def safe_cast(cast, value):
+		try:
+			return cast(value)
+		except:
+			return None
+
+	reader = csv.DictReader(f)
+	rows = itertools.islice(reader, start, end)
+	while True:
+		chunk = [[safe_cast(cast, row[key]) for key, cast in zip(fieldnames, casts)] for row in itertools.islice(rows, size)]
+		if not chunk:
+			break
+		yield [numpy.array(col, dtype=cast) for cast, col in zip(casts, zip(*chunk))]
+
+def csv_column_write(f, cols, fieldnames):
+	writer = csv.DictWriter(f, fieldnames=fieldnames)
+	writer.writeheader()
+
+	for fields in zip(*cols):
+		writer.writerow({fieldnames[i]: field for i, field in enumerate(fields)})
+
+# Converts a column of CSV strings to floats. Values which aren't numbers
+# (such as empty cells) become NaN.
+def _float_column(col):
+	try:
+		return numpy.array(col, dtype=float)
+	except ValueError:
+		pass
+
+	def safe_float(value):
+		try:
+			return float(value)
+		except ValueError:
+			return numpy.nan
+	return numpy.array([safe_float(value) for value in col], dtype=float)
+
+# Applies vectorised $transforms to the columns of the CSV file $inf, writing
+# the result to $outf $size rows at a time (so files of any size can be
+# converted in bounded memory). $transforms maps output column names to
+# (inputs, fn) pairs, where fn is called with the $inputs columns as float
+# arrays and returns the new column. $keep is the list of input columns to
+# pass through (default: all of them), which are copied as-is without being
+# parsed. An output column with the same name as a kept column replaces it in
+# place, otherwise it's added at the end. Rows end with $lineterminator.
+def csv_transform(inf, outf, transforms, keep=None, size=100000, lineterminator="\r\n"):
+	reader = csv.reader(inf)
+	header = next(reader, None)
+	if header is None:
+		raise ValueError("empty CSV file")
+
+	if keep is None:
+		keep = header
+
+	needed = list(keep) + [name for inputs, _ in transforms.values() for name in inputs]
+	for name in needed:
+		if name not in header:
+			raise ValueError("no '%s' column in CSV" % (name,))
+	fieldnames = list(keep) + [name for name in transforms if name not in keep]
+
+	writer = csv.writer(outf, lineterminator=lineterminator)
+	writer.writerow(fieldnames)
+
+	index = {name: i for i, name in enumerate(header)}
+	while True:
+		rows = list(itertools.islice(reader, size))
+		if not rows:
+			break
+
+		def column(name):
+			i = index[name]
+			return [row[i] for row in rows]
+
+		parsed = {}
+		out = []
+		for name in fieldnames:
+			if name not in transforms:
+				out.append(column(name))
+				continue
+
+			inputs, fn = transforms[name]
+			for key in inputs:
+				if key not in parsed:
+					parsed[key] = _float_column(column(key))
+
+			# Python's float repr is the shortest string that round-trips,
+			# and is much faster than formatting numpy scalars.
+			values = numpy.asarray(fn(*[parsed[key] for key in inputs]), dtype=float)
+			out.append(list(map(repr, values.tolist())))
+
+		writer.writerows(zip(*out))
+
+# Tracking data (as produced by trackframe.py) is a CSV file of the form
+# (cadence, x, y), where the first row is not a frame but rather specifies the
+# polarity of each axis. The result is in the form expected by filter_img.
+def read_track(f):
+	def parse_row(cadence, x, y):
+		return (int(cadence), float(x), float(y))
+
+	rows = csv.DictReader(f)
+
+	# First row specifies the polarity.
+	row = next(rows)
+	mx, my = float(row["x"]), float(row["y"])
+
+	return numpy.array([{"cadence": cadence, "x": x*mx, "y": y*my} for (cadence, x, y) in (parse_row(**row) for row in rows)])
+
+# Gzipped FITS files (as left by downloaddata.py --no-decompress) are
+# decompressed by astropy as they're read, so if $path doesn't exist but
+# $path.gz does, we just use that. Anything which needs the actual file (like
+# cache.input_key) should go through this so it agrees with open_fits.
+def resolve_fits(path):
+	if not os.path.exists(path) and os.path.exists(path + ".gz"):
+		path += ".gz"
+	return path
+
+# Opens a FITS file (see resolve_fits).
+def open_fits(path, **kwargs):
+	import astropy.io.fits
+
+	return astropy.io.fits.open(resolve_fits(path), **kwargs)
+
+# Target pixel files keep their frames as columns of the table in HDU 1. A
+# repacked target pixel file (see repack_tpf) has the same table, but with
+# the image columns moved into their own tile-compressed image HDUs. This
+# returns column $name of either kind of file.
+def tpf_column(img, name):
+	if img[1].header.get(REPACKED_KEY) and name not in img[1].columns.names:
+		return img[name].data
+	return img[1].data[name]
+
+REPACKED_KEY = "K2HREPAK"
+
+# Rewrites the target pixel file $img to $path, moving every image column
+# (FLUX, FLUX_ERR, RAW_CNTS and so on) into a CompImageHDU with one tile per
+# frame. The compression is lossless (GZIP_2 with no quantisation, which
+# deals with the NaNs around the edges of the stamp), and single frames can
+# still be read without decompressing the whole cube through the HDU's
+# section attribute. Needs astropy 5.3 or later.
+def repack_tpf(img, path, compression_type="GZIP_2", overwrite=False):
+	import astropy.io.fits
+
+	table = img[1]
+	images = [col for col in table.columns if len(table.data[col.name].shape) > 1]
+	others = [col for col in table.columns if len(table.data[col.name].shape) <= 1]
+
+	header = table.header.copy()
+	header[REPACKED_KEY] = (True, "image columns moved to CompImageHDUs")
+	hdus = [img[0].copy(), astropy.io.fits.BinTableHDU.from_columns(others, header=header, name=table.name)]
+
+	for col in images:
+		data = numpy.asarray(table.data[col.name])
+		tile_shape = (1,) + data.shape[1:]
+		hdus.append(astropy.io.fits.CompImageHDU(data, name=col.name, compression_type=compression_type, tile_shape=tile_shape, quantize_level=0.0))
+
+	# Anything after the table (the aperture mask, for one) is kept as-is.
+	hdus.extend(hdu.copy() for hdu in img[2:])
+	astropy.io.fits.HDUList(hdus).writeto(path, overwrite=overwrite)
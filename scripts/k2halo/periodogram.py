@@ -0,0 +1,217 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2015 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import warnings
+
+import numpy
+
+# This generates a Lomb-Scargle periodogram in units of ppm and Hz (meaning that
+# a signal of the form A * sin(2πf * t) will produce a peak at f with an amplitude
+# of A).
+#
+# $times should be in units of days, $fluxs should be in units of ppm residuals,
+# $delta should be either None or in units of µHz. The result will be a power
+# spectrum in units (ppm)² per µHz. If $delta is unspecified, it will be set to
+# the logically optimum Fourier sampling of (1/T) (where T is the range of $times).
+# $upper should be in µHz, and a warning will be emitted if it is lower than the
+# optimistic nyquist frequency (1 / (2 * median(∆t))).
+#
+# The returned value is a ndarray of form [frequency, spectrum] with frequencies
+# in the range (0, nyquist] with spacing of $delta. Frequencies are in Hz.
+def lombscargle_amplitude(times, fluxs, mult=1, upper=None):
+	# Sanity checking.
+	assert(fluxs.shape[0] == times.shape[0])
+
+	# Make copies so we don't accidentally modify things outside.
+	times = times.copy()
+	fluxs = fluxs.copy()
+
+	# First we need to deal with unit conversions. While we expose "logical"
+	# astrophysics units, we internally need to be using µHz everywhere.
+	times *= 24 * 60 * 60
+
+	# Compute some of the parameters required for the Lomb-Scargle periodogram.
+	N = fluxs.shape[0]
+	T = numpy.ptp(times)
+
+	delta = 1 / (mult * T)
+
+	# Check against nyquist and use it as the default upper frequency.
+	nyquist = N / (2 * numpy.median(numpy.diff(times)))
+	if upper is None:
+		upper = nyquist
+	else:
+		upper /= 1e6
+
+	if upper < nyquist:
+		warnings.warn("Given upper frequency (%f) for Lomb-Scargle periodogram is lower than the optimistic Nyquist frequency (%f). You may lose spectral data as a result." % (upper, nyquist))
+
+	samples = math.ceil(upper / delta)
+
+	import scipy.signal
+
+	# Calculate a raw power spectrum. Scipy gives us an "unnormalized" power
+	# spectrum, but the form of the output is known to be (A**2) * N/4, if N is
+	# "large enough". It's also important to note that the $freqs parameter
+	# needs to be in angular frequencies.
+	freqs = numpy.linspace(delta, upper, samples)
+	raw = scipy.signal.lombscargle(times, fluxs, 2 * math.pi * freqs)
+	raw = numpy.sqrt(raw * (4 / N))
+
+	return numpy.array([freqs * 1e6, raw])
+
+# Proper calibration of Fourier transforms is **vital** in order to make results
+# by different research groups work. This is a free software implementation of
+# the calibration specified by the Kepler Asteroseismic Science Consortium (KASC)
+# [wg1_wgmail02: appendix B]. This produces a calibrated power spectral density
+# (PSD).
+#
+# $times should be in units of days, $fluxs should be in units of ppm residuals,
+# $delta should be either None or in units of µHz. The result will be a power
+# spectrum in units (ppm)² per µHz. If $delta is unspecified, it will be set to
+# the logically optimum Fourier sampling of (1/T) (where T is the range of $times).
+#
+# The returned value is a ndarray of form [frequency, spectrum] with frequencies
+# in the range (0, nyquist] with spacing of $delta. The spectrum will be scaled
+# according to the specified standard [wg1_wgmail02: appendix B]. Frequencies are
+# in Hz.
+
+# Converts a raw (amplitude) periodogram to a calibrated PSD according to the
+# description in [wg1_wgmail02: appendix B].
+def raw_to_psd(freqs, raw, variance):
+	# Amplitude -> Power
+	raw = raw ** 2
+
+	# Scale power spectrum.
+	# ppm^2 * (ppm^2 / ppm^2) / µHz
+	scaled = raw * variance / (raw.sum() * numpy.diff(freqs).mean())
+	return numpy.array([freqs, scaled])
+
+BIN_STATISTICS = {"sum", "mean", "max"}
+
+# Bins a spectrum into $nbins fixed-width bins of the form [i*width, (i+1)*width)
+# (so the bins are anchored at zero, not at freqs.min()). $statistic is one of
+# BIN_STATISTICS and selects how the values within a bin are combined. Samples
+# which fall outside of all of the bins are ignored, and empty bins are 0.
+def bin_spectrum(freqs, spectrum, width, nbins, statistic="sum"):
+	if statistic not in BIN_STATISTICS:
+		raise ValueError("unknown bin statistic: %s" % (statistic,))
+
+	freqs = numpy.asarray(freqs)
+	spectrum = numpy.asarray(spectrum, dtype=float)
+
+	# Find the bin for each sample. We compare against the edges directly rather
+	# than using floor(freqs / width) so that samples sitting on an edge end up in
+	# the same bin as they would with an explicit (lo <= f < hi) comparison.
+	edges = numpy.arange(nbins + 1) * width
+	idx = numpy.searchsorted(edges, freqs, side="right") - 1
+	valid = (idx >= 0) & (idx < nbins)
+	idx = idx[valid]
+	values = spectrum[valid]
+
+	if statistic == "max":
+		out = numpy.zeros(nbins)
+		if not idx.size:
+			return out
+		order = numpy.argsort(idx, kind="stable")
+		idx = idx[order]
+		starts = numpy.flatnonzero(numpy.r_[True, idx[1:] != idx[:-1]])
+		out[idx[starts]] = numpy.maximum.reduceat(values[order], starts)
+		return out
+
+	out = numpy.bincount(idx, weights=values, minlength=nbins)
+	if statistic == "mean":
+		counts = numpy.bincount(idx, minlength=nbins)
+		out = numpy.divide(out, counts, out=numpy.zeros(nbins), where=counts > 0)
+	return out
+
+SPECTRUM_METHODS = {"fft", "lombscargle"}
+
+# Evaluates an (unnormalised, in the same sense as scipy.signal.lombscargle)
+# Lomb-Scargle periodogram of every column of $ys at the angular frequencies
+# $omegas. The time offset tau only depends on $times, so it is shared by every
+# column and the sums over time become a matrix product.
+def _lombscargle_columns(times, ys, omegas):
+	arg = numpy.outer(omegas, times)
+	tau = numpy.arctan2(numpy.sin(2 * arg).sum(axis=1), numpy.cos(2 * arg).sum(axis=1)) / 2
+	arg -= tau[:, None]
+
+	cos, sin = numpy.cos(arg), numpy.sin(arg)
+	ycos, ysin = cos @ ys, sin @ ys
+	return (ycos ** 2 / (cos ** 2).sum(axis=1)[:, None] + ysin ** 2 / (sin ** 2).sum(axis=1)[:, None]) / 2
+
+# Computes the amplitude spectrum of every pixel in a (time, y, x) cube of
+# $flxs in one go. Pixels which are NaN in any frame (the edges of the postage
+# stamp) are masked out, and are NaN in the returned cube. Each pixel has its
+# mean removed, and amplitudes are in the units of $flxs in the same sense as
+# lombscargle_amplitude (A * sin(2πf * t) gives a peak of A at f).
+#
+# $method is one of SPECTRUM_METHODS. "fft" is a single real FFT along the time
+# axis, which treats the frames as evenly spaced (so any gaps are just closed
+# up). "lombscargle" uses the actual $times (in days), which is what you want
+# for gapped data, on a grid with a spacing of 1/($mult * T). $upper (in µHz)
+# limits both, and defaults to the Nyquist frequency of the median cadence --
+# unlike lombscargle_amplitude's "optimistic" Nyquist, which for a whole cube
+# would be far too many frequencies to keep around. $block limits the number of
+# (frequency, time) elements evaluated at once by the Lomb-Scargle periodogram.
+#
+# Returns (frequencies in µHz, a (frequency, y, x) cube of amplitudes, and the
+# (y, x) mask of pixels which have a spectrum).
+def pixel_spectra(times, flxs, method="fft", mult=1, upper=None, block=2**22):
+	if method not in SPECTRUM_METHODS:
+		raise ValueError("unknown spectrum method: %s" % (method,))
+
+	times = numpy.asarray(times, dtype=float)
+	flxs = numpy.asarray(flxs)
+
+	# Frames without a time can't be placed in either spectrum.
+	valid = ~numpy.isnan(times)
+	times = (times[valid] - times[valid].min()) * 24 * 60 * 60
+	flxs = flxs[valid]
+
+	# Pick out the unmasked pixels as (time, pixel) columns before converting
+	# them, so the masked pixels are never copied.
+	nt, ny, nx = flxs.shape
+	flxs = flxs.reshape(nt, -1)
+	mask = ~numpy.any(numpy.isnan(flxs), axis=0)
+	pixels = numpy.flatnonzero(mask)
+	ys = flxs.take(pixels, axis=1).astype(float)
+	ys -= ys.mean(axis=0)
+
+	cadence = numpy.median(numpy.diff(times))
+	if method == "fft":
+		# Skip the DC term, which is zero since we removed the mean.
+		freqs = numpy.fft.rfftfreq(nt, cadence)[1:] * 1e6
+		if upper is not None:
+			freqs = freqs[freqs <= upper]
+		amps = numpy.abs(numpy.fft.rfft(ys, axis=0)[1:freqs.size+1]) * (2 / nt)
+	else:
+		if upper is None:
+			upper = 1e6 / (2 * cadence)
+		delta = 1e6 / (mult * numpy.ptp(times))
+		freqs = numpy.linspace(delta, upper, math.ceil(upper / delta))
+
+		amps = numpy.empty((freqs.size, ys.shape[1]))
+		step = max(1, block // nt)
+		for lo in range(0, freqs.size, step):
+			omegas = 2 * math.pi * freqs[lo:lo+step] / 1e6
+			amps[lo:lo+step] = numpy.sqrt(_lombscargle_columns(times, ys, omegas) * (4 / nt))
+
+	cube = numpy.full((freqs.size, ny * nx), numpy.nan)
+	cube[:, pixels] = amps
+	return freqs, cube.reshape(freqs.size, ny, nx), mask.reshape(ny, nx)
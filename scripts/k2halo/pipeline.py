@@ -0,0 +1,273 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Runs a chain of post-processing stages (the same operations as highpass.py,
+# outliers.py, ppm.py and friends) in a single process, passing the columns
+# between stages as numpy arrays rather than re-reading CSV files in a new
+# interpreter for each stage.
+#
+# The data passed between stages is a dict of columns, either a time series
+# ("cadence", "t", "flux") or a periodogram ("frequency", "amplitude"/"psd").
+# Stages can also attach scalars (dofft records the "variance" of the series
+# it transformed, which raw2psd uses unless given one explicitly).
+#
+# A pipeline is a list of (stage, params) pairs, which can be parsed from
+# "stage:key=value,key=value" strings (see parse_stage) or loaded from a
+# JSON/YAML description (see load_spec). Parameter names are the same as the
+# argparse dests of the equivalent script.
+
+import os
+import csv
+import json
+import collections
+
+import numpy
+
+from k2halo import io
+from k2halo import cache
+from k2halo import timeseries
+from k2halo import periodogram
+
+REQUIRED = object()
+
+# Maps stage names to (function, {param: (type, default)}).
+STAGES = collections.OrderedDict()
+
+def boolean(value):
+	if isinstance(value, str):
+		if value.lower() in {"1", "y", "yes", "true", "on"}:
+			return True
+		if value.lower() in {"0", "n", "no", "false", "off"}:
+			return False
+		raise ValueError("invalid boolean '%s'" % (value,))
+	return bool(value)
+
+def stage(name, **params):
+	def register(fn):
+		STAGES[name] = (fn, params)
+		return fn
+	return register
+
+def columns(data):
+	return {key: value for key, value in data.items() if numpy.ndim(value) == 1}
+
+@stage("slice", start=(int, None), end=(int, None))
+def _slice(data, start, end):
+	data = dict(data)
+	data.update({key: col[start:end] for key, col in columns(data).items()})
+	return data
+
+@stage("highpass", size=(int, 101), order=(int, 3), residual=(boolean, False), gap=(float, None), method=(str, "savgol"), cadence=(float, None))
+def _highpass(data, size, order, residual, gap, method, cadence):
+	data = dict(data)
+	data["t"], data["flux"] = timeseries.highpass(data["t"], data["flux"], size=size, order=order, residual=residual, gap=gap, method=method, cadence=cadence)
+	return data
+
+@stage("outliers", sigma=(float, 4), passes=(int, 3), method=(str, "mean"))
+def _outliers(data, sigma, passes, method):
+	filt = timeseries.reject_outliers(data["t"], data["flux"], sigma=sigma, passes=passes, method=method)
+
+	data = dict(data)
+	data.update({key: col[filt] for key, col in columns(data).items()})
+	return data
+
+@stage("decorrelate", tp=(str, "linear"))
+def _decorrelate(data, tp):
+	data = dict(data)
+	data["flux"], _ = timeseries.decorrelate(tp, data["t"], data["flux"])
+	return data
+
+@stage("ppm")
+def _ppm(data):
+	data = dict(data)
+	data["flux"] = timeseries.to_ppm(data["flux"])
+	return data
+
+@stage("dropgaps", width=(float, REQUIRED))
+def _dropgaps(data, width):
+	data = dict(data)
+	data["t"] = timeseries.drop_gaps(data["t"], width)
+	return data
+
+@stage("dofft", mult=(float, 1), upper=(float, None))
+def _dofft(data, mult, upper):
+	times, fluxs = data["t"], data["flux"]
+
+	fx, fy = periodogram.lombscargle_amplitude(times, fluxs / fluxs.mean(), mult=mult, upper=upper)
+	return collections.OrderedDict([
+		("frequency", fx),
+		("amplitude", fy),
+		("variance", numpy.array(fluxs.var())),
+	])
+
+@stage("raw2psd", variance=(float, None))
+def _raw2psd(data, variance):
+	if variance is None:
+		if "variance" not in data:
+			raise ValueError("raw2psd needs a variance if it doesn't follow dofft")
+		variance = float(data["variance"])
+
+	fx, fy = periodogram.raw_to_psd(data["frequency"], data["amplitude"], variance)
+	return collections.OrderedDict([
+		("frequency", fx),
+		("psd", fy),
+	])
+
+# Fills in the defaults for (and casts) the given parameters of a stage.
+def resolve(name, params):
+	if name not in STAGES:
+		raise ValueError("unknown stage '%s' (known stages: %s)" % (name, ", ".join(STAGES)))
+	_, spec = STAGES[name]
+
+	unknown = set(params) - set(spec)
+	if unknown:
+		raise ValueError("unknown parameters for stage '%s': %s" % (name, ", ".join(sorted(unknown))))
+
+	resolved = {}
+	for key, (cast, default) in spec.items():
+		value = params.get(key, default)
+		if value is REQUIRED:
+			raise ValueError("stage '%s' requires parameter '%s'" % (name, key))
+		if value is not None:
+			value = cast(value)
+		resolved[key] = value
+	return name, resolved
+
+# Parses "stage" or "stage:key=value,key=value".
+def parse_stage(text):
+	name, _, args = text.partition(":")
+
+	params = {}
+	for arg in filter(None, args.split(",")):
+		key, sep, value = arg.partition("=")
+		if not sep:
+			raise ValueError("stage parameters must be key=value: '%s'" % (arg,))
+		params[key.strip()] = value.strip()
+
+	return resolve(name.strip(), params)
+
+# A pipeline description looks like this (in YAML, or the equivalent JSON):
+#
+#   input: pi+analysis.csv
+#   output: pi+psd.csv
+#   stages:
+#     - highpass: {size: 401, order: 6}
+#     - ppm
+#     - "outliers:sigma=4,passes=10"
+#     - dofft
+#     - raw2psd
+#
+# Returns a dict with "input", "output" (either of which may be None) and the
+# resolved "stages". Relative input and output paths are taken to be relative
+# to $base (usually the directory containing the description), so a
+# description works no matter where it's run from.
+def load_spec(f, base=None):
+	text = f.read()
+	try:
+		spec = json.loads(text)
+	except ValueError:
+		try:
+			import yaml
+		except ImportError:
+			raise ValueError("pipeline description is not JSON, and PyYAML is not installed to read it as YAML")
+		spec = yaml.safe_load(text)
+
+	stages = []
+	for entry in spec.get("stages", []):
+		if isinstance(entry, str):
+			stages.append(parse_stage(entry))
+		elif isinstance(entry, dict) and len(entry) == 1:
+			(name, params), = entry.items()
+			stages.append(resolve(name, params or {}))
+		else:
+			raise ValueError("invalid stage in pipeline description: %r" % (entry,))
+
+	def path(name):
+		value = spec.get(name)
+		if value is None or base is None:
+			return value
+		return os.path.join(base, value)
+
+	return {
+		"input": path("input"),
+		"output": path("output"),
+		"stages": stages,
+	}
+
+KNOWN_FIELDS = collections.OrderedDict([
+	("cadence", int),
+	("t", float),
+	("flux", float),
+	("frequency", float),
+	("amplitude", float),
+	("psd", float),
+])
+
+# Reads whichever of KNOWN_FIELDS are in the given CSV file.
+def read_columns(f):
+	pos = f.tell()
+	header = next(csv.reader(f), [])
+	f.seek(pos)
+
+	fields = [field for field in KNOWN_FIELDS if field in header]
+	cols = io.csv_column_read(f, fields, casts=[KNOWN_FIELDS[field] for field in fields])
+	return collections.OrderedDict(zip(fields, cols))
+
+def write_columns(f, data):
+	cols = columns(data)
+	io.csv_column_write(f, list(cols.values()), list(cols.keys()))
+
+# Runs $stages over $data. If $store (a cache.Cache) is given then the result
+# of each stage is cached, keyed on the digest of $key (which should identify
+# the input) and every stage up to and including it. Only the stages after the
+# last cached result are run, so re-running a pipeline with just the last
+# stage changed reads one result from the cache and runs one stage.
+#
+# $data may also be a function returning the input columns, in which case it
+# is only called if none of the stages are cached.
+def run(data, stages, store=None, key=None):
+	load = data if callable(data) else lambda: data
+
+	start = 0
+	if store is not None:
+		if key is None:
+			data = load()
+			load = lambda: data
+			key = cache.digest(*columns(data).values())
+
+		keys = []
+		for name, params in stages:
+			key = cache.digest(key, name, params)
+			keys.append(key)
+
+		# Find the last stage we already have a result for.
+		for idx in reversed(range(len(stages))):
+			cached = store.get(keys[idx])
+			if cached is not None:
+				load = lambda: cached
+				start = idx + 1
+				break
+
+	data = load()
+	for idx, (name, params) in enumerate(stages[start:], start):
+		fn, _ = STAGES[name]
+		data = fn(data, **params)
+
+		if store is not None:
+			store.put(keys[idx], data)
+
+	return data
@@ -0,0 +1,66 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2015 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+# The style used for all of the figures in the report.
+RCPARAMS = {
+	"backend": "ps",
+	"text.latex.preamble": r"\usepackage{gensymb}",
+	"axes.labelsize": 13, # fontsize for x and y labels (was 10)
+	"axes.titlesize": 13,
+	"font.size": 13, # was 10
+	"legend.fontsize": 13, # was 10
+	"xtick.labelsize": 13,
+	"ytick.labelsize": 13,
+	"font.family": "serif", # ???
+}
+
+# matplotlib is by far the slowest thing any of our scripts import (it pulls
+# in a GUI toolkit when using TkAgg), so plotting scripts should call this
+# once they actually need to plot -- after argument parsing -- rather than
+# importing matplotlib at the top of the file. Returns matplotlib.pyplot.
+def pyplot(backend=None, rcparams=None):
+	import matplotlib
+	if backend is not None:
+		matplotlib.use(backend)
+	if not os.getenv("DISPLAY"):
+		matplotlib.use("Agg") # Hack to fix no display.
+	import matplotlib.pyplot as plt
+
+	if rcparams is not None:
+		matplotlib.rcParams.update(rcparams)
+
+	return plt
+
+SPINE_COLOR = "black"
+
+def latexify(ax):
+	for spine in ["top", "right"]:
+		ax.spines[spine].set_visible(False)
+
+	for spine in ["left", "bottom"]:
+		ax.spines[spine].set_color(SPINE_COLOR)
+		ax.spines[spine].set_linewidth(0.5)
+
+	ax.xaxis.set_ticks_position("bottom")
+	ax.yaxis.set_ticks_position("left")
+
+	for axis in [ax.xaxis, ax.yaxis]:
+		axis.set_tick_params(direction="out", color=SPINE_COLOR)
+
+	return ax
@@ -0,0 +1,105 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The Kepler PRF archive is a tarball of one FITS file per CCD channel, named
+# kplr<module>.<output>_<date>_prf.fits, each holding five PRF images (one for
+# each corner of the channel and one for the centre) in HDUs 1-5. Parsing
+# those FITS files every time we fit a PRF is wasteful, so build_index
+# extracts every image into its own .npy file (which can be memory mapped) and
+# writes an index keyed by module and output, so a lookup is a dict access and
+# an mmap.
+
+import os
+import re
+import json
+import concurrent.futures
+
+import numpy
+
+from k2halo import io
+
+PRF_FILE_RE = re.compile(r"^kplr(\d+)\.(\d)_\d+_prf\.fits(\.gz)?$")
+PRF_KEYS = ["CRPIX1P", "CRPIX2P", "CRVAL1P", "CRVAL2P", "CDELT1P", "CDELT2P"]
+
+INDEX_JSON = "index.json"
+CACHE_DIR = "npy"
+
+def channel_key(module, output):
+	return "%d.%d" % (module, output)
+
+# Extracts the PRF images in $path into $cache, returning the index entry for
+# its channel. Run in a worker process by build_index.
+def _extract(path, cache):
+	name = os.path.basename(path)
+	module, output = (int(x) for x in PRF_FILE_RE.match(name).groups()[:2])
+
+	hdus = []
+	with io.open_fits(path) as prf:
+		for idx, hdu in enumerate(prf[1:], 1):
+			npy = "%s_%d.npy" % (channel_key(module, output), idx)
+			# FITS data is big-endian, so store it in native order.
+			data = hdu.data.astype(hdu.data.dtype.newbyteorder("="))
+			numpy.save(os.path.join(cache, npy), data)
+			hdus.append({"file": npy, "shape": list(hdu.data.shape), "header": {key: hdu.header.get(key) for key in PRF_KEYS}})
+
+	return channel_key(module, output), {"source": os.path.relpath(path, os.path.dirname(cache)), "hdus": hdus}
+
+# Finds every PRF file under $path (the directory the PRF tarball was
+# extracted into) and builds the .npy cache and index for them, using $jobs
+# processes.
+def build_index(path, jobs=None):
+	cache = os.path.join(path, CACHE_DIR)
+	os.makedirs(cache, exist_ok=True)
+
+	files = []
+	for root, _, names in os.walk(path):
+		files.extend(os.path.join(root, name) for name in names if PRF_FILE_RE.match(name))
+
+	index = {}
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+		for key, entry in pool.map(_extract, files, [cache] * len(files)):
+			index[key] = entry
+
+	tmp = os.path.join(path, INDEX_JSON + ".part")
+	with open(tmp, "w") as f:
+		json.dump(index, f, indent="\t", sort_keys=True)
+		f.write("\n")
+	os.replace(tmp, os.path.join(path, INDEX_JSON))
+	return index
+
+class PRFStore(object):
+	def __init__(self, path, jobs=None):
+		self.path = path
+		try:
+			with open(os.path.join(path, INDEX_JSON)) as f:
+				self.index = json.load(f)
+		except FileNotFoundError:
+			self.index = build_index(path, jobs=jobs)
+
+	# Returns the PRF image in HDU $hdu (1-4 are the corners, 5 the centre)
+	# for the given channel, memory mapped from the cache.
+	def lookup(self, module, output, hdu=5):
+		entry = self.index[channel_key(module, output)]["hdus"][hdu - 1]
+		return numpy.load(os.path.join(self.path, CACHE_DIR, entry["file"]), mmap_mode="r")
+
+	def header(self, module, output, hdu=5):
+		return self.index[channel_key(module, output)]["hdus"][hdu - 1]["header"]
+
+	# Looks up the PRF for the channel that the target pixel file $img was
+	# taken on.
+	def for_tpf(self, img, hdu=5):
+		return self.lookup(img[0].header["MODULE"], img[0].header["OUTPUT"], hdu=hdu)
@@ -0,0 +1,215 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Profiling hooks for the scripts, so that finding out why one target takes
+# ten times longer than another doesn't mean wrapping things in cProfile by
+# hand. Every script runs its __wrapped_main__ through main(), which takes
+# these options off the command line before the script's own parser sees them
+# (add_arguments only registers them with that parser, for --help):
+#
+#   --profile [cprofile]  -- cProfile statistics (load them with pstats or
+#                            snakeviz), as <script>_<epic>_<pid>.pstats.
+#   --profile=tracemalloc -- A tracemalloc snapshot of the allocations which
+#                            are still live at exit (load it with
+#                            tracemalloc.Snapshot.load), as .tracemalloc.
+#   --profile=sampling    -- Samples the stack every SAMPLE_INTERVAL seconds
+#                            of wall clock time, including time spent waiting
+#                            on I/O. The output is in the collapsed format
+#                            used by flamegraph.pl and speedscope, as
+#                            .collapsed.
+#   --profile-dir DIR     -- Where to write profiles (default: .). It is
+#                            created if needed, before the script runs.
+#
+# Profiles are labelled with the EPIC ID of the target (the first thing on the
+# command line which looks like one, such as a ktwo<epic>-... FITS file or a
+# phot_<epic>.csv) so that a campaign's worth of them can share a directory.
+
+import os
+import re
+import sys
+import contextlib
+import collections
+
+DEFAULT_PROFILER = "cprofile"
+SAMPLE_INTERVAL = 0.005
+
+# K2 EPIC IDs are nine digits, starting at 201000001.
+EPIC_PATTERN = re.compile(r"(?<!\d)(2\d{8})(?!\d)")
+
+def epic_label(argv):
+	for arg in argv:
+		match = EPIC_PATTERN.search(os.path.basename(arg))
+		if match is not None:
+			return match.group(1)
+	return None
+
+def profile_path(directory, script, argv, ext):
+	name = os.path.splitext(os.path.basename(script))[0]
+	label = epic_label(argv) or "run"
+	return os.path.join(directory, "%s_%s_%d%s" % (name, label, os.getpid(), ext))
+
+# Samples the stack of the thread which created it from a background thread,
+# counting how often each (collapsed) stack is seen. Only frames above $root
+# (a code object) are kept, so the profiling machinery itself doesn't show up
+# in every sample.
+class Sampler(object):
+	def __init__(self, interval=SAMPLE_INTERVAL, root=None):
+		import threading
+
+		self.interval = interval
+		self.root = root
+		self.counts = collections.Counter()
+		self._ident = threading.get_ident()
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, daemon=True)
+
+	def _run(self):
+		while not self._stop.wait(self.interval):
+			frame = sys._current_frames().get(self._ident)
+			stack = []
+			while frame is not None:
+				code = frame.f_code
+				stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+				if code is self.root:
+					break
+				frame = frame.f_back
+			if stack:
+				self.counts[";".join(reversed(stack))] += 1
+
+	def start(self):
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		self._thread.join()
+
+	def write(self, f):
+		for stack, count in sorted(self.counts.items()):
+			f.write("%s %d\n" % (stack, count))
+
+@contextlib.contextmanager
+def _cprofile(path, fn):
+	import cProfile
+
+	profiler = cProfile.Profile()
+	profiler.enable()
+	try:
+		yield
+	finally:
+		profiler.disable()
+		profiler.dump_stats(path)
+
+@contextlib.contextmanager
+def _tracemalloc(path, fn):
+	import tracemalloc
+
+	tracemalloc.start(25)
+	try:
+		yield
+	finally:
+		snapshot = tracemalloc.take_snapshot()
+		_, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		snapshot.dump(path)
+		sys.stderr.write("[profile] peak traced memory: %.1f MiB\n" % (peak / 2**20,))
+
+@contextlib.contextmanager
+def _sampling(path, fn):
+	sampler = Sampler(root=fn.__code__)
+	sampler.start()
+	try:
+		yield
+	finally:
+		sampler.stop()
+		with open(path, "w") as f:
+			sampler.write(f)
+
+# (file extension, context manager) for each profiler.
+PROFILERS = collections.OrderedDict([
+	("cprofile", (".pstats", _cprofile)),
+	("tracemalloc", (".tracemalloc", _tracemalloc)),
+	("sampling", (".collapsed", _sampling)),
+])
+
+# Removes the profiling options from $argv, returning (profiler, directory,
+# remaining arguments). profiler is None if --profile wasn't given. The
+# profiler can also be the argument after --profile, but only if it names one
+# (so "--profile ktwo...fits" leaves the file for the script). Anything after
+# "--" is left alone.
+def parse_args(argv):
+	profiler, directory = None, "."
+	rest = []
+
+	args = collections.deque(argv)
+	while args:
+		arg = args.popleft()
+		if arg == "--":
+			rest.append(arg)
+			rest.extend(args)
+			break
+
+		if arg == "--profile":
+			profiler = DEFAULT_PROFILER
+			if args and args[0] in PROFILERS:
+				profiler = args.popleft()
+		elif arg.startswith("--profile="):
+			profiler = arg.partition("=")[2]
+		elif arg == "--profile-dir":
+			if not args:
+				raise SystemExit("--profile-dir requires a directory")
+			directory = args.popleft()
+		elif arg.startswith("--profile-dir="):
+			directory = arg.partition("=")[2]
+		else:
+			rest.append(arg)
+			continue
+
+		if profiler is not None and profiler not in PROFILERS:
+			raise SystemExit("--profile must be one of %s (not %r)" % (", ".join(PROFILERS), profiler))
+	return profiler, directory, rest
+
+# Registers the options which main() handles with $parser, so that they show
+# up in the script's --help. main() has already removed them from the command
+# line by the time the parser runs, so they always have their defaults.
+def add_arguments(parser):
+	group = parser.add_argument_group("profiling options")
+	group.add_argument("--profile", dest="profile", nargs="?", const=DEFAULT_PROFILER, default=None, choices=list(PROFILERS), help="Profile the run with one of %s (default: %s). See k2halo.profiling." % (", ".join(PROFILERS), DEFAULT_PROFILER))
+	group.add_argument("--profile-dir", dest="profile_dir", default=".", help="Directory to write profiles to, created if needed (default: .).")
+
+# Runs $fn (a script's __wrapped_main__), under a profiler if one was asked
+# for on the command line.
+def main(fn):
+	profiler, directory, sys.argv[1:] = parse_args(sys.argv[1:])
+	if profiler is None:
+		return fn()
+
+	# Check the directory now rather than finding out it's unusable once the
+	# (possibly long) run is over.
+	try:
+		os.makedirs(directory, exist_ok=True)
+	except OSError as err:
+		raise SystemExit("--profile-dir: cannot create %s: %s" % (directory, err.strerror))
+	if not os.access(directory, os.W_OK | os.X_OK):
+		raise SystemExit("--profile-dir: %s is not writable" % (directory,))
+
+	ext, profile = PROFILERS[profiler]
+	path = profile_path(directory, sys.argv[0], sys.argv[1:], ext)
+	try:
+		with profile(path, fn):
+			return fn()
+	finally:
+		sys.stderr.write("[profile] %s profile written to %s\n" % (profiler, path))
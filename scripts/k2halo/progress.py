@@ -0,0 +1,211 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Progress reporting and timing for the long-running scripts. Anything which
+# loops over frames used to write a "." to stdout for each one, which doesn't
+# say how much is left and (for scripts like trackframe.py, which write their
+# results to stdout) ends up in the output. Instead, a Tracer writes a
+# frames/s and ETA line to stderr, times each stage of a script (wall clock
+# and CPU time, and optionally the peak RSS) and can append a summary of the
+# run to a JSON trace file. Each run is a single line in the trace, so every
+# target in a batch (see campaign.py --trace) can share one trace file, which
+# etc/tracestat.py then aggregates.
+
+import os
+import sys
+import json
+import time
+import contextlib
+
+# How often (in seconds) to update the progress line. When stderr isn't a
+# terminal each update is a new line, so logs only get one every so often.
+TTY_INTERVAL = 0.2
+LOG_INTERVAL = 10
+
+# Returns the peak resident set size of this process in bytes, or None if the
+# platform doesn't tell us.
+def peak_rss():
+	try:
+		import resource
+	except ImportError:
+		return None
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Linux reports kilobytes, macOS reports bytes.
+	if sys.platform != "darwin":
+		rss *= 1024
+	return rss
+
+def format_seconds(seconds):
+	minutes, seconds = divmod(int(round(seconds)), 60)
+	hours, minutes = divmod(minutes, 60)
+	if hours:
+		return "%d:%02d:%02d" % (hours, minutes, seconds)
+	return "%d:%02d" % (minutes, seconds)
+
+# Counts $total frames of a loop, reporting the rate and ETA to $stream (if
+# not None) at most once every TTY_INTERVAL or LOG_INTERVAL seconds.
+class Progress(object):
+	def __init__(self, name, total, stream=None, done=None):
+		self.name = name
+		self.total = total
+		self.stream = stream
+		self.count = 0
+		self.start = time.perf_counter()
+		self.last = self.start
+		self.tty = stream is not None and stream.isatty()
+		self._done = done
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def rate(self, now=None):
+		elapsed = (now or time.perf_counter()) - self.start
+		return self.count / elapsed if elapsed > 0 else 0.0
+
+	def update(self, n=1):
+		self.count += n
+		if self.stream is None:
+			return
+
+		now = time.perf_counter()
+		if now - self.last < (TTY_INTERVAL if self.tty else LOG_INTERVAL):
+			return
+		self.last = now
+		self._report(now)
+
+	def _report(self, now, final=False):
+		rate = self.rate(now)
+		line = "%s: %d/%d frames, %.1f frames/s" % (self.name, self.count, self.total, rate)
+		if final:
+			line += ", took %s" % (format_seconds(now - self.start),)
+		elif rate > 0:
+			line += ", ETA %s" % (format_seconds((self.total - self.count) / rate),)
+
+		if self.tty:
+			# Overwrite the previous update, clearing whatever was after it.
+			self.stream.write("\r%s\x1b[K%s" % (line, "\n" if final else ""))
+		else:
+			self.stream.write(line + "\n")
+		self.stream.flush()
+
+	def close(self):
+		now = time.perf_counter()
+		if self.stream is not None:
+			self._report(now, final=True)
+		if self._done is not None:
+			self._done(self.name, {"frames": self.count, "fps": self.rate(now)})
+			self._done = None
+
+# Times the stages of a run. If $path is given the run is appended to it as a
+# JSON trace when the tracer is closed (it's a context manager, so wrap the
+# whole of main with it). $rss also records the peak RSS after each stage,
+# and a $stream of None stops anything being written to stderr.
+class Tracer(object):
+	def __init__(self, path=None, rss=False, stream=sys.stderr, name=None):
+		self.path = path
+		self.rss = rss
+		self.stream = stream
+		self.name = name or os.path.basename(sys.argv[0])
+		self.stages = []
+		self.frames = {}
+		self.start = time.time()
+		self._wall = time.perf_counter()
+		self._cpu = time.process_time()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close(status="ok" if exc_type is None else "error: %s" % (exc_type.__name__,))
+
+	def _log(self, fmt, *args):
+		if self.stream is not None:
+			self.stream.write(fmt % args)
+			self.stream.flush()
+
+	@contextlib.contextmanager
+	def stage(self, name):
+		wall = time.perf_counter()
+		cpu = time.process_time()
+		try:
+			yield
+		finally:
+			record = {"name": name, "wall": time.perf_counter() - wall, "cpu": time.process_time() - cpu}
+			if self.rss:
+				record["peak_rss"] = peak_rss()
+			# Only the trace needs the records, and library callers with
+			# the NULL tracer can run stages any number of times.
+			if self.path is not None:
+				self.stages.append(record)
+			self._log("%s: %s took %.2fs (%.2fs CPU)\n", self.name, name, record["wall"], record["cpu"])
+
+	def _progress_done(self, name, record):
+		if self.path is not None:
+			self.frames[name] = record
+
+	def progress(self, name, total):
+		return Progress(name, total, stream=self.stream, done=self._progress_done)
+
+	def close(self, status="ok"):
+		wall = time.perf_counter() - self._wall
+		cpu = time.process_time() - self._cpu
+		rss = peak_rss() if self.rss else None
+
+		summary = "%s: %s in %.2fs (%.2fs CPU)" % (self.name, status, wall, cpu)
+		if rss is not None:
+			summary += ", peak RSS %.1f MiB" % (rss / 2**20,)
+		self._log("%s\n", summary)
+
+		if self.path is None:
+			return
+		trace = {
+			"script": self.name,
+			"argv": sys.argv[1:],
+			"status": status,
+			"start": self.start,
+			"wall": wall,
+			"cpu": cpu,
+			"stages": self.stages,
+			"frames": self.frames,
+		}
+		if rss is not None:
+			trace["peak_rss"] = rss
+
+		# Several runs (campaign.py workers) may share a trace, so each run
+		# goes in with a single O_APPEND write to stop lines interleaving.
+		line = (json.dumps(trace, sort_keys=True) + "\n").encode("utf-8")
+		fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+		try:
+			os.write(fd, line)
+		finally:
+			os.close(fd)
+
+# Doesn't report or record anything. This is the default for the functions
+# which take a tracer, so that they can be called from other code (like
+# etc/benchmark.py) without any noise.
+NULL = Tracer(stream=None)
+
+def add_arguments(parser):
+	parser.add_argument("--no-progress", dest="no_progress", action="store_true", default=False, help="Don't report progress and timings on stderr.")
+	parser.add_argument("--trace", dest="trace", type=str, default=None, help="Append a JSON trace of this run (stage timings, frames/s) to this file.")
+	parser.add_argument("--trace-rss", dest="trace_rss", action="store_true", default=False, help="Also record the peak RSS of each stage.")
+
+def from_config(config):
+	return Tracer(path=config.trace, rss=config.trace_rss, stream=None if config.no_progress else sys.stderr)
@@ -0,0 +1,129 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A client for the remote catalogues we query (MAST, SIMBAD). Those services
+# are slow and don't like being hammered, so requests go through one pooled
+# session, are spread over a few threads but limited to a fixed rate, are
+# retried with exponential backoff, and (since the catalogues barely change)
+# have their responses cached on disk keyed by the full request.
+
+import sys
+import time
+import threading
+import concurrent.futures
+
+from k2halo import cache
+
+# Statuses worth retrying: rate limiting and server-side trouble.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class RateLimiter(object):
+	def __init__(self, rate):
+		self.interval = 1.0 / rate if rate else 0
+		self.lock = threading.Lock()
+		self.next = 0
+
+	# Blocks until we're allowed to make another request.
+	def wait(self):
+		with self.lock:
+			now = time.monotonic()
+			delay = self.next - now
+			self.next = max(now, self.next) + self.interval
+		if delay > 0:
+			time.sleep(delay)
+
+class QueryClient(object):
+	def __init__(self, store=None, workers=4, rate=2, retries=5, backoff=1, timeout=60):
+		import requests
+		import requests.adapters
+
+		self.store = store
+		self.workers = workers
+		self.limiter = RateLimiter(rate)
+		self.retries = retries
+		self.backoff = backoff
+		self.timeout = timeout
+
+		self.session = requests.Session()
+		adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+		self.session.mount("http://", adapter)
+		self.session.mount("https://", adapter)
+
+	def _fetch(self, method, url, params, data):
+		import requests
+
+		for attempt in range(self.retries):
+			if attempt:
+				time.sleep(self.backoff * 2 ** (attempt - 1))
+
+			self.limiter.wait()
+			try:
+				r = self.session.request(method, url, params=params, data=data, timeout=self.timeout)
+			except (requests.ConnectionError, requests.Timeout) as err:
+				sys.stderr.write("# %s %s failed (%s), retrying\n" % (method, url, err))
+				continue
+
+			if r.status_code in RETRY_STATUSES:
+				sys.stderr.write("# %s %s returned %d, retrying\n" % (method, url, r.status_code))
+				continue
+			if r.status_code != requests.codes.ok:
+				raise RuntimeError("status code was not 200: %d" % (r.status_code,))
+			return r.content
+
+		raise RuntimeError("%s %s failed after %d attempts" % (method, url, self.retries))
+
+	# Makes the request (or reads the response from the cache) and returns
+	# the response body as text.
+	def request(self, method, url, params=None, data=None):
+		params = list(params.items()) if isinstance(params, dict) else params
+		data = list(data.items()) if isinstance(data, dict) else data
+
+		key = None
+		if self.store is not None:
+			key = cache.digest("query", method, url, params, data)
+			body = self.store.get_raw(key)
+			if body is not None:
+				return body.decode("utf-8")
+
+		body = self._fetch(method, url, params, data)
+		if self.store is not None:
+			self.store.put_raw(key, body)
+		return body.decode("utf-8")
+
+	def get(self, url, params=None):
+		return self.request("GET", url, params=params)
+
+	def post(self, url, data=None):
+		return self.request("POST", url, data=data)
+
+	# Like map(fn, items), but runs fn over the worker threads (the rate
+	# limit still applies across all of them). Results are in order.
+	def map(self, fn, items):
+		with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+			return list(pool.map(fn, items))
+
+# The query options shared by scripts which use a QueryClient. Use from_config
+# to get the configured client. The cache options come from
+# cache.add_arguments, which must also be added to the parser.
+def add_arguments(parser):
+	parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=4, help="Number of queries to run at once (default: 4).")
+	parser.add_argument("--rate", dest="rate", type=float, default=2, help="Maximum number of queries per second (default: 2).")
+	parser.add_argument("--retries", dest="retries", type=int, default=5, help="Number of times to try each query (default: 5).")
+	parser.add_argument("--backoff", dest="backoff", type=float, default=1, help="Seconds to wait before the first retry, doubling for each retry after it (default: 1).")
+
+def from_config(config):
+	return QueryClient(store=cache.from_config(config), workers=config.jobs, rate=config.rate, retries=config.retries, backoff=config.backoff)
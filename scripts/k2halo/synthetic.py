@@ -0,0 +1,313 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Synthetic K2 data for benchmarks and regression tests. A synthetic target is
+# a target pixel file of a single (saturated) star, whose brightness follows a
+# seeded ground-truth light curve and whose position follows a K2-like roll
+# jitter track, along with the matching xy.csv track and a WKT halo aperture.
+# This is enough to run every stage of the pipeline without downloading any
+# data, at sizes up to (and well beyond) a real campaign.
+#
+# Everything is generated from a numpy.random.Generator, so the same seed
+# always gives the same target. Frames are generated and written in chunks, so
+# even the largest sizes only need a bounded amount of memory.
+
+import os
+import re
+import csv
+import math
+import zlib
+import collections
+
+import numpy
+
+# The long cadence of Kepler/K2, in days.
+CADENCE = 0.0204338
+
+# BJD - TIME, as in the headers of real target pixel files.
+BJDREFI = 2454833
+BJDREFF = 0.0
+
+# K2 fires its thrusters to correct the roll drift roughly every six hours,
+# and frames taken during a firing are flagged with this QUALITY bit.
+THRUSTER_PERIOD = 0.25
+THRUSTER_FLAG = 1 << 20
+
+# The effective exposure time of a long cadence frame, in seconds, which sets
+# the photon noise of the (e-/s) fluxes.
+EXPOSURE = 1766.0
+
+# Pixels saturate at this many e-/s (in units of our made-up flux scale), and
+# the excess charge bleeds up and down the column.
+FULL_WELL = 10000.0
+
+# Stamp sizes, as (rows, cols, frames).
+SIZES = collections.OrderedDict([
+	("tiny", (10, 10, 1000)),
+	("small", (25, 25, 4000)),
+	("campaign", (50, 50, 3600)),
+	("large", (100, 100, 20000)),
+	("huge", (200, 200, 100000)),
+])
+
+# The files of each target in a corpus directory, as generated by generate().
+TARGET_FILES = collections.OrderedDict([
+	("fits", "tpf.fits"),
+	("track", "xy.csv"),
+	("aperture", "aperture.wkt"),
+	("truth", "truth.csv"),
+])
+
+# Returns the paths of the files of the target of size $size in $corpus.
+def target_files(corpus, size):
+	return {key: os.path.join(corpus, size, name) for key, name in TARGET_FILES.items()}
+
+# Returns the seed of the target of size $size in a corpus with the base seed
+# $seed, so that regenerating one size always gives the same target.
+def target_seed(size, seed=0):
+	return (seed + zlib.crc32(size.encode("utf-8"))) % (1 << 32)
+
+# Parses either the name of one of SIZES or a size of the form RxCxN, where N
+# may have a k or M suffix (10x10x1k).
+def parse_size(spec):
+	if spec in SIZES:
+		return SIZES[spec]
+
+	match = re.match(r"^(\d+)x(\d+)x(\d+)([kM]?)$", spec)
+	if match is None:
+		raise ValueError("invalid size '%s'" % (spec,))
+
+	rows, cols, frames, suffix = match.groups()
+	frames = int(frames) * {"": 1, "k": 1000, "M": 1000000}[suffix]
+	return int(rows), int(cols), frames
+
+# Returns the (relative) ground-truth light curve of the star at $times (in
+# days): a slow trend plus a handful of p-mode-like oscillations with
+# amplitudes of hundreds of ppm and frequencies of tens to hundreds of µHz.
+def light_curve(rng, times, modes=5):
+	freqs = rng.uniform(20, 250, modes) * 1e-6 * 86400
+	amps = rng.uniform(100, 1000, modes) * 1e-6
+	phases = rng.uniform(0, 2*math.pi, modes)
+	trend = rng.uniform(-2e-4, 2e-4)
+
+	span = max(times[-1] - times[0], CADENCE)
+	flux = 1 + trend * (times - times[0]) / span
+	for freq, amp, phase in zip(freqs, amps, phases):
+		flux += amp * numpy.sin(2*math.pi * freq * times + phase)
+	return flux
+
+# Returns the (row, col) offset of the star in each of $frames frames, which
+# drifts along a random roll direction and snaps back every THRUSTER_PERIOD
+# (a sawtooth of about half a pixel), with a slow drift over the campaign and
+# a little random jitter. Also returns which frames were taken during a
+# thruster firing.
+def roll_track(rng, times):
+	angle = rng.uniform(0, 2*math.pi)
+	amplitude = rng.uniform(0.3, 0.7)
+
+	phase = ((times - times[0]) / THRUSTER_PERIOD) % 1.0
+	roll = amplitude * (phase - 0.5)
+	drift = rng.uniform(-1, 1, 2)[:, numpy.newaxis] * (times - times[0]) / 80
+	jitter = rng.normal(0, 0.02, (2, len(times)))
+
+	offsets = numpy.array([math.sin(angle), math.cos(angle)])[:, numpy.newaxis] * roll + drift + jitter
+	firing = numpy.concatenate([[False], numpy.diff(phase) < 0])
+	return offsets.T, firing
+
+# Returns a mask of the pixels in a $rows x $cols stamp which were actually
+# downloaded. K2 stamps are unions of rectangles, so we cut a random staircase
+# out of each corner.
+def stamp_mask(rng, rows, cols):
+	mask = numpy.ones((rows, cols), dtype=bool)
+	rr, cc = numpy.mgrid[:rows, :cols]
+
+	for flip_r in (False, True):
+		for flip_c in (False, True):
+			r = rows - 1 - rr if flip_r else rr
+			c = cols - 1 - cc if flip_c else cc
+			cut = rng.integers(0, max(min(rows, cols) // 4, 1) + 1)
+			mask &= (r + c) >= cut
+	return mask
+
+# Bleeds the charge above FULL_WELL in $frames (of shape (n, rows, cols)) up
+# and down each column, half each way from the saturated run of pixels, by
+# filling the pixels next to the run up to FULL_WELL in turn. Charge is
+# conserved unless it would bleed off the end of the column.
+def bleed(frames):
+	excess = numpy.clip(frames - FULL_WELL, 0, None).sum(axis=1, keepdims=True)
+	saturated = frames >= FULL_WELL
+	frames = numpy.minimum(frames, FULL_WELL)
+
+	rows = frames.shape[1]
+	rr = numpy.arange(rows)[numpy.newaxis, :, numpy.newaxis]
+	top = numpy.argmax(saturated, axis=1)[:, numpy.newaxis, :]
+	bottom = rows - 1 - numpy.argmax(saturated[:, ::-1, :], axis=1)[:, numpy.newaxis, :]
+
+	def fill(capacity):
+		# Each pixel takes what's left after the pixels before it are full.
+		before = numpy.cumsum(capacity, axis=1) - capacity
+		return numpy.clip(excess / 2 - before, 0, capacity)
+
+	below = fill((FULL_WELL - frames) * (rr > bottom))
+	above = fill(((FULL_WELL - frames) * (rr < top))[:, ::-1, :])[:, ::-1, :]
+	return frames + above + below
+
+# Renders the frames of a star with total flux $flux (per frame) at $centres
+# (per frame (row, col)), with a Gaussian PSF of width $sigma, a flat
+# background and photon (Gaussian) noise. Pixels outside $mask are NaN.
+def render(rng, shape, centres, flux, mask, sigma=1.3, background=50.0):
+	rows, cols = shape
+	rr = numpy.arange(rows)[numpy.newaxis, :, numpy.newaxis] + 0.5
+	cc = numpy.arange(cols)[numpy.newaxis, numpy.newaxis, :] + 0.5
+
+	dr = rr - centres[:, 0, numpy.newaxis, numpy.newaxis]
+	dc = cc - centres[:, 1, numpy.newaxis, numpy.newaxis]
+	psf = numpy.exp(-(dr**2 + dc**2) / (2 * sigma**2)) / (2*math.pi * sigma**2)
+
+	frames = background + flux[:, numpy.newaxis, numpy.newaxis] * psf
+	frames += rng.normal(0, 1, frames.shape) * numpy.sqrt(frames / EXPOSURE)
+	frames = bleed(frames)
+
+	return numpy.where(mask, frames, numpy.nan).astype(numpy.float32)
+
+# Returns the halo aperture of a stamp: the (downloaded) pixels between
+# $inner and $outer pixels from $centre, as a polygon.
+def halo_aperture(mask, centre, inner=3, outer=None):
+	from k2halo import geometry
+
+	rows, cols = mask.shape
+	if outer is None:
+		outer = max(rows, cols)
+
+	rr, cc = numpy.mgrid[:rows, :cols] + 0.5
+	dist = numpy.hypot(rr - centre[0], cc - centre[1])
+	return geometry.pixel_union(*numpy.where(mask & (dist >= inner) & (dist <= outer)))
+
+# Writes a target pixel file to $path from the header $meta and the $chunks of
+# (times, cadences, qualities, frames) which make up its table, without ever
+# holding the whole cube. The table has the TIME, CADENCENO, QUALITY and FLUX
+# columns that filter_img reads, and the stamp mask is written to HDU 2 like
+# the aperture image of a real target pixel file.
+def write_tpf(path, meta, nframes, shape, chunks, mask):
+	import astropy.io.fits
+
+	rows, cols = shape
+	columns = [
+		astropy.io.fits.Column(name="TIME", format="D", unit="BJD - 2454833"),
+		astropy.io.fits.Column(name="CADENCENO", format="J"),
+		astropy.io.fits.Column(name="QUALITY", format="J"),
+		astropy.io.fits.Column(name="FLUX", format="%dE" % (rows * cols,), unit="e-/s", dim="(%d,%d)" % (cols, rows)),
+	]
+	dtype = numpy.dtype([("TIME", ">f8"), ("CADENCENO", ">i4"), ("QUALITY", ">i4"), ("FLUX", ">f4", (rows, cols))])
+
+	primary = astropy.io.fits.PrimaryHDU()
+	for key, value in meta.items():
+		primary.header[key] = value
+
+	table = astropy.io.fits.BinTableHDU.from_columns(columns, nrows=0, name="TARGETTABLES")
+	table.header["NAXIS2"] = nframes
+	table.header["BJDREFI"] = BJDREFI
+	table.header["BJDREFF"] = BJDREFF
+	assert(table.header["NAXIS1"] == dtype.itemsize)
+
+	primary.writeto(path, overwrite=True)
+	with open(path, "ab") as f:
+		f.write(table.header.tostring().encode("ascii"))
+
+		written = 0
+		for times, cadns, quals, frames in chunks:
+			data = numpy.empty(len(times), dtype=dtype)
+			data["TIME"] = times
+			data["CADENCENO"] = cadns
+			data["QUALITY"] = quals
+			data["FLUX"] = frames
+			f.write(data.tobytes())
+			written += len(times)
+		assert(written == nframes)
+
+		size = nframes * dtype.itemsize
+		f.write(b"\0" * (-size % 2880))
+
+	astropy.io.fits.append(path, mask.astype(numpy.int32), header=astropy.io.fits.Header([("EXTNAME", "APERTURE")]))
+
+# Generates a synthetic target of the given $shape ((rows, cols, frames)) into
+# $files, a dict with "fits", "track", "aperture" and "truth" paths. Returns a
+# dict describing the target (seed, star position, and so on). Frames are
+# rendered $chunk at a time.
+def generate(files, shape, seed, epic=200000000, campaign=0, start=2000.0, chunk=None):
+	from k2halo import io
+
+	rows, cols, nframes = shape
+	rng = numpy.random.default_rng(seed)
+	if chunk is None:
+		chunk = max(1, (1 << 22) // (rows * cols))
+
+	cadns = numpy.arange(nframes, dtype=numpy.int64) + 100000
+	times = start + numpy.arange(nframes) * CADENCE
+
+	truth = light_curve(rng, times)
+	offsets, firing = roll_track(rng, times)
+	mask = stamp_mask(rng, rows, cols)
+
+	quals = numpy.where(firing, THRUSTER_FLAG, 0)
+	centre = numpy.array([rows, cols]) / 2 + rng.uniform(-0.5, 0.5, 2)
+
+	# Bright enough to saturate the core and bleed a few pixels.
+	flux = FULL_WELL * 2*math.pi * 1.3**2 * rng.uniform(1.5, 3)
+
+	def chunks():
+		for lo in range(0, nframes, chunk):
+			hi = min(lo + chunk, nframes)
+			frames = render(rng, (rows, cols), centre + offsets[lo:hi], flux * truth[lo:hi], mask)
+			yield times[lo:hi], cadns[lo:hi], quals[lo:hi], frames
+
+	meta = {
+		"TELESCOP": "Kepler",
+		"MISSION": "K2",
+		"OBJECT": "EPIC %d" % (epic,),
+		"KEPLERID": epic,
+		"CAMPAIGN": campaign,
+		"MODULE": 13,
+		"OUTPUT": 1,
+		"SYNTHETC": (True, "generated by k2halo.synthetic"),
+		"SEED": seed,
+	}
+	write_tpf(files["fits"], meta, nframes, (rows, cols), chunks(), mask)
+
+	# The track is the offset of the frame from the star (the aperture is
+	# moved by minus the track), in the same form as trackframe.py output.
+	with open(files["track"], "w", newline="") as f:
+		writer = csv.writer(f)
+		writer.writerow(["cadence", "x", "y"])
+		writer.writerow(["", 1, 1])
+		writer.writerows(zip(cadns.tolist(), (-offsets[:, 0]).tolist(), (-offsets[:, 1]).tolist()))
+
+	with open(files["aperture"], "w") as f:
+		f.write(halo_aperture(mask, centre).wkt)
+
+	with open(files["truth"], "w", newline="") as f:
+		io.csv_column_write(f, [cadns, times + BJDREFI + BJDREFF, truth, quals], ["cadence", "t", "flux", "quality"])
+
+	return {
+		"seed": seed,
+		"shape": [rows, cols, nframes],
+		"epic": epic,
+		"centre": centre.tolist(),
+		"flux": flux,
+		"full_well": FULL_WELL,
+		"stamp_pixels": int(mask.sum()),
+	}
@@ -0,0 +1,366 @@
+#!/usr/bin/false
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2015 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Kernels for (cadence, t, flux) time series, shared by the scripts in
+# scripts/post and scripts/etc and by the pipeline runner. Times are in days
+# and none of these modify their arguments in place.
+
+import math
+
+import numpy
+
+HIGHPASS_METHODS = {"savgol", "poly"}
+
+# Splits $ts into contiguous segments wherever consecutive times are more than
+# $gap days apart, returning a list of (start, end) index pairs. If $gap is None
+# the whole series is a single segment.
+def segments(ts, gap=None):
+	if gap is None or len(ts) == 0:
+		return [(0, len(ts))]
+
+	breaks = numpy.flatnonzero(numpy.diff(ts) > gap) + 1
+	bounds = numpy.concatenate([[0], breaks, [len(ts)]])
+	return list(zip(bounds[:-1], bounds[1:]))
+
+# Smooths a single segment. "savgol" is a Savitzky-Golay filter of $size
+# cadences (which assumes a uniform cadence), while "poly" fits a polynomial
+# of $order to every point within $half days of each cadence (so it is correct
+# across small gaps and irregular sampling). On a uniform cadence the two are
+# the same filter, except within $size // 2 cadences of either end: savgol
+# evaluates a single polynomial fitted to the last full window, while poly
+# fits the (truncated) window around each cadence. Segments too short for the
+# filter are replaced by their mean.
+def _smooth(ts, ys, size, order, method, half):
+	if method == "savgol":
+		import scipy.signal
+
+		# Shrink the window to fit short segments.
+		size = min(size, len(ys) - (1 - len(ys) % 2))
+		if size <= order:
+			return numpy.full(len(ys), ys.mean())
+		return scipy.signal.savgol_filter(ys, size, order)
+
+	lo = numpy.searchsorted(ts, ts - half, side="left")
+	hi = numpy.searchsorted(ts, ts + half, side="right")
+	count = hi - lo
+	terms = order + 1
+
+	# Accumulate the power sums of each window (in coordinates local to the
+	# cadence and scaled by $half, to keep the normal equations conditioned).
+	# We loop over the offset within each window rather than over cadences, so
+	# the loop is only as long as the widest window, and cadences whose window
+	# is narrower than the offset just get zeros.
+	powers = numpy.zeros((2*terms - 1, len(ts)))
+	moments = numpy.zeros((terms, len(ts)))
+	for k in range(count.max()):
+		inside = lo + k < hi
+		idx = numpy.minimum(lo + k, len(ts) - 1)
+		xs = (ts[idx] - ts) / half * inside
+		vs = ys[idx]
+		term = inside.astype(float)
+		for m in range(2*terms - 1):
+			powers[m] += term
+			if m < terms:
+				moments[m] += term * vs
+			term = term * xs
+
+	# The fitted value at the cadence itself is the constant term.
+	smooth = moments[0] / powers[0]
+	full = count >= terms
+	if full.any():
+		exps = numpy.add.outer(numpy.arange(terms), numpy.arange(terms))
+		coeffs = numpy.linalg.solve(powers.T[full][:, exps], moments.T[full][..., numpy.newaxis])
+		smooth[full] = coeffs[:, 0, 0]
+	return smooth
+
+# The extra half cadence puts the window edges between cadences rather than on
+# them, where rounding would decide whether the outermost points are included.
+def _half_width(ts, size, cadence):
+	if cadence is None:
+		cadence = numpy.median(numpy.diff(ts)) if len(ts) > 1 else 1
+	return (size // 2 + 0.5) * cadence
+
+# Computes the low-frequency trend which highpass() removes, filtering each
+# segment (see segments()) separately so that nothing is smoothed across a
+# data gap. $cadence (in days) sets the window width of the "poly" method
+# ($size cadences), and defaults to the median spacing of $ts.
+def trend(ts, ys, size, order, gap=None, method="savgol", cadence=None):
+	if method not in HIGHPASS_METHODS:
+		raise ValueError("unknown highpass method: %s" % (method,))
+
+	half = _half_width(ts, size, cadence)
+	smooth = numpy.empty(len(ys))
+	for lo, hi in segments(ts, gap):
+		smooth[lo:hi] = _smooth(ts[lo:hi], ys[lo:hi], size, order, method, half)
+	return smooth
+
+def highpass(ts, ys, size, order, residual=False, gap=None, method="savgol", cadence=None):
+	# Smooth (by default using a Savgol filter).
+	smooth = trend(ts, ys, size, order, gap=gap, method=method, cadence=cadence)
+
+	# Subtract a smoothed version then add the mean to produce a realistic value.
+	ys = ys - (smooth - ys.mean())
+
+	# Convert to ppm.
+	if residual:
+		ys = (ys - ys.mean()) / ys.mean()
+		ys *= 1e6
+
+	return ts, ys
+
+# Streaming version of highpass() (without $residual) for series too large to
+# hold in memory. $chunks is an iterable of dicts of columns (which must have
+# "t" and "flux") in time order, and $mean is the mean flux of the whole series
+# (which needs a separate pass). Yields the same dicts with the corrected flux,
+# identical to highpass() on the concatenated series.
+#
+# This is overlap-save: each chunk is filtered together with enough of the
+# previous one to cover the filter window, and cadences are only yielded once
+# the window after them has been read (or their segment has ended). For the
+# "poly" method $cadence should be given, otherwise it's estimated from the
+# first chunk rather than the whole series.
+def highpass_chunks(chunks, size, order, mean, gap=None, method="savgol", cadence=None):
+	if method not in HIGHPASS_METHODS:
+		raise ValueError("unknown highpass method: %s" % (method,))
+
+	half = None
+	buf = None
+	done = 0
+
+	def emit(buf, smooth, lo, hi):
+		out = {key: col[lo:hi] for key, col in buf.items()}
+		out["flux"] = out["flux"] - (smooth[lo:hi] - mean)
+		return out
+
+	def settled(ts):
+		if method == "savgol":
+			return len(ts) - size // 2 if len(ts) >= size else 0
+		return numpy.searchsorted(ts, ts[-1] - half, side="left")
+
+	def context(ts, done):
+		if method == "savgol":
+			return max(0, done - size)
+		return numpy.searchsorted(ts, ts[min(done, len(ts) - 1)] - half, side="left")
+
+	for chunk in chunks:
+		if not len(chunk["t"]):
+			continue
+		if half is None:
+			half = _half_width(chunk["t"], size, cadence)
+
+		seen = 0
+		if buf is None:
+			buf = dict(chunk)
+		else:
+			seen = len(buf["t"])
+			buf = {key: numpy.concatenate([buf[key], chunk[key]]) for key in buf}
+
+		# Any segment which ended within this chunk can be flushed completely.
+		base = max(seen - 1, 0)
+		for _, hi in segments(buf["t"][base:], gap)[:-1]:
+			end = base + hi
+			seg = {key: col[:end] for key, col in buf.items()}
+			smooth = _smooth(seg["t"], seg["flux"], size, order, method, half)
+			yield emit(seg, smooth, done, end)
+			buf = {key: col[end:] for key, col in buf.items()}
+			base, done = base - end, 0
+
+		end = settled(buf["t"])
+		if end > done:
+			smooth = _smooth(buf["t"], buf["flux"], size, order, method, half)
+			yield emit(buf, smooth, done, end)
+			done = end
+
+			keep = context(buf["t"], done)
+			buf = {key: col[keep:] for key, col in buf.items()}
+			done -= keep
+
+	if buf is not None and len(buf["t"]) > done:
+		smooth = _smooth(buf["t"], buf["flux"], size, order, method, half)
+		yield emit(buf, smooth, done, len(buf["t"]))
+
+# In order to deal with local outliers, we need to do a "windowed" outlier
+# rejection. The number of passes required (and the window size and step size)
+# are a matter of taste, and we'll need to investigate what the best defaults
+# are. I'm worried about having step_size < window_size, because you end up
+# doing outlier rejection multiple times on the same chunk in the same pass. So
+# we're not going to do it that way.
+#
+# Each pass uses windows of a whole number of days, and every window in a
+# pass is handled at once: points are labelled with their window and the
+# per-window statistics are computed with bincount (or a sort, for medians),
+# so a pass is O(N) rather than O(days * N).
+#
+# $method is either "mean" (the mean and standard deviation) or "median" (the
+# median and the median absolute deviation, scaled to match the standard
+# deviation of a normal distribution), which is less affected by the outliers
+# we're trying to remove.
+def reject_outliers(xs, ys, sigma, passes, method="mean"):
+	if method not in {"mean", "median"}:
+		raise ValueError("unknown outlier rejection method: %s" % (method,))
+
+	# Start with a filter made entirely of ones.
+	filt = numpy.ones_like(ys).astype(bool)
+	xs = xs - numpy.min(xs)
+
+	# Do n windows, each with a width of n days.
+	for width in numpy.arange(passes) + 1:
+		# Label each point with its n-day window. The windows are
+		# [edge, edge + width), which is checked explicitly so that rounding
+		# in xs / width can't move a point into a different window.
+		edges = numpy.unique(numpy.floor(xs / width)) * width
+		window = numpy.searchsorted(edges, xs, side="right") - 1
+		sel = filt & (window >= 0) & (xs < edges[window] + width)
+
+		center, scale = _window_stats(window[sel], ys[sel], len(edges), method)
+		center = center[window[sel]]
+		scale = scale[window[sel]]
+
+		filt[sel] = (center - sigma*scale < ys[sel]) & (ys[sel] < center + sigma*scale)
+
+	return filt
+
+MAD_SCALE = 1.482602218505602
+
+# Returns the location and scale of $ys in each of $n groups (labelled by
+# $groups), as in reject_outliers.
+def _window_stats(groups, ys, n, method):
+	with numpy.errstate(invalid="ignore", divide="ignore"):
+		if method == "mean":
+			count = numpy.bincount(groups, minlength=n)
+			mean = numpy.bincount(groups, weights=ys, minlength=n) / count
+			std = numpy.sqrt(numpy.bincount(groups, weights=(ys - mean[groups])**2, minlength=n) / count)
+			return mean, std
+
+		median = _group_median(groups, ys, n)
+		mad = _group_median(groups, numpy.abs(ys - median[groups]), n)
+		return median, MAD_SCALE * mad
+
+def _group_median(groups, ys, n):
+	# Sort by group and then by value, so each group is a sorted run.
+	order = numpy.lexsort((ys, groups))
+	ys = ys[order]
+	count = numpy.bincount(groups, minlength=n)
+	start = numpy.concatenate([[0], numpy.cumsum(count)[:-1]])
+
+	median = numpy.full(n, numpy.nan)
+	full = count > 0
+	lo = start[full] + (count[full] - 1) // 2
+	hi = start[full] + count[full] // 2
+	median[full] = (ys[lo] + ys[hi]) / 2
+	return median
+
+PHASE_STATISTICS = {"median", "mean"}
+
+# Folds $times (in days) at $period, returning the phase of each cadence in the
+# range [0, 1). $offset is a phase shift applied after folding.
+def phase_fold(times, period, offset=0):
+	phases = (times % period) / period
+	return (phases + offset) % 1.0
+
+# Bins a folded light curve into $bins equal-width phase bins of the form
+# [i/bins, (i+1)/bins), combining each bin using $statistic (one of
+# PHASE_STATISTICS). Returns the phase of the start of each bin and the binned
+# values. Empty bins are NaN.
+def bin_phase(phases, ys, bins, statistic="median"):
+	if statistic not in PHASE_STATISTICS:
+		raise ValueError("unknown phase statistic: %s" % (statistic,))
+
+	# Compare against the edges rather than using floor(phases * bins), so that
+	# samples sitting on an edge are put in the same bin as (lo <= x < hi).
+	edges = numpy.arange(bins + 1) * (1.0 / bins)
+	groups = numpy.searchsorted(edges, phases, side="right") - 1
+	valid = (groups >= 0) & (groups < bins)
+	groups = groups[valid]
+	ys = ys[valid]
+
+	if statistic == "median":
+		binned = _group_median(groups, ys, bins)
+	else:
+		count = numpy.bincount(groups, minlength=bins)
+		total = numpy.bincount(groups, weights=ys, minlength=bins)
+		binned = numpy.full(bins, numpy.nan)
+		numpy.divide(total, count, out=binned, where=count > 0)
+
+	return edges[:-1], binned
+
+# Replicates a folded light curve so that it covers the phases [0, $width).
+# $width may be fractional, in which case the last copy is truncated.
+def replicate_phase(phases, ys, width):
+	copies = numpy.arange(math.ceil(width))
+	xs = (phases[numpy.newaxis, :] + copies[:, numpy.newaxis]).ravel()
+	ys = numpy.broadcast_to(ys, (copies.shape[0], ys.shape[0])).ravel()
+
+	keep = xs < width
+	return xs[keep], ys[keep]
+
+def decorrelate(tp, xs, ys):
+	R = 0
+
+	if tp == "linear":
+		import scipy.stats
+		import scipy.signal
+
+		# We do a simple linear regression to remove any (trivial) linear
+		# systematics. This doesn't solve the general case, but it does help
+		# with decorrelating common systematics not solved by accurate tracking
+		# data.
+
+		# y = m*x + C
+		_, _, R, _, _ = scipy.stats.linregress(xs, ys)
+		ys = scipy.signal.detrend(ys, type="linear")
+
+	return ys, R
+
+def to_ppm(fluxs):
+	return (fluxs / fluxs.mean() - 1) * 1e6
+
+# Returns how far each of $times is moved back by drop_gaps(). Every gap
+# wider than $width (in days) is removed to the scale of the median cadence,
+# so the phase of the cadence grid is preserved, and everything after a gap is
+# shifted back by the sum of the gaps before it.
+def gap_shifts(times, width):
+	diffs = numpy.diff(times)
+	assert(numpy.all(diffs >= 0))
+
+	gaps = numpy.where(diffs > width, diffs, 0)
+	if numpy.any(gaps):
+		# We only remove the gap to the scale of the median.
+		gaps -= gaps % numpy.median(diffs)
+
+	return numpy.concatenate([[0], numpy.cumsum(gaps)])
+
+# Removes any gaps in $times which are wider than $width (in days), by
+# shifting everything after the gap back (see gap_shifts).
+def drop_gaps(times, width):
+	return times - gap_shifts(times, width)
+
+# Describes the segments between the gaps removed by drop_gaps() as columns of
+# (the first compressed time, the first real time, the shift) of each segment,
+# which restore_gaps() uses to map compressed times back to real ones.
+def gap_table(times, width):
+	shifts = gap_shifts(times, width)
+	starts = numpy.concatenate([[0], numpy.flatnonzero(numpy.diff(shifts)) + 1]) if len(times) else numpy.array([], dtype=int)
+	return times[starts] - shifts[starts], times[starts], shifts[starts]
+
+# Maps $compressed times (such as those produced by drop_gaps, or times of
+# features in a series which had its gaps dropped) back to real times using the
+# columns of a gap_table().
+def restore_gaps(compressed, table):
+	starts, _, shifts = table
+	idx = numpy.searchsorted(starts, compressed, side="right") - 1
+	return compressed + shifts[numpy.maximum(idx, 0)]
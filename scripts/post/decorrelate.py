@@ -22,38 +22,19 @@ import warnings
 
 import numpy as np
 
-import scipy as sp
-import scipy.stats
-import scipy.signal
-
 import utils
 
+from k2halo import profiling
+
 FIELDS = ["cadence", "t", "flux"]
 CASTS = [int, float, float]
 
-DETERMINATION_THRESHOLD = 0.5
-
-def decorrelate_data(tp, xs, ys):
-	R = 0
-
-	if tp == "linear":
-		# We do a simple linear regression to remove any (trivial) linear
-		# systematics. This doesn't solve the general case, but it does help
-		# with decorrelating common systematics not solved by accurate tracking
-		# data.
-
-		# y = m*x + C
-		_, _, R, _, _ = sp.stats.linregress(xs, ys)
-		ys = sp.signal.detrend(ys, type="linear")
-
-	return ys, R
-
 def main(inf, outf, config):
 	with open(inf, "r", newline="") as inf:
 		cadns, times, fluxs = utils.csv_column_read(inf, FIELDS, start=config.start, end=config.end, casts=CASTS)
 
 	# Decorrelate flux.
-	fluxs, _ = decorrelate_data(config.tp, times, fluxs)
+	fluxs, _ = utils.decorrelate(config.tp, times, fluxs)
 	utils.csv_column_write(outf, [cadns, times, fluxs], FIELDS)
 
 if __name__ == "__main__":
@@ -66,6 +47,7 @@ if __name__ == "__main__":
 		o_type = parser.add_mutually_exclusive_group(required=True)
 		o_type.add_argument("--linear", dest="tp", action="store_const", const="linear", help="Decorrelate using linear regression.")
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 
 		outf = config.out
@@ -76,4 +58,4 @@ if __name__ == "__main__":
 
 		main(inf=config.file[0], outf=outf, config=config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
@@ -23,18 +23,29 @@ import numpy as np
 
 import utils
 
+from k2halo import cache
+from k2halo import profiling
+
 FIELDS = ["t", "flux"]
 CASTS = [float, float]
 
-def main(inf, outf, config):
+def fft(inf, config):
 	with open(inf, "r", newline="") as f:
 		times, fluxs = utils.csv_column_read(f, FIELDS, casts=CASTS, start=config.start, end=config.end)
 
 	fluxs = fluxs / fluxs.mean()
 	fx, fy = utils.lombscargle_amplitude(times, fluxs, mult=config.mult, upper=config.upper)
+	return {"frequency": fx, "amplitude": fy}
+
+def main(inf, outf, config):
+	store = cache.from_config(config)
+	key = None
+	if store is not None:
+		key = cache.digest("dofft", cache.input_key(inf), cache.config_key(config, ignore=["file", "out"]))
+	data = cache.cached(store, key, lambda: fft(inf, config))
 
 	# Output the FFT.
-	utils.csv_column_write(outf, [fx, fy], ["frequency", "amplitude"])
+	utils.csv_column_write(outf, [data["frequency"], data["amplitude"]], ["frequency", "amplitude"])
 
 if __name__ == "__main__":
 	def __wrapped_main__():
@@ -44,8 +55,10 @@ if __name__ == "__main__":
 		parser.add_argument("-sc", "--start", dest="start", type=int, default=None, help="Start cadence (default: None).")
 		parser.add_argument("-ec", "--end", dest="end", type=int, default=None, help="End cadence (default: None).")
 		parser.add_argument("-s", "--save", dest="out", type=str, default=None, help="The output file (default: stdout).")
+		cache.add_arguments(parser)
 		parser.add_argument("file", nargs=1)
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 
 		outf = config.out
@@ -55,5 +68,5 @@ if __name__ == "__main__":
 			outf = open(outf, "w", newline="")
 		main(inf=config.file[0], outf=outf, config=config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
 
@@ -19,26 +19,11 @@ import os
 import sys
 import argparse
 
-import matplotlib as mpl
-if not os.getenv("DISPLAY"):
-	mpl.use("Agg") # Hack to fix no display.
-import matplotlib.pyplot as plt
-
-mpl.rcParams.update({
-	"backend": "ps",
-	"text.latex.preamble": [r"\usepackage{gensymb}"],
-	"axes.labelsize": 13, # fontsize for x and y labels (was 10)
-	"axes.titlesize": 13,
-	"font.size": 13, # was 10
-	"legend.fontsize": 13, # was 10
-	"xtick.labelsize": 13,
-	"ytick.labelsize": 13,
-	"font.family": "serif", # ???
-})
-
 import numpy
 import utils
 
+from k2halo import profiling
+
 def plot_echelle(config, fig, ifile):
 	CASTS = [float, float]
 	FIELDS = ["frequency", config.pgtype]
@@ -68,25 +53,18 @@ def plot_echelle(config, fig, ifile):
 
 	# First we bin the transform.
 	width = config.smoothwidth
-	bins = int(fx.ptp() // width)
-
-	newfy = numpy.zeros(bins)
-	for i in range(bins):
-		rnge = (i*width <= fx) & (fx < (i+1)*width)
-		newfy[i] = fy[rnge].sum()
+	bins = int(numpy.ptp(fx) // width)
 
-	fy = newfy
+	fy = utils.bin_spectrum(fx, fy, width, bins, statistic=config.binstat)
 	fx = numpy.linspace(fx.min(), fx.max(), bins)
 
 	# Then we compute the grid sizes.
 	delta = numpy.diff(fx).mean()
-	rows = int(fx.ptp() // config.deltanu)
+	rows = int(numpy.ptp(fx) // config.deltanu)
 	cols = int(config.deltanu // delta)
 
-	# Fill in the grid from the binned data.
-	grid = numpy.zeros([rows, cols])
-	for y, _ in enumerate(grid):
-		grid[y,...] = fy[y*cols:(y+1)*cols]
+	# Fill in the grid from the binned data (each row is one mode order).
+	grid = fy[:rows*cols].reshape(rows, cols)
 
 	ax = utils.latexify(fig.add_subplot(111))
 	#ax.imshow(-grid, cmap="gray", interpolation="nearest", origin="bottom")
@@ -105,10 +83,11 @@ def plot_echelle(config, fig, ifile):
 	ax.set_ylabel("Mode Order")
 	ax.set_xlabel("Frequency mod %s ($\mu$Hz)" % (config.deltanu,))
 
-	plt.legend()
+	ax.legend()
 	fig.tight_layout()
 
 def main(ifile, config):
+	plt = utils.pyplot(rcparams=utils.RCPARAMS)
 	plot_echelle(config, plt.figure(figsize=(8, 10), dpi=50), ifile)
 
 	if config.ofile:
@@ -133,12 +112,14 @@ if __name__ == "__main__":
 		parser.add_argument("-t", "--type", dest="pgtype", action=PeriodogramTypeAction, default="amplitude", help="The type of periodogram in the file.")
 		parser.add_argument("-dn", "--delta-nu", dest="deltanu", type=float, default=None, help="∆𝜈 (default: computed using correlation function).")
 		parser.add_argument("-w", "--smooth-width", dest="smoothwidth", type=float, default=1, help="The width of the transform binning (default: 1 µHz).")
+		parser.add_argument("-b", "--bin-statistic", dest="binstat", choices=sorted(utils.BIN_STATISTICS), default="sum", help="How to combine the samples within each bin (default: sum).")
 		parser.add_argument("-so", "--start", dest="start", type=int, default=None, help="Start mode order (default: None).")
 		parser.add_argument("-eo", "--end", dest="end", type=int, default=None, help="End mode order (default: None).")
 		parser.add_argument("-s", "--save", dest="ofile", type=str, default=None, help="The output file.")
 		parser.add_argument("csv", nargs=1)
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 		main(config.csv[0], config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
@@ -19,29 +19,11 @@ import os
 import sys
 import argparse
 
-import matplotlib as mpl
-if not os.getenv("DISPLAY"):
-	mpl.use("Agg") # Hack to fix no display.
-import matplotlib.pyplot as plt
-
-mpl.rcParams.update({
-	"backend": "ps",
-	"text.latex.preamble": [r"\usepackage{gensymb}"],
-	"axes.labelsize": 13, # fontsize for x and y labels (was 10)
-	"axes.titlesize": 13,
-	"font.size": 13, # was 10
-	"legend.fontsize": 13, # was 10
-	"xtick.labelsize": 13,
-	"ytick.labelsize": 13,
-	"font.family": "serif", # ???
-})
-
 import numpy
-import scipy
-import scipy.signal
-import scipy.interpolate
 import utils
 
+from k2halo import profiling
+
 def plot_echelle(config, fig, ifile):
 	CASTS = [float, float]
 	FIELDS = ["frequency", config.pgtype]
@@ -82,6 +64,7 @@ def plot_echelle(config, fig, ifile):
 	# Smooth using a Savgol filter.
 	#itp = scipy.interpolate.interp1d(fx, fy, kind='linear')
 	#fy = scipy.signal.savgol_filter(itp(fx), config.width, 6)
+	import scipy.signal
 	win = scipy.signal.boxcar(config.width)
 	fy = scipy.signal.convolve(fy, win, mode="same")
 
@@ -91,10 +74,11 @@ def plot_echelle(config, fig, ifile):
 	ax.set_ylabel("PSD (ppm$^2$$\mu$Hz$^{-1}$)")
 	ax.set_xlabel("Frequency mod %s ($\mu$Hz)" % (config.deltanu,))
 
-	plt.legend()
+	ax.legend()
 	fig.tight_layout()
 
 def main(ifile, config):
+	plt = utils.pyplot(rcparams=utils.RCPARAMS)
 	plot_echelle(config, plt.figure(figsize=(10, 6), dpi=50), ifile)
 
 	if config.ofile:
@@ -128,7 +112,8 @@ if __name__ == "__main__":
 		parser.add_argument("-s", "--save", dest="ofile", type=str, default=None, help="The output file.")
 		parser.add_argument("csv", nargs=1)
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 		main(config.csv[0], config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
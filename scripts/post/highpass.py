@@ -20,43 +20,62 @@ import sys
 import math
 import argparse
 
-import astropy
-import astropy.convolution
-
 import numpy as np
 
-import scipy as sp
-import scipy.signal
-import scipy.interpolate
-
 import utils
 
+from k2halo import profiling
+
 FIELDS = ["cadence", "t", "flux"]
 CASTS = [int, float, float]
 
-def highpass(ts, ys, config):
-	# Smooth using a Savgol filter.
-	itp = sp.interpolate.interp1d(ts, ys, kind='linear')
-	smooth = sp.signal.savgol_filter(itp(ts), config.size, config.order)
-
-	# Subtract a smoothed version then add the mean to produce a realistic value.
-	ys -= smooth - ys.mean()
-
-	# Convert to ppm.
-	if config.residual:
-		ys = (ys - ys.mean()) / ys.mean()
-		ys *= 1e6
-
-	return ts, ys
-
 def main(inf, outf, config):
+	if config.stream:
+		return stream(inf, outf, config)
+
 	with open(inf, "r", newline="") as f:
 		cadns, times, fluxs = utils.csv_column_read(f, FIELDS, casts=CASTS, start=config.start, end=config.end)
 
 	# Do the thing.
-	times, fluxs = highpass(times, fluxs, config)
+	times, fluxs = utils.highpass(times, fluxs, size=config.size, order=config.order, residual=config.residual, gap=config.gap, method=config.method, cadence=config.cadence)
 	utils.csv_column_write(outf, [cadns, times, fluxs], FIELDS)
 
+def chunks(inf, config):
+	with open(inf, "r", newline="") as f:
+		for cadns, times, fluxs in utils.csv_column_chunks(f, FIELDS, casts=CASTS, size=config.chunk_size, start=config.start, end=config.end):
+			yield {"cadence": cadns, "t": times, "flux": fluxs}
+
+# Filters the file in chunks of --chunk-size rows rather than loading it all,
+# for very long (concatenated) light curves. This reads $inf more than once: to
+# get the mean flux, to get the mean of the corrected flux (with --residual) and
+# to filter it.
+def stream(inf, outf, config):
+	def filtered(mean):
+		return utils.highpass_chunks(chunks(inf, config), config.size, config.order, mean, gap=config.gap, method=config.method, cadence=config.cadence)
+
+	def mean(chunks):
+		total, count = 0, 0
+		for chunk in chunks:
+			total += chunk["flux"].sum()
+			count += len(chunk["flux"])
+		return total / count
+
+	mean_flux = mean(chunks(inf, config))
+	if config.residual:
+		mean_corrected = mean(filtered(mean_flux))
+
+	writer = csv.DictWriter(outf, fieldnames=FIELDS)
+	writer.writeheader()
+
+	for chunk in filtered(mean_flux):
+		fluxs = chunk["flux"]
+		if config.residual:
+			fluxs = (fluxs - mean_corrected) / mean_corrected
+			fluxs *= 1e6
+
+		for fields in zip(chunk["cadence"], chunk["t"], fluxs):
+			writer.writerow({FIELDS[i]: field for i, field in enumerate(fields)})
+
 if __name__ == "__main__":
 	def __wrapped_main__():
 		DEFAULT_ORDER = 3
@@ -69,9 +88,15 @@ if __name__ == "__main__":
 		parser.add_argument("--no-residual", dest="residual", action="store_const", const=False, default=False, help="Return just corrected light curve (default).")
 		parser.add_argument("-w", "--width", dest="size", type=int, default=DEFAULT_SIZE, help="Window size of filter (default: %f)." % (DEFAULT_SIZE,))
 		parser.add_argument("-o", "--order", dest="order", type=int, default=DEFAULT_ORDER, help="Order of polynomial (default: %f)." % (DEFAULT_ORDER,))
+		parser.add_argument("-g", "--gap", dest="gap", type=float, default=None, help="Filter each part of the light curve between gaps wider than this many days separately (default: None).")
+		parser.add_argument("-m", "--method", dest="method", choices=sorted(utils.HIGHPASS_METHODS), default="savgol", help="Filter uniform cadences with a Savgol filter or fit a polynomial to each window in time (default: savgol). On uniform cadences the two agree except within half a window of each segment end, where savgol evaluates one polynomial fitted to the last full window while poly fits each cadence's truncated window.")
+		parser.add_argument("--cadence", dest="cadence", type=float, default=None, help="Cadence in days, which sets the window width of the poly method (default: median cadence).")
+		parser.add_argument("--stream", dest="stream", action="store_const", const=True, default=False, help="Filter the light curve in chunks rather than loading it into memory.")
+		parser.add_argument("-cs", "--chunk-size", dest="chunk_size", type=int, default=10000, help="Number of rows per chunk with --stream (default: 10000).")
 		parser.add_argument("-s", "--save", dest="out", type=str, default=None, help="The output file (default: stdout).")
 		parser.add_argument("file", nargs=1)
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 
 		outf = config.out
@@ -82,4 +107,4 @@ if __name__ == "__main__":
 
 		main(inf=config.file[0], outf=outf, config=config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
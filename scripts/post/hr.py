@@ -22,23 +22,6 @@ import json
 import utils
 
 import numpy
-import matplotlib as mpl
-mpl.use("TkAgg")
-if not os.getenv("DISPLAY"):
-	mpl.use("Agg") # Hack to fix no display.
-import matplotlib.pyplot as plt
-
-mpl.rcParams.update({
-	"backend": "ps",
-	"text.latex.preamble": [r"\usepackage{gensymb}"],
-	"axes.labelsize": 13, # fontsize for x and y labels (was 10)
-	"axes.titlesize": 13,
-	"font.size": 13, # was 10
-	"legend.fontsize": 13, # was 10
-	"xtick.labelsize": 13,
-	"ytick.labelsize": 13,
-	"font.family": "serif", # ???
-})
 
 def main(ifile, config):
 	with open(ifile) as f:
@@ -50,6 +33,7 @@ def main(ifile, config):
 	stamps = stamps[filt]
 	parallax = parallax[filt]
 
+	plt = utils.pyplot(backend="TkAgg", rcparams=utils.RCPARAMS)
 	fig = plt.figure(figsize=(5.7, 5.7), dpi=80)
 
 	parallax = [float(p.split(" ")[0]) for p in parallax if p.split(" ")[0] != "~"]
@@ -17,32 +17,15 @@
 
 import os
 import sys
-import math
 import argparse
 import itertools
 
-import matplotlib as mpl
-mpl.use("TkAgg")
-if not os.getenv("DISPLAY"):
-	mpl.use("Agg") # Hack to fix no display.
-import matplotlib.pyplot as plt
-
-mpl.rcParams.update({
-	"backend": "ps",
-	"text.latex.preamble": [r"\usepackage{gensymb}"],
-	"axes.labelsize": 13, # fontsize for x and y labels (was 10)
-	"axes.titlesize": 13,
-	"font.size": 13, # was 10
-	"legend.fontsize": 13, # was 10
-	"xtick.labelsize": 13,
-	"ytick.labelsize": 13,
-	"font.family": "serif", # ???
-})
-
 import numpy as np
 
 import utils
 
+from k2halo import profiling
+
 FIELDS = ["t", "flux"]
 CASTS = [float, float]
 
@@ -79,28 +62,15 @@ def plot_lc(ax, config, ifile):
 	#ys *= 1e6
 
 	if config.period is not None:
-		# TODO: We should allow for showing more than one phase.
-		xs = (xs % config.period) / config.period
-		xs = (xs + config.phase) % 1.0
+		xs = utils.phase_fold(xs, config.period, offset=config.phase)
 
-	# Bin the folded phase plot by taking the average of ranges.
+	# Bin the folded phase plot.
 	if config.bins is not None:
-		size = 1.0 / config.bins
-		nys = np.zeros(config.bins)
-
-		for i in range(config.bins):
-			rnge = (i*size <= xs) & (xs < (i+1)*size)
-			nys[i] = np.median(ys[rnge])
-
-		ys = nys
-		xs = np.arange(config.bins) * size
+		xs, ys = utils.bin_phase(xs, ys, config.bins, statistic=config.statistic)
 
 	# Replication.
-	# TODO: Make this code less insane and work for fractional width.
 	if config.period is not None:
-		ceilwidth = math.ceil(config.width)
-		xs = np.tile(xs, ceilwidth) + np.repeat(np.arange(ceilwidth), xs.shape[0])
-		ys = np.tile(ys, ceilwidth)
+		xs, ys = utils.replicate_phase(xs, ys, config.width)
 		ax.set_xlim([0, config.width])
 
 	if not (config.period or config.bins):
@@ -116,6 +86,7 @@ def plot_lc(ax, config, ifile):
 		ax.set_title(r"Light Curve [%s] # %s" % (description(config), config.comment or ""))
 
 def main(ifiles, config):
+	plt = utils.pyplot(backend="TkAgg", rcparams=utils.RCPARAMS)
 	fig = plt.figure(figsize=(5.7, 4.5), dpi=50)
 	ax = utils.latexify(fig.add_subplot(111))
 	for ifile in ifiles:
@@ -145,11 +116,13 @@ if __name__ == "__main__":
 		parser.add_argument("-w", "--width", dest="width", type=float, default=1, help="The phase width displayed (default: 1).")
 		parser.add_argument("-po", "--phase-offset", dest="phase", type=float, default=0, help="Amount by which to phase shift the light curve (default: 0).")
 		parser.add_argument("-b", "--bins", dest="bins", type=int, default=None, help="The number of bins to bin the folded light curve (default: none).")
+		parser.add_argument("-bs", "--bin-statistic", dest="statistic", choices=sorted(utils.PHASE_STATISTICS), default="median", help="How to combine the samples within each bin (default: median).")
 		parser.add_argument("-s", "--save", dest="ofile", type=str, default=None, help="The output file.")
 		parser.add_argument("csv", nargs='+')
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 
 		main(config.csv, config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
@@ -22,41 +22,17 @@ import numpy as np
 
 import utils
 
+from k2halo import profiling
+
 FIELDS = ["cadence", "t", "flux"]
 CASTS = [int, float, float]
 
-# In order to deal with local outliers, we need to do a "windowed" outlier
-# rejection. The number of passes required (and the window size and step size)
-# are a matter of taste, and we'll need to investigate what the best defaults
-# are. I'm worried about having step_size < window_size, because you end up
-# doing outlier rejection multiple times on the same chunk in the same pass. So
-# we're not going to do it that way.
-
-def reject_outliers(xs, ys, config):
-	# Start with a filter made entirely of zeros.
-	filt = np.ones_like(ys).astype(bool)
-	xs = xs - np.min(xs)
-
-	# Do n windows, each with a width of n days.
-	for width in np.arange(config.passes) + 1:
-		# Do a n-day window.
-		days = np.unique(np.floor(xs / width))
-		for day in days * width:
-			window = (day <= xs) & (xs < day + width)
-
-			sigma = np.std(ys[filt & window])
-			mean = np.mean(ys[filt & window])
-
-			filt[filt & window] &= ((mean - config.sigma*sigma < ys[filt & window]) & (ys[filt & window] < mean + config.sigma*sigma))
-
-	return filt
-
 def main(inf, outf, config):
 	with open(inf, "r", newline="") as inf:
 		cadns, times, fluxs = utils.csv_column_read(inf, FIELDS, start=config.start, end=config.end, casts=CASTS)
 
 	# Remove outliers.
-	filt = reject_outliers(times, fluxs, config)
+	filt = utils.reject_outliers(times, fluxs, sigma=config.sigma, passes=config.passes, method=config.method)
 
 	cadns = cadns[filt]
 	times = times[filt]
@@ -72,8 +48,10 @@ if __name__ == "__main__":
 		parser.add_argument("-s", "--save", dest="out", type=str, default=None, help="The output file (default: stdout).")
 		parser.add_argument("-si", "--sigma", dest="sigma", type=float, default=4, help="Sigma cutoff for an outlier (default: 4).")
 		parser.add_argument("-p", "--passes", dest="passes", type=int, default=3, help="Number of passes when doing windowing (default: 3).")
+		parser.add_argument("-m", "--method", dest="method", choices=["mean", "median"], default="mean", help="Statistics used for each window, mean/std or the (more robust) median/MAD (default: mean).")
 		parser.add_argument("file", nargs=1)
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 
 		outf = config.out
@@ -84,4 +62,4 @@ if __name__ == "__main__":
 
 		main(inf=config.file[0], outf=outf, config=config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
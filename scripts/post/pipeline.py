@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Runs a chain of post-processing stages in one process. Instead of
+#
+#   % ./ppm.py <(./outliers.py -si 4 <(./highpass.py -w 401 -o 6 in.csv))
+#
+# you can run
+#
+#   % ./pipeline.py -i in.csv highpass:size=401,order=6 outliers:sigma=4 ppm
+#
+# or put the same stages in a JSON/YAML file (see k2halo.pipeline.load_spec)
+# and run `./pipeline.py -p spec.yml`. Stages given on the command line are run
+# after the ones in the description, and -i overrides its input. Intermediate results are cached by
+# content hash, so changing a later stage doesn't re-run the earlier ones.
+
+import os
+import sys
+import argparse
+
+import utils
+
+from k2halo import cache
+from k2halo import pipeline
+from k2halo import profiling
+
+def main(inf, outf, stages, config):
+	store = cache.from_config(config)
+	key = None
+	if store is not None:
+		key = cache.input_key(inf)
+
+	def load():
+		with open(inf, "r", newline="") as f:
+			return pipeline.read_columns(f)
+
+	data = pipeline.run(load, stages, store=store, key=key)
+	pipeline.write_columns(outf, data)
+
+if __name__ == "__main__":
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Run a chain of post-processing stages (%s) over a time series in a single process." % (", ".join(pipeline.STAGES),))
+		parser.add_argument("-p", "--pipeline", dest="spec", type=str, default=None, help="A JSON/YAML pipeline description (default: stages from the command line).")
+		cache.add_arguments(parser)
+		parser.add_argument("-s", "--save", dest="out", type=str, default=None, help="The output file (default: stdout).")
+		parser.add_argument("-i", "--input", dest="file", type=str, default=None, help="The input file (default: from the pipeline description).")
+		parser.add_argument("stages", nargs="*", help="Stages to run, as stage[:key=value,...].")
+
+		profiling.add_arguments(parser)
+		config = parser.parse_args()
+
+		spec = {"input": None, "output": None, "stages": []}
+		if config.spec is not None:
+			with open(config.spec) as f:
+				spec = pipeline.load_spec(f, base=os.path.dirname(config.spec))
+
+		inf = config.file or spec["input"]
+		if inf is None:
+			parser.error("no input file given")
+		stages = spec["stages"] + [pipeline.parse_stage(stage) for stage in config.stages]
+
+		outf = config.out or spec["output"]
+		if outf == None:
+			outf = sys.stdout
+		else:
+			outf = open(outf, "w", newline="")
+
+		main(inf=inf, outf=outf, stages=stages, config=config)
+
+	profiling.main(__wrapped_main__)
@@ -21,6 +21,8 @@ import numpy
 
 import utils
 
+from k2halo import profiling
+
 FIELDS = ["cadence", "t", "flux"]
 CASTS = [int, float, float]
 
@@ -29,7 +31,7 @@ def main(inf, outf, config):
 		cadns, times, fluxs = utils.csv_column_read(inf, FIELDS, start=config.start, end=config.end, casts=CASTS)
 
 	# To PPM.
-	fluxs = (fluxs / fluxs.mean() - 1) * 1e6
+	fluxs = utils.to_ppm(fluxs)
 	utils.csv_column_write(outf, [cadns, times, fluxs], FIELDS)
 
 if __name__ == "__main__":
@@ -40,6 +42,7 @@ if __name__ == "__main__":
 		parser.add_argument("-s", "--save", dest="out", type=str, default=None, help="The output file (default: stdout).")
 		parser.add_argument("file", nargs=1)
 
+		profiling.add_arguments(parser)
 		config = parser.parse_args()
 
 		outf = config.out
@@ -50,4 +53,4 @@ if __name__ == "__main__":
 
 		main(inf=config.file[0], outf=outf, config=config)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
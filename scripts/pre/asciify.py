@@ -23,11 +23,10 @@ import argparse
 
 import numpy as np
 
-import astropy as ap
-import astropy.io.fits
-
 import utils
 
+from k2halo import profiling
+
 def asciify(array, scale="log"):
 	mask = ~np.isnan(array)
 
@@ -54,7 +53,7 @@ def asciify(array, scale="log"):
 	return out
 
 def main(fits, txt, frame, **kwargs):
-	with ap.io.fits.open(fits) as hdulist:
+	with utils.open_fits(fits) as hdulist:
 		flximg = utils.filter_img(hdulist)
 
 	rows = asciify(flximg["FLUX"][frame])
@@ -76,8 +75,9 @@ if __name__ == "__main__":
 		parser.add_argument("input", nargs=1)
 		parser.add_argument("output", nargs=1)
 
+		profiling.add_arguments(parser)
 		args = parser.parse_args()
 
 		main(fits=args.input[0], txt=args.output[0], **vars(args))
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
@@ -21,29 +21,8 @@ import argparse
 import json
 
 import numpy
-import matplotlib as mpl
-mpl.use("TkAgg")
-if not os.getenv("DISPLAY"):
-	mpl.use("Agg") # Hack to fix no display.
-import matplotlib.pyplot as plt
 
-SPINE_COLOR = "black"
-
-def latexify(ax):
-	for spine in ["top", "right"]:
-		ax.spines[spine].set_visible(False)
-
-	for spine in ["left", "bottom"]:
-		ax.spines[spine].set_color(SPINE_COLOR)
-		ax.spines[spine].set_linewidth(0.5)
-
-	ax.xaxis.set_ticks_position("bottom")
-	ax.yaxis.set_ticks_position("left")
-
-	for axis in [ax.xaxis, ax.yaxis]:
-		axis.set_tick_params(direction="out", color=SPINE_COLOR)
-
-	return ax
+import utils
 
 def bin_campaigns(ax, data, nears=1):
 	Cs = numpy.array([int(campaign) for bright in data for campaign in bright["campaigns"] if len(bright["nears"]) >= nears])
@@ -59,9 +38,10 @@ def main(ifile, config):
 	with open(ifile) as f:
 		data = json.load(f)
 
+	plt = utils.pyplot(backend="TkAgg")
 	fig = plt.figure(figsize=(5, 5), dpi=80)
 
-	ax1 = latexify(fig.add_subplot("111"))
+	ax1 = utils.latexify(fig.add_subplot("111"))
 	for near in config.nears:
 		bin_campaigns(ax1, data["data"], nears=near)
 
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# keplerk2-halo: Halo Photometry of Contaminated Kepler/K2 Pixels
+# Copyright (C) 2017 Aleksa Sarai <cyphar@cyphar.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Builds a local catalogue (see k2halo.catalogue) from a CSV downloaded from
+# the MAST EPIC or K2 data search, for find_interesting.py --epic-catalogue
+# and --target-catalogue.
+
+import sys
+import argparse
+
+import utils
+
+from k2halo import catalogue
+from k2halo import profiling
+
+def main(inf, outf, config):
+	with open(inf, newline="") as f:
+		columns = catalogue.read_csv(f)
+
+	cat = catalogue.Catalogue(columns)
+	cat.save(outf)
+	sys.stderr.write("%s: %d stars (%s)\n" % (outf, len(cat), ", ".join(sorted(columns))))
+
+if __name__ == "__main__":
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Build a local, spatially indexed catalogue from an EPIC or K2 target list CSV.")
+		parser.add_argument("-s", "--save", dest="out", type=str, required=True, help="The output catalogue (.npz).")
+		parser.add_argument("file", nargs=1)
+
+		profiling.add_arguments(parser)
+		config = parser.parse_args()
+		main(inf=config.file[0], outf=config.out, config=config)
+
+	profiling.main(__wrapped_main__)
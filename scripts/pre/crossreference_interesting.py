@@ -24,63 +24,40 @@
 import csv
 import sys
 import json
-import time
 import argparse
-import requests
 
-SIM_SCRIPT_URL = "http://simbad.harvard.edu/simbad/sim-script"
-RETRY_NUMBER = 5
-
-def simbad_script(script):
-	for _ in range(RETRY_NUMBER):
-		try:
-			r = requests.get(SIM_SCRIPT_URL, params={
-				"submit": "submit script",
-				"script": script,
-			})
-		except OSError:
-			# Weirdly we've hit some issue now.
-			time.sleep(3)
-			continue
+import utils
 
-		if r.status_code != requests.codes.ok:
-			continue
+from k2halo import cache
+from k2halo import query
 
-		return r.text.strip()
+SIM_SCRIPT_URL = "http://simbad.harvard.edu/simbad/sim-script"
+BATCH_SIZE = 100
 
-	raise RuntimeError("retry failed -- status code was not 200: %d -- %s" % (r.status_code, r.text.strip()))
+# Every object is output as a line of this format. The leading %IDLIST(HIP) is
+# so we can tell which query each line came from, since queries which don't
+# match anything just don't output a line.
+SIM_FORMAT = "format: %IDLIST(HIP)|%IDLIST(1),%PLX(V[E]),%SP(S)%FLUXLIST(U,B,V)[,%*(F)]"
 
-def simbad_search(search):
-	# For more information about this _lovely_ scripting language, see
-	#   http://simbad.harvard.edu/simbad/sim-help?Page=sim-fscript
+def simbad_script(client, script, url=SIM_SCRIPT_URL):
+	return client.get(url, params={
+		"submit": "submit script",
+		"script": script,
+	}).strip()
 
-	output = simbad_script(r"""
-	format object "format: %IDLIST(1),%PLX(V[E]),%SP(S)%FLUXLIST(U,B,V)[,%*(F)]"
-	set limit 0
-	""" + "query %s" % (search,))
-
-	# The lovely format is the following:
-	#   ::script::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
-	#   <the script>
-	#   ::console:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
-	#   <console output>
-	#   ::data::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
-	#   [our format]
+def normalise_ident(ident):
+	return " ".join(ident.lower().split())
 
+def parse_row(line):
 	# Where our format looks like this:
-	#   format: ID,Parallax[Error],SpectralType,U,B,V
-
-	matching = [line for line in output.split('\n') if line.startswith("format: ")]
-	if len(matching) != 1:
-		raise RuntimeError("output missing 'format: ': %s", (output,))
-
-	csv_out = matching[0].split(": ")[1]
+	#   format: HIP,ID,Parallax[Error],SpectralType,U,B,V
+	hip, csv_out = line.split(": ", 1)[1].split("|", 1)
 	ident, parallax, spectral, umag, bmag, vmag, *unused = csv_out.split(",")
 	if len(unused) > 0:
 		sys.stderr.write("# csv_out had more than 6 fields: %s\n" % (csv_out,))
 		sys.stderr.flush()
 
-	return {
+	return normalise_ident(hip), {
 		"ident": ident,
 		"parallax": parallax,
 		"spectral": spectral,
@@ -89,6 +66,71 @@ def simbad_search(search):
 		"V": vmag,
 	}
 
+# Looks up all of $searches (HIP identifiers like "hip 1234") in one script,
+# returning a dict from each (normalised) identifier to its result. Identifiers
+# SIMBAD doesn't know about are left out.
+def simbad_batch(client, searches, url=SIM_SCRIPT_URL):
+	# For more information about this _lovely_ scripting language, see
+	#   http://simbad.harvard.edu/simbad/sim-help?Page=sim-fscript
+
+	output = simbad_script(client, "\n".join([
+		'format object "%s"' % (SIM_FORMAT,),
+		"set limit 0",
+	] + ["query %s" % (search,) for search in searches]), url=url)
+
+	# The lovely format is the following:
+	#   ::script::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+	#   <the script>
+	#   ::console:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+	#   <console output>
+	#   ::error:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+	#   <queries which failed, if any>
+	#   ::data::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+	#   [our format, one line per object]
+	sections = output.split("::data::")
+	if len(sections) != 2:
+		if "::error::" in output:
+			return {}
+		raise RuntimeError("output missing '::data::': %s" % (output,))
+
+	results = {}
+	for line in sections[1].split("\n"):
+		if line.startswith("format: "):
+			hip, result = parse_row(line)
+			results[hip] = result
+	return results
+
+# Looks up every one of $searches, $batch_size identifiers per request. Results
+# are cached per identifier in $store (if given), so only identifiers we
+# haven't seen before are sent to SIMBAD.
+def simbad_search_all(client, searches, store=None, batch_size=BATCH_SIZE, url=SIM_SCRIPT_URL):
+	def key(search):
+		return cache.digest("simbad", SIM_FORMAT, normalise_ident(search))
+
+	results = {}
+	missing = []
+	for search in searches:
+		cached = store.get_raw(key(search)) if store is not None else None
+		if cached is not None:
+			results[normalise_ident(search)] = json.loads(cached.decode("utf-8"))
+		else:
+			missing.append(search)
+
+	batches = [missing[idx:idx+batch_size] for idx in range(0, len(missing), batch_size)]
+	for batch in client.map(lambda batch: simbad_batch(client, batch, url=url), batches):
+		for ident, result in batch.items():
+			results[ident] = result
+			if store is not None:
+				store.put_raw(key(ident), json.dumps(result).encode("utf-8"))
+
+	return results
+
+def simbad_search(client, search, url=SIM_SCRIPT_URL):
+	result = simbad_batch(client, [search], url=url).get(normalise_ident(search))
+	if result is None:
+		raise RuntimeError("no SIMBAD match for %s" % (search,))
+	return result
+
 def main(ifile, config):
 	with open(ifile) as f:
 		data = json.load(f)
@@ -98,21 +140,37 @@ def main(ifile, config):
 		"U", "B", "V"])
 	writer.writeheader()
 
+	brights = []
 	for bright in data["data"]:
 		if not bright.get("hip", ""):
 			sys.stderr.write("# skipping %s because missing HIP ident\n" % (bright["bright"]))
 			sys.stderr.flush()
 			continue
+		brights.append(bright)
 
-		result = simbad_search("hip %s" % (bright["hip"],))
+	client = query.QueryClient(workers=config.jobs, rate=config.rate, retries=config.retries, backoff=config.backoff)
+	searches = ["hip %s" % (bright["hip"],) for bright in brights]
+	results = simbad_search_all(client, searches, store=cache.from_config(config), batch_size=config.batch_size, url=config.simbad_url)
+
+	for bright, search in zip(brights, searches):
+		result = results.get(normalise_ident(search))
+		if result is None:
+			sys.stderr.write("# skipping %s because SIMBAD has no match for %s\n" % (bright["bright"], search))
+			sys.stderr.flush()
+			continue
 
+		result = dict(result)
 		result["epic"] = bright["bright"]
 		result["n_stamps"] = len(bright["nears"])
 		writer.writerow(result)
-		sys.stdout.flush()
+	sys.stdout.flush()
 
 if __name__ == "__main__":
 	parser = argparse.ArgumentParser(description="Cross-references identifiers from a file output from find_interesting.py.")
+	parser.add_argument("-b", "--batch-size", dest="batch_size", type=int, default=BATCH_SIZE, help="Number of identifiers to look up per SIMBAD script (default: %d)." % (BATCH_SIZE,))
+	parser.add_argument("--simbad-url", dest="simbad_url", default=SIM_SCRIPT_URL, help="URL of the SIMBAD script interface (default: %s)." % (SIM_SCRIPT_URL,))
+	query.add_arguments(parser)
+	cache.add_arguments(parser)
 	parser.add_argument("csv", nargs=1)
 
 	args = parser.parse_args()
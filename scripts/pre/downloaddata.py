@@ -16,104 +16,360 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import re
 import sys
 import json
+import time
 import zlib
+import shutil
 import tarfile
 import argparse
+import threading
+import concurrent.futures
+
 import requests
+import requests.adapters
+
+import utils
+
+from k2halo import cache
+from k2halo import datatree
+from k2halo import query
+from k2halo import prf as prfstore
+from k2halo import profiling
 
-ARCHIVE_URL = "https://archive.stsci.edu/pub/k2/target_pixel_files/c%d/%.9d/%.5d/%s.gz"
+ARCHIVE_URL = datatree.ARCHIVE_URL
 PRF_URL = "https://archive.stsci.edu/missions/kepler/fpc/prf/kplr2011265_prf.tar.gz"
 
-DATA_JSON = "stars.json"
-STAR_JSON = "targets.json"
-TARGET_JSON = "target.json"
+DATA_JSON = datatree.DATA_JSON
+STAR_JSON = datatree.STAR_JSON
+TARGET_JSON = datatree.TARGET_JSON
+MANIFEST_JSON = "manifest.json"
+
+CHUNK_SIZE = 1 << 20
+FITS_BLOCK = 2880
+
+# A session shared by all of the download threads, so connections to the
+# archive are reused rather than re-established for every file. Failed
+# connections and the statuses query.RETRY_STATUSES are retried $retries
+# times, backing off exponentially from $backoff seconds.
+def new_session(workers, retries=3, backoff=1):
+	import urllib3.util.retry
+
+	retry = urllib3.util.retry.Retry(total=retries, backoff_factor=backoff, status_forcelist=query.RETRY_STATUSES, allowed_methods=["GET"], raise_on_status=False)
+
+	session = requests.Session()
+	adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+	session.mount("http://", adapter)
+	session.mount("https://", adapter)
+	return session
+
+# The offset a 206 response's Content-Range starts at, or None if it doesn't
+# have a (byte) range.
+def range_start(content_range):
+	match = re.match(r"^bytes (\d+)-\d+/(\d+|\*)$", content_range or "")
+	if match is None:
+		return None
+	return int(match.group(1))
+
+# Downloads $url to $path. The data goes to $path.part first, and if that
+# already exists (from an interrupted download) we ask the server for just the
+# rest of the file with a Range request. Only a complete download is renamed
+# to $path, so $path existing means we have the whole file. If $path.part
+# doesn't fit the file on the server (it's larger, or the file has changed) or
+# the server sends a different range to the one we asked for, $path.part is
+# thrown away and the download starts again from the beginning.
+#
+# If $validators (the "etag" and "last_modified" of a copy we already have)
+# are given, the download is conditional and None is returned if the server
+# says our copy is still current. Otherwise the validators of the new copy
+# are returned.
+def download(session, url, path, validators=None, chunk_size=CHUNK_SIZE):
+	part = path + ".part"
 
-def fits_url(campaign, target, fits, **_):
-	def lead(x, n):
-		return x - x%n
-	return ARCHIVE_URL % (campaign, lead(target, 1e5), lead(target % 1e5, 1e3), fits)
+	headers = {}
+	offset = 0
+	if os.path.exists(part):
+		offset = os.path.getsize(part)
+		headers["Range"] = "bytes=%d-" % (offset,)
+	elif validators:
+		if validators.get("etag"):
+			headers["If-None-Match"] = validators["etag"]
+		if validators.get("last_modified"):
+			headers["If-Modified-Since"] = validators["last_modified"]
 
-def save_fits(url, ofile, config, chunk_size=1024):
+	restart = False
+	with session.get(url, headers=headers, stream=True, timeout=60) as r:
+		if r.status_code == 304:
+			return None
+
+		if r.status_code == 416:
+			# Either we already have all of it, or the server's copy is
+			# smaller than what we have.
+			restart = r.headers.get("Content-Range") != "bytes */%d" % (offset,)
+		else:
+			r.raise_for_status()
+
+			# Servers which don't support ranges just send the whole file.
+			mode = "wb"
+			if r.status_code == 206:
+				mode = "ab"
+				restart = range_start(r.headers.get("Content-Range")) != offset
+
+			if not restart:
+				with open(part, mode) as ofile:
+					for chunk in r.iter_content(chunk_size=chunk_size):
+						ofile.write(chunk)
+
+		result = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+
+	if restart:
+		# Without a .part we don't send a Range, so this can only happen
+		# once -- unless the server is sending nonsense.
+		if not offset:
+			raise ValueError("%s: unexpected Content-Range %r" % (url, r.headers.get("Content-Range")))
+		os.unlink(part)
+		return download(session, url, path, validators=validators, chunk_size=chunk_size)
+
+	os.replace(part, path)
+	return result
+
+# Like download, but if the connection drops part way through the file the
+# download is resumed (up to $attempts times, backing off exponentially from
+# $backoff seconds) rather than left for the next run.
+def fetch(session, url, path, validators=None, attempts=3, backoff=1):
+	for attempt in range(attempts):
+		try:
+			return download(session, url, path, validators=validators)
+		except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as err:
+			if attempt + 1 == attempts:
+				raise
+			sys.stderr.write("# %s: %s, resuming\n" % (url, err))
+			time.sleep(backoff * 2 ** attempt)
+
+# Decompresses the gzipped file $src to $dst (atomically, like download) and
+# removes $src. A corrupt or truncated $src is also removed (so that it is
+# fetched again rather than tripped over by every later run), and raises
+# ValueError.
+def decompress(src, dst, chunk_size=CHUNK_SIZE):
+	tmp = dst + ".part"
 	z = zlib.decompressobj(16 + zlib.MAX_WBITS)
-	r = requests.get(url, stream=True)
-	n = 0
-	for chunk in r.iter_content(chunk_size=chunk_size):
-		if chunk:
-			n += 1
-			if not n % 300:
-				sys.stdout.write(".")
-				sys.stdout.flush()
+	try:
+		with open(src, "rb") as ifile, open(tmp, "wb") as ofile:
+			for chunk in iter(lambda: ifile.read(chunk_size), b""):
+				ofile.write(z.decompress(chunk))
+			ofile.write(z.flush())
+	except zlib.error as err:
+		error = "corrupt gzip data (%s)" % (err,)
+	else:
+		error = None if z.eof else "truncated gzip data"
 
-			if config.decompress:
-				chunk = z.decompress(chunk)
+	if error is not None:
+		os.unlink(tmp)
+		os.unlink(src)
+		raise ValueError("%s: %s" % (src, error))
 
-			ofile.write(chunk)
-			ofile.flush()
+	os.replace(tmp, dst)
+	os.unlink(src)
 
-	tail = z.flush()
-	assert(len(tail) == 0)
+# Each target directory has a manifest of the files we've downloaded into it,
+# mapping the file name to its size, checksum, source URL and the ETag and
+# Last-Modified headers it was served with. It lets us tell a complete file
+# from one truncated by a killed run without re-downloading it, and lets
+# --clobber only fetch files which have changed on the server.
+def load_manifest(directory):
+	try:
+		with open(os.path.join(directory, MANIFEST_JSON)) as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return {}
 
-def save_prf(path, config):
+def save_manifest(directory, manifest):
+	path = os.path.join(directory, MANIFEST_JSON)
+	with open(path + ".part", "w") as f:
+		json.dump(manifest, f, indent="\t", sort_keys=True)
+		f.write("\n")
+	os.replace(path + ".part", path)
+
+def manifest_entry(path, url, validators):
+	return {
+		"size": os.path.getsize(path),
+		"sha256": cache.file_digest(path),
+		"url": url,
+		"etag": validators.get("etag"),
+		"last_modified": validators.get("last_modified"),
+	}
+
+# Checks whether a file we didn't record (from before we had manifests) is
+# complete. FITS files are always a whole number of 2880 byte blocks, and
+# gzip files have to decompress cleanly to the end of the stream.
+def looks_complete(path):
+	if path.endswith(".gz"):
+		z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+		try:
+			with open(path, "rb") as f:
+				for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+					z.decompress(chunk)
+		except zlib.error:
+			return False
+		return z.eof
+	return os.path.getsize(path) % FITS_BLOCK == 0
+
+# Whether the file at $path matches its manifest $entry. Checking the size is
+# enough to catch truncated downloads. With $full the checksum is checked as
+# well, which catches any other corruption but means reading the whole file.
+def verify(path, entry, full=False):
+	if not os.path.exists(path):
+		return False
+	if os.path.getsize(path) != entry["size"]:
+		return False
+	if full and cache.file_digest(path) != entry["sha256"]:
+		return False
+	return True
+
+# Returns the validators of the downloaded file, or None if $validators
+# were given and the server says our copy is current.
+def save_fits(session, url, opath, config, validators=None):
+	gzpath = opath + ".gz"
+
+	# If we were interrupted while decompressing, we already have the whole
+	# compressed file (though not its validators, so a later --clobber will
+	# fetch it again).
+	result = {}
+	fetched = validators is not None or not os.path.exists(gzpath)
+	if fetched:
+		result = fetch(session, url, gzpath, validators=validators, attempts=config.retries + 1)
+		if result is None:
+			return None
+
+	if config.decompress:
+		try:
+			decompress(gzpath, opath)
+		except ValueError:
+			if fetched:
+				raise
+			# The leftover was corrupt (and has been removed), so fetch
+			# it again.
+			result = fetch(session, url, gzpath, attempts=config.retries + 1)
+			decompress(gzpath, opath)
+	return result
+
+def save_prf(session, path, config):
 	sys.stdout.write("Saving PRF ")
 	sys.stdout.flush()
 
 	prf = os.path.join(path, "prf")
 	if config.clobber or not os.path.exists(prf):
-		r = requests.get(PRF_URL, stream=True)
-		with tarfile.open(fileobj=r.raw, mode="r|*") as tf:
-			tf.extractall(path=prf)
+		tarball = prf + ".tar.gz"
+		fetch(session, config.prf_url, tarball, attempts=config.retries + 1)
+
+		# Extract next to the final directory and rename it into place, so
+		# an interrupted extraction isn't mistaken for a complete one.
+		tmp = prf + ".part"
+		shutil.rmtree(tmp, ignore_errors=True)
+		# The "data" filter (where tarfile has it) refuses absolute paths,
+		# links out of $tmp and device files.
+		kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+		with tarfile.open(tarball, mode="r:*") as tf:
+			tf.extractall(path=tmp, **kwargs)
+		shutil.rmtree(prf, ignore_errors=True)
+		os.replace(tmp, prf)
+		os.unlink(tarball)
+
+	# Index the PRFs by channel, so they don't need to be parsed again.
+	if not os.path.exists(os.path.join(prf, prfstore.INDEX_JSON)):
+		prfstore.build_index(prf, jobs=config.jobs)
 
 	sys.stdout.write(" OK\n")
 	sys.stdout.flush()
 
-def save_data(path, config):
-	save_prf(path, config)
+# Makes sure we have an intact copy of the target's FITS file, returning a
+# short description of what was done.
+def save_target(session, target, config):
+	url = datatree.fits_url(target, archive=config.archive)
+	opath = os.path.join(target["dir"], target["fits"])
+	os.makedirs(target["dir"], exist_ok=True)
 
-	with open(os.path.join(path, DATA_JSON)) as fstars:
-		stars = json.load(fstars)
+	done = opath
+	if not config.decompress:
+		done += ".gz"
+	name = os.path.basename(done)
 
-	for star in stars["stars"]:
-		with open(os.path.join(path, star, STAR_JSON)) as ftargets:
-			targets = json.load(ftargets)
+	manifest = load_manifest(target["dir"])
+	entry = manifest.get(name)
 
-		for target, data in targets["targets"].items():
-			sys.stdout.write("Saving target %s/%s " % (star, target))
-			sys.stdout.flush()
+	intact = False
+	if entry is not None:
+		intact = verify(done, entry, full=config.verify)
+	elif os.path.exists(done) and looks_complete(done):
+		# Adopt files downloaded before we had manifests.
+		entry = manifest_entry(done, url, {})
+		manifest[name] = entry
+		save_manifest(target["dir"], manifest)
+		intact = True
 
-			epic = int(target.split(".")[1])
-			campaign = data["campaign"]
-			fits = "ktwo%d-c%.2d_lpd-targ.fits" % (epic, campaign)
+	validators = None
+	if intact:
+		if not config.clobber:
+			return "unchanged"
+		validators = entry
+	elif os.path.exists(done):
+		os.unlink(done)
 
-			url = fits_url(campaign=campaign, target=epic, fits=fits)
-			opath = os.path.join(path, star, target, fits)
+	result = save_fits(session, url, opath, config, validators=validators)
+	if result is None:
+		return "not modified"
 
-			try:
-				os.mkdir(os.path.join(path, star, target))
-			except OSError:
-				pass
+	manifest[name] = manifest_entry(done, url, result)
+	save_manifest(target["dir"], manifest)
+	if entry is not None and not intact:
+		return "repaired"
+	return "downloaded"
 
-			if not config.decompress:
-				opath += ".gz"
+def save_data(path, config):
+	session = new_session(config.jobs, retries=config.retries)
+	save_prf(session, path, config)
 
-			if config.clobber or not os.path.exists(opath):
-				with open(opath, "wb") as ofile:
-					save_fits(url, ofile, config)
+	targets = list(datatree.targets(path))
+	lock = threading.Lock()
 
-			sys.stdout.write(" OK\n")
-			sys.stdout.flush()
+	failed = 0
+	with concurrent.futures.ThreadPoolExecutor(max_workers=config.jobs) as pool:
+		futures = {pool.submit(save_target, session, target, config): target for target in targets}
+		for future in concurrent.futures.as_completed(futures):
+			target = futures[future]
+			try:
+				status = "OK (%s)" % (future.result(),)
+			except (requests.RequestException, OSError, ValueError) as err:
+				failed += 1
+				status = "FAILED (%s)" % (err,)
+
+			with lock:
+				sys.stdout.write("Saving target %s/%s %s\n" % (target["star"], target["target"], status))
+				sys.stdout.flush()
+
+	if failed:
+		raise SystemExit("%d of %d targets failed to download (re-run to resume)" % (failed, len(targets)))
 
 def main(path, config):
 	save_data(path, config)
 
 if __name__ == "__main__":
-	parser = argparse.ArgumentParser(description="Downloads the set of Kepler K2 Long Cadence Files given by a particular `data` metadata tree.")
-	parser.add_argument("-d", "--decompress", dest="decompress", action="store_const", const=True, default=True, help="Enable automatic decompression of data (default).")
-	parser.add_argument("-nd", "--no-decompress", dest="decompress", action="store_const", const=False, default=True, help="Disable automatic decompression of data.")
-	parser.add_argument("-c", "--clobber", dest="clobber", action="store_const", const=True, default=False, help="Enable clobbering of existing data.")
-	parser.add_argument("-nc", "--no-clobber", dest="clobber", action="store_const", const=False, default=False, help="Disable clobbering of existing data (default).")
-	parser.add_argument("path")
-
-	args = parser.parse_args()
-	main(path=args.path, config=args)
+	def __wrapped_main__():
+		parser = argparse.ArgumentParser(description="Downloads the set of Kepler K2 Long Cadence Files given by a particular `data` metadata tree.")
+		parser.add_argument("-d", "--decompress", dest="decompress", action="store_const", const=True, default=True, help="Enable automatic decompression of data (default).")
+		parser.add_argument("-nd", "--no-decompress", dest="decompress", action="store_const", const=False, default=True, help="Disable automatic decompression of data.")
+		parser.add_argument("-c", "--clobber", dest="clobber", action="store_const", const=True, default=False, help="Re-download any existing data which has changed on the server.")
+		parser.add_argument("-nc", "--no-clobber", dest="clobber", action="store_const", const=False, default=False, help="Disable clobbering of existing data (default).")
+		parser.add_argument("-V", "--verify", dest="verify", action="store_true", default=False, help="Check the checksum of every existing file against the manifest, not just its size.")
+		parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=4, help="Number of files to download at once (default: 4).")
+		parser.add_argument("--retries", dest="retries", type=int, default=3, help="Number of times to retry a failed request or resume a dropped download (default: 3).")
+		parser.add_argument("--archive", dest="archive", type=str, default=ARCHIVE_URL, help="Base URL of the target pixel file archive (default: %s)." % (ARCHIVE_URL,))
+		parser.add_argument("--prf-url", dest="prf_url", type=str, default=PRF_URL, help="URL of the PRF tarball (default: %s)." % (PRF_URL,))
+		parser.add_argument("path")
+
+		profiling.add_arguments(parser)
+		args = parser.parse_args()
+		main(path=args.path, config=args)
+
+	profiling.main(__wrapped_main__)
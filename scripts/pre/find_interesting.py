@@ -15,15 +15,38 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import re
+import sys
 import json
 import argparse
-import requests
 import collections
 
+import numpy
+
+import utils
+
+from k2halo import cache
+from k2halo import query
+from k2halo import catalogue
+
 K2_EPIC_URL = "https://archive.stsci.edu/k2/epic/search.php"
 K2_DATA_URL = "https://archive.stsci.edu/k2/data_search/search.php"
 
-def stsci_epic_search(url, **kwargs):
+# The most rows MAST will return for a single search. The JSON output can't be
+# paged, so a search which hits the limit has silently lost rows.
+MAX_RECORDS = 50001
+
+# Parses a search response, warning if it was cut off at max_records.
+def search_results(text, data, what):
+	if text.strip() == "no rows found":
+		return []
+
+	rows = json.loads(text)
+	if len(rows) >= int(data["max_records"]):
+		sys.stderr.write("warning: %s returned %d rows, the --max-records limit; results are probably truncated\n" % (what, len(rows)))
+	return rows
+
+def stsci_epic_search(client, url, **kwargs):
 	data = collections.OrderedDict()
 	data.update([
 		("target", kwargs.get("target", "")),
@@ -56,7 +79,7 @@ def stsci_epic_search(url, **kwargs):
 		("outputformat", kwargs.get("outputformat", "JSON")),
 		("remnull", kwargs.get("remnull", "on")),
 		("outputformat", "JSON"),
-		("max_records", "50001"),
+		("max_records", kwargs.get("max_records", str(MAX_RECORDS))),
 		("max_rpp", kwargs.get("max_rpp", "500")),
 		("action", "Search"),
 	])
@@ -66,14 +89,10 @@ def stsci_epic_search(url, **kwargs):
 	if "selectedColumnsCsv" not in kwargs:
 		kwargs["selectedColumnsCsv"] = "id,k2_ra,k2_dec,k2_avail_flag,kp,bmag,vmag,kepflag,ang_sep"
 
-	r = requests.post(url, data=data)
-	if r.status_code != requests.codes.ok:
-		raise RuntimeError("status code was not 200: %d" % (r.status_code,))
-	if r.text.strip() == "no rows found":
-		return []
-	return r.json()
+	text = client.post(url, data=data)
+	return search_results(text, data, "EPIC search")
 
-def stsci_data_search(url, **kwargs):
+def stsci_data_search(client, url, **kwargs):
 	data = collections.OrderedDict()
 	data.update([
 		("action", "Search"),
@@ -105,7 +124,7 @@ def stsci_data_search(url, **kwargs):
 		("coordformat", kwargs.get("coordformat", "sex")),
 		("remnull", kwargs.get("remnull", "on")),
 		("outputformat", "JSON"),
-		("max_records", "50001"),
+		("max_records", kwargs.get("max_records", str(MAX_RECORDS))),
 		("max_rpp", kwargs.get("max_rpp", "500")),
 	])
 
@@ -114,14 +133,87 @@ def stsci_data_search(url, **kwargs):
 	if "selectedColumnsCsv" not in kwargs:
 		kwargs["selectedColumnsCsv"] = "ktc_k2_id,sci_data_set_name,sci_campaign,objtype,sci_ra,sci_dec,ktc_target_type,refnum,sci_start_time,sci_end_time,kp,kepflag,hip,tyc,sdss,ucac,twomass,mflg,sci_module,sci_output,sci_channel,k2_hlsp,ang_sep"
 
-	r = requests.post(url, data=data)
-	if r.status_code != requests.codes.ok:
-		raise RuntimeError("status code was not 200: %d" % (r.status_code,))
-	if r.text.strip() == "no rows found":
-		return []
+	text = client.post(url, data=data)
+	return search_results(text, data, "data search at %s %s" % (data["ra"], data["dec"]))
+
+
+# Parses a magnitude constraint in the same form as the MAST search forms
+# ("<=6", ">4", "4..6" or just "5"), returning a function which masks an
+# array of magnitudes.
+def magnitude_filter(expr):
+	expr = expr.strip()
+	if ".." in expr:
+		lo, hi = (float(x) for x in expr.split(".."))
+		return lambda mags: (mags >= lo) & (mags <= hi)
 
-	return r.json()
+	match = re.match(r"^(<=|>=|<|>|=)?\s*([-+0-9.eE]+)$", expr)
+	if not match:
+		raise ValueError("invalid magnitude constraint: %s" % (expr,))
+	op, value = match.group(1) or "=", float(match.group(2))
+	return {
+		"<=": lambda mags: mags <= value,
+		">=": lambda mags: mags >= value,
+		"<": lambda mags: mags < value,
+		">": lambda mags: mags > value,
+		"=": lambda mags: mags == value,
+	}[op]
 
+def online_search(config):
+	client = query.from_config(config)
+
+	print ("[*  ] Finding %s search." % (config.magnitude,))
+	brights = stsci_epic_search(client, config.epic_url, extra_column_name_1="vmag", extra_column_value_1=config.magnitude, k2_avail_flag="0", max_records=str(config.max_records))
+
+	# The cone searches are independent, so run them concurrently. They're
+	# cached by position and radius, so changing the magnitude cut only
+	# needs the new stars to be searched.
+	def search(bright):
+		return stsci_data_search(client, config.data_url, ra=bright["RA"], dec=bright["Dec"], radius=config.radius, max_records=str(config.max_records))
+	return brights, client.map(search, brights)
+
+# The same search as online_search, but against local catalogues (see
+# buildcatalogue.py) so it can be done without network access. The results
+# use the same keys as the MAST output, with None for missing values. The
+# online search only asks for stars with a K2 availability flag of 0, which
+# can only be done here if the EPIC catalogue has that column.
+def offline_search(config):
+	epics = catalogue.Catalogue.load(config.epic_catalogue)
+	targets = catalogue.Catalogue.load(config.target_catalogue)
+
+	print ("[*  ] Finding %s search (offline)." % (config.magnitude,))
+	with numpy.errstate(invalid="ignore"):
+		wanted = magnitude_filter(config.magnitude)(epics["vmag"])
+	if "k2_avail_flag" in epics.columns:
+		wanted &= epics["k2_avail_flag"] == 0
+	else:
+		sys.stderr.write("warning: %s has no k2_avail_flag column, so stars aren't filtered on it as they are online\n" % (config.epic_catalogue,))
+	idxs = numpy.where(wanted)[0]
+
+	brights = []
+	for idx in idxs:
+		row = epics.row(idx)
+		bright = {"EPIC": row["epic"], "RA": row["ra"], "Dec": row["dec"]}
+		if "hip" in row and row["hip"] == row["hip"]:
+			bright["HIP"] = int(row["hip"])
+		brights.append(bright)
+
+	def campaign(nidx):
+		if "campaign" not in targets.columns:
+			return None
+		value = targets["campaign"][nidx].item()
+		if value != value or value == "":
+			return None
+		return int(value)
+
+	results = []
+	for nidxs, seps in targets.neighbours(epics["ra"][idxs], epics["dec"][idxs], config.radius):
+		results.append([{
+			"K2 ID": targets["epic"][nidx].item(),
+			"Dataset Name": targets["dsname"][nidx].item() if "dsname" in targets.columns else "",
+			"Campaign": campaign(nidx),
+			"Ang Sep (')": round(sep, 3),
+		} for nidx, sep in zip(nidxs, seps)])
+	return brights, results
 
 def main(outfile, config):
 	out = {
@@ -130,21 +222,21 @@ def main(outfile, config):
 		"data": [],
 	}
 
-	print ("[*  ] Finding %s search." % (config.magnitude,))
-	brights = stsci_epic_search(K2_EPIC_URL, extra_column_name_1="vmag", extra_column_value_1=config.magnitude, k2_avail_flag="0")
+	if config.epic_catalogue is not None:
+		brights, results = offline_search(config)
+	else:
+		brights, results = online_search(config)
 
-	for bright in brights:
+	for bright, postage_stamps in zip(brights, results):
 		print("[** ] EPIC:   %s" % (bright["EPIC"],))
 		print("[** ] Searching in <=%d' radius." % (config.radius,))
-
-		postage_stamps = stsci_data_search(K2_DATA_URL, ra=bright["RA"], dec=bright["Dec"], radius=config.radius)
-
 		print ("[** ] Found [%d] postage stamps!" % (len(postage_stamps),))
 
 		nears = []
 		campaigns = set()
 		for postage_stamp in postage_stamps:
-			campaigns.add(postage_stamp["Campaign"])
+			if postage_stamp["Campaign"] is not None:
+				campaigns.add(postage_stamp["Campaign"])
 			nears.append({
 				"epic": postage_stamp["K2 ID"],
 				"dsname": postage_stamp["Dataset Name"],
@@ -166,7 +258,16 @@ if __name__ == "__main__":
 	parser = argparse.ArgumentParser(description="Finds and outputs all 'interesting' EPIC targets, for use in contamination photometry.")
 	parser.add_argument("-m", "--magnitude", dest="magnitude", default="<=6", type=str, help="Magnitude rval of bright star in field.")
 	parser.add_argument("-r", "--radius", dest="radius", default=5, type=float, help='Radius (arcmin) to search for contaminated postage stamps (default: 5").')
+	parser.add_argument("--epic-url", dest="epic_url", default=K2_EPIC_URL, help="URL of the EPIC catalogue search (default: %s)." % (K2_EPIC_URL,))
+	parser.add_argument("--data-url", dest="data_url", default=K2_DATA_URL, help="URL of the K2 data search (default: %s)." % (K2_DATA_URL,))
+	parser.add_argument("--epic-catalogue", dest="epic_catalogue", default=None, help="Search a local EPIC catalogue (from buildcatalogue.py) for bright stars instead of MAST. Requires --target-catalogue. Stars are only filtered on k2_avail_flag (as they are online) if the catalogue has that column.")
+	parser.add_argument("--target-catalogue", dest="target_catalogue", default=None, help="Local catalogue of K2 targets to search around the bright stars.")
+	parser.add_argument("--max-records", dest="max_records", default=MAX_RECORDS, type=int, help="Maximum number of rows to ask MAST for in each search, warning if a search hits it (default: %d)." % (MAX_RECORDS,))
+	query.add_arguments(parser)
+	cache.add_arguments(parser)
 	parser.add_argument("csv", nargs=1)
 
 	args = parser.parse_args()
+	if (args.epic_catalogue is None) != (args.target_catalogue is None):
+		parser.error("--epic-catalogue and --target-catalogue must be used together")
 	main(outfile=args.csv[0], config=args)
@@ -15,88 +15,23 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import csv
+import os
 import sys
 import numpy
 import argparse
 import operator
 
-import astropy.io.fits
-import skimage.measure
-import scipy
-import scipy.interpolate
-
-import shapely.ops
 import shapely.wkt
-import shapely.geometry
 import shapely.affinity
 
 import utils
 
-def filter_img(config, img, track=None, frame=0):
-	flxs = img[1].data["FLUX"]
-	time = img[1].data["TIME"]
-	qual = img[1].data["QUALITY"]
-	cadn = img[1].data["CADENCENO"]
-	trac = None
-
-	# We need to fix up the times so they are in *absolute* BJD.
-	time += img[1].header["BJDREFI"] + img[1].header["BJDREFF"]
-
-	# Remove frames not in our track data.
-	if track is not None:
-		filt = numpy.in1d(cadn, [tr["cadence"] for tr in track])
-
-		flxs = flxs[filt]
-		time = time[filt]
-		qual = qual[filt]
-		cadn = cadn[filt]
-
-		# Fix up track.
-		trac = numpy.array(track)[numpy.in1d([tr["cadence"] for tr in track], cadn)]
-		del track
-
-	# Remove bad quality frames.
-	filt = (qual == 0)
-	flxs = flxs[filt]
-	time = time[filt]
-	cadn = cadn[filt]
-	if trac is not None:
-		trac = trac[filt]
-
-	if trac is not None:
-		# We set the first track as being at the given one, because then
-		# the users can deal with specifiying their track point at a time t.
-		trac = numpy.array([(tr["x"], tr["y"]) for tr in trac], dtype=float)
-		trac[:, 0] -= trac[frame, 0]
-		trac[:, 1] -= trac[frame, 1]
-
-	flxs = flxs[config.start:config.end]
-	time = time[config.start:config.end]
-	cadn = cadn[config.start:config.end]
-	if trac is not None:
-		trac = trac[config.start:config.end]
-
-	return {
-		"FLUX": flxs,
-		"TIME": time,
-		"CADENCENO": cadn,
-		"TRACK": trac,
-	}
-
-def postage_stamp(flux):
-	ignore = ~numpy.any(numpy.isnan(flux), axis=0)
-
-	polys = []
-	for pos in zip(*numpy.where(ignore)):
-		x, y = pos
-		px = shapely.geometry.box(x, y, x + 1, y + 1)
-		polys.append(px)
-
-	return shapely.ops.cascaded_union(polys)
+from k2halo import progress
+from k2halo.prf import PRFStore
+from k2halo import profiling
 
 def new_mask(config, img):
-	return postage_stamp(img["FLUX"])
+	return utils.postage_stamp(img["FLUX"])
 
 # TODO: Check that we're not hitting off-by-one errors in the polygon code.
 #       Looking at the animation, it looks like the mask is slightly off.
@@ -107,14 +42,9 @@ def polymask(mask):
 
 	SELECT_CHAR = "x"
 	mask = numpy.array(mask, dtype=str)
-	polys = []
 
 	# Basically the same as postage_stamp but with 'mask == SELECT_CHAR'.
-	for x, y in zip(*numpy.where(mask == SELECT_CHAR)):
-		px = shapely.geometry.box(x, y, x + 1, y + 1)
-		polys.append(px)
-
-	return shapely.ops.cascaded_union(polys)
+	return utils.pixel_union(*numpy.where(mask == SELECT_CHAR))
 
 def ascii_mask(mfile):
 	# We reverse it from the "friendly" syntax to the coordinate-correct
@@ -130,27 +60,27 @@ def ascii_mask(mfile):
 	# Create polygon based on mask.
 	return polymask(mask)
 
-def moving_mask(config, img, mask):
+def moving_mask(config, img, mask, tracer=progress.NULL):
 	flux = img["FLUX"]
 	trac = img["TRACK"]
 
-	stamp = postage_stamp(flux)
-	for i, flx in enumerate(flux):
-		# XXX: Output some information to convince people we haven't frozen.
-		sys.stdout.write(".")
-		sys.stdout.flush()
+	stamp = utils.postage_stamp(flux)
+	with tracer.progress("mask", len(flux)) as frames:
+		for i, flx in enumerate(flux):
+			# Translate the aperture and mask out the edges outside the stamp.
+			_mask = shapely.affinity.translate(mask, *-trac[i])
+			_mask = _mask.intersection(stamp)
+			_mask = shapely.affinity.translate(_mask, *trac[i])
 
-		# Translate the aperture and mask out the edges outside the stamp.
-		_mask = shapely.affinity.translate(mask, *-trac[i])
-		_mask = _mask.intersection(stamp)
-		_mask = shapely.affinity.translate(_mask, *trac[i])
-
-		# Update mask.
-		mask = _mask
+			# Update mask.
+			mask = _mask
+			frames.update()
 
 	return mask
 
 def prf_similarity(vec, flx, prf, **kwargs):
+	import scipy.interpolate
+
 	x, y, scale = vec
 	delta = (x, y)
 
@@ -158,7 +88,7 @@ def prf_similarity(vec, flx, prf, **kwargs):
 	ylen, xlen = flx.shape
 	gridx, gridy = (numpy.mgrid[1:ylen:ylen*1j,1:xlen:xlen*1j].T + delta).T - 1
 	points = numpy.array(numpy.where(prf == prf)).T
-	interp = scipy.interpolate.griddata(points * scale, prf[list(points.T)], (gridx, gridy), **kwargs)
+	interp = scipy.interpolate.griddata(points * scale, prf[tuple(points.T)], (gridx, gridy), **kwargs)
 
 	# Basically the same as flux_similarity...
 	interp[numpy.isnan(interp)] = numpy.median(prf[~numpy.isnan(prf)])
@@ -178,20 +108,25 @@ def prf_similarity(vec, flx, prf, **kwargs):
 	# Compare similarity using SSIM (http://dl.acm.org/citation.cfm?id=2320551#)
 	# which is better than the "trivial" root-mean-square method and instead
 	# encodes structural information in the comparison.
-	ssim = skimage.measure.compare_ssim(flx, interp, gaussian_weights=True)
+	ssim = utils.ssim(flx, interp, gaussian_weights=True)
 
 	# We want to converge on a ssim of 1. Also multiply it so it's large enough
 	# to not trigger early convergence detection.
 	return 1000 * (1 - ssim)
 
 def subtract_prf(config, img, img_orig, mask):
+	import scipy.optimize
+	import scipy.interpolate
+
 	flux = img["FLUX"]
 	trac = img["TRACK"]
 
-	prf = astropy.io.fits.open(config.prf)
-
 	# TODO: We should interpolate the PRF to the co-ordinates of the target.
-	prf = prf[5].data
+	if os.path.isdir(config.prf):
+		# The whole (extracted) PRF archive, so we can pick the right channel.
+		prf = PRFStore(config.prf).for_tpf(img_orig)
+	else:
+		prf = utils.open_fits(config.prf)[5].data
 	flx = flux[config.frame]
 
 	flx = numpy.array(flx, dtype="float64")
@@ -202,7 +137,7 @@ def subtract_prf(config, img, img_orig, mask):
 	ylen, xlen = numpy.array(flx.shape) * MULT
 	gridx, gridy = numpy.mgrid[1:ylen:ylen*1j,1:xlen:xlen*1j] / MULT - 1
 	points = numpy.array(numpy.where(prf == prf)).T
-	prf = scipy.interpolate.griddata(points, prf[list(points.T)], (gridx, gridy))
+	prf = scipy.interpolate.griddata(points, prf[tuple(points.T)], (gridx, gridy))
 	print(prf)
 
 	# la-di-da
@@ -224,39 +159,32 @@ MODE_ASCII="ascii"
 MODE_TRACK="track"
 MODE_PRF="prf"
 
-def main(config):
-	img_orig = astropy.io.fits.open(config.fits)
-
-	track = None
-	if config.track is not None:
-		with open(config.track) as f:
-			# TODO: Fix this by using the utils version?
-			def parse_row(cadence, x, y):
-				return (cadence, float(x), float(y))
-
-			# TODO: Fix this by not using fieldnames=XYZ.
-			rows = csv.DictReader(f)
-
-			# First row specifies the polarity.
-			_, mx, my = parse_row(**next(rows))
-			track = numpy.array([{"cadence": cadence, "x": x*mx, "y": y*my} for (cadence, x, y) in (parse_row(**row) for row in rows)])
-
-	img = filter_img(config, img_orig, track=track)
-
-	if config.mode == MODE_INIT:
-		# Create a new mask.
-		mask = new_mask(config, img)
-	elif config.mode == MODE_ASCII:
-		# Convert the mask.
-		mask = ascii_mask(sys.stdin)
-	else:
-		# Open the base mask.
-		mask = shapely.wkt.loads(sys.stdin.read())
-
-	if config.mode == MODE_TRACK:
-		mask = moving_mask(config, img, mask)
-	elif config.mode == MODE_PRF:
-		mask = subtract_prf(config, img, img_orig, mask)
+def main(config, tracer=progress.NULL):
+	with tracer.stage("load"):
+		img_orig = utils.open_fits(config.fits)
+
+		track = None
+		if config.track is not None:
+			with open(config.track) as f:
+				track = utils.read_track(f)
+
+		img = utils.filter_img(img_orig, track=track, start=config.start, end=config.end, fill_nan=False)
+
+	with tracer.stage(config.mode):
+		if config.mode == MODE_INIT:
+			# Create a new mask.
+			mask = new_mask(config, img)
+		elif config.mode == MODE_ASCII:
+			# Convert the mask.
+			mask = ascii_mask(sys.stdin)
+		else:
+			# Open the base mask.
+			mask = shapely.wkt.loads(sys.stdin.read())
+
+		if config.mode == MODE_TRACK:
+			mask = moving_mask(config, img, mask, tracer=tracer)
+		elif config.mode == MODE_PRF:
+			mask = subtract_prf(config, img, img_orig, mask)
 
 	# For my own sanity.
 	assert mask.equals(shapely.wkt.loads(shapely.wkt.dumps(mask)))
@@ -290,10 +218,12 @@ if __name__ == "__main__":
 		parser.add_argument("-ec", "--end", dest="end", type=int, default=None, help="End cadence (default: None).")
 		# Input file.
 		parser.add_argument("--input", action="store_true", default=False, help="Read input from stdin")
-		parser.add_argument("--prf", default=None)
+		parser.add_argument("--prf", default=None, help="The PRF file to fit, or the PRF archive directory (from downloaddata.py) to use the target's channel from.")
 		parser.add_argument("--frame", default=None, type=int, help="")
 		parser.add_argument("-t", dest="track", type=str, help="A CSV File with (cadence, x, y) track data of the FITS file.")
+		progress.add_arguments(parser)
 
+		profiling.add_arguments(parser)
 		args = parser.parse_args()
 
 		# This is going to be fun.
@@ -306,6 +236,7 @@ if __name__ == "__main__":
 		if not operator.xor(args.mode in {MODE_PRF, MODE_TRACK}, args.track is None):
 			raise ValueError("-t is necessary for --track and --fit-prf")
 
-		main(args)
+		with progress.from_config(args) as tracer:
+			main(args, tracer=tracer)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)
@@ -21,76 +21,21 @@ import sys
 import math
 import numpy
 import numpy.linalg
-import scipy.interpolate
-import scipy.optimize
-import skimage.measure
 import argparse
 
-import matplotlib
-matplotlib.use("TkAgg")
-#if not os.getenv("DISPLAY"):
-#	matplotlib.use("Agg") # Hack to fix no display.
-r'''
-matplotlib.rcParams.update({
-	"backend": "ps",
-	"text.latex.preamble": [r"\usepackage{gensymb}"],
-	"axes.labelsize": 13, # fontsize for x and y labels (was 10)
-	"axes.titlesize": 13,
-	"font.size": 13, # was 10
-	"legend.fontsize": 13, # was 10
-	"xtick.labelsize": 13,
-	"ytick.labelsize": 13,
-	"font.family": "serif", # ???
-})
-'''
-import matplotlib.pyplot as plt
-
-import emcee
-import corner
-import astropy.io.fits
 import utils
 
-def filter_img(config, img):
-	flxs = img[1].data["FLUX"]
-	time = img[1].data["TIME"]
-	qual = img[1].data["QUALITY"]
-	cadn = img[1].data["CADENCENO"]
-
-	# We need to fix up the times so they are in *absolute* BJD.
-	time += img[1].header["BJDREFI"] + img[1].header["BJDREFF"]
-
-	# Remove bad quality frames.
-	filt = (qual == 0)
-	flxs = flxs[filt]
-	time = time[filt]
-	cadn = cadn[filt]
-
-	flxs = flxs[config.start:config.end]
-	time = time[config.start:config.end]
-	cadn = cadn[config.start:config.end]
-
-	return {
-		"FLUX": flxs,
-		"TIME": time,
-		"CADENCENO": cadn,
-	}
-
-def postage_stamp(flux):
-	ignore = ~numpy.any(numpy.isnan(flux), axis=0)
-
-	polys = []
-	for pos in zip(*numpy.where(ignore)):
-		x, y = pos
-		px = shapely.geometry.box(x, y, x + 1, y + 1)
-		polys.append(px)
-
-	return shapely.ops.cascaded_union(polys)
+from k2halo import cache
+from k2halo import progress
+from k2halo import profiling
 
 def interpolate_flux(flux, delta, **kwargs):
+	import scipy.interpolate
+
 	points = numpy.array(numpy.where(flux == flux)).T
 	ylen, xlen = flux.shape
 	gridx, gridy = (numpy.mgrid[1:ylen:ylen*1j,1:xlen:xlen*1j].T + delta).T - 1
-	return scipy.interpolate.griddata(points, flux[list(points.T)], (gridx, gridy), **kwargs)
+	return scipy.interpolate.griddata(points, flux[tuple(points.T)], (gridx, gridy), **kwargs)
 
 def flux_similarity(vec, base, flux, H):
 	# Create an interpolated flux setup.
@@ -105,7 +50,7 @@ def flux_similarity(vec, base, flux, H):
 	# Compare similarity using SSIM (http://dl.acm.org/citation.cfm?id=2320551#)
 	# which is better than the "trivial" root-mean-square method and instead
 	# encodes structural information in the comparison.
-	ssim = skimage.measure.compare_ssim(flux, interp, gaussian_weights=True, win_size=win_size)
+	ssim = utils.ssim(flux, interp, gaussian_weights=True, win_size=win_size)
 
 	# We want to converge on a ssim of 1. Also multiply it so it's large enough
 	# to not trigger early convergence detection.
@@ -152,9 +97,10 @@ def DEBUG_plot(idx, fig, base, flx, H):
 	fig.tight_layout()
 	fig.colorbar(s, cmap="viridis")
 
-def main(ofile, config):
-	img = astropy.io.fits.open(config.fits)
-	img = filter_img(config, img)
+def track(ofile, writer, config, tracer=progress.NULL):
+	with tracer.stage("load"):
+		img = utils.open_fits(config.fits)
+		img = utils.filter_img(img, start=config.start, end=config.end, fill_nan=False)
 
 	# Short-hand.
 	cadn = img["CADENCENO"]
@@ -175,11 +121,6 @@ def main(ofile, config):
 	# Take the first frame as our "base". We grid interpolate it later.
 	base = flxs_hanning[config.first,...]
 
-	# XXX: This format is horrible...
-	writer = csv.DictWriter(ofile, fieldnames=["cadence", "x", "y"])
-	writer.writeheader()
-	writer.writerow({"cadence": "", "x": -1, "y": -1})
-
 	# Figure out the initial vector.
 	NDIM = len(base.shape)
 	seed_vec = config.perturb*numpy.random.rand(NDIM)
@@ -187,32 +128,60 @@ def main(ofile, config):
 	# Purely for debugging.
 	debug_ssim = set([int(idx) for idx in config.plot_ssim])
 
-	# Iterate over the frames.
-	for idx, flx in enumerate(flxs_hanning):
-		# XXX: Output some information to convince people we haven't frozen.
-		sys.stdout.write(".")
-		sys.stdout.flush()
+	import scipy.optimize
+
+	xs = []
+	ys = []
+
+	# Iterate over the frames. The track may well be going to stdout, so
+	# progress (and anything else) has to go to stderr.
+	with tracer.stage("track"), tracer.progress("track", len(flxs_hanning)) as frames:
+		for idx, flx in enumerate(flxs_hanning):
+			# If we are on the base frame we know that the offset is (0, 0).
+			if config.first == idx:
+				seed_vec = numpy.zeros(NDIM)
 
-		# If we are on the base frame we know that the offset is (0, 0).
-		if config.first == idx:
-			seed_vec = numpy.zeros(NDIM)
+			if idx in debug_ssim:
+				plt = utils.pyplot(backend="TkAgg")
+				fig = plt.figure(figsize=(10, 10), dpi=50)
+				DEBUG_plot(idx, fig, base, flx, H)
+				plt.legend()
+				plt.savefig("output_%d.png" % (idx,))
+				sys.stderr.write("[!] output_%d.png\n" % (idx,))
 
-		if idx in debug_ssim:
-			fig = plt.figure(figsize=(10, 10), dpi=50)
-			DEBUG_plot(idx, fig, base, flx, H)
-			plt.legend()
-			plt.savefig("output_%d.png" % (idx,))
-			print("[!] output_%d.png" % (idx,))
+			vec, fopt, *_ = scipy.optimize.fmin(flux_similarity, seed_vec, args=(base, flx, H), full_output=True, disp=False)
+			writer.writerow({"cadence": cadn[idx], "x": vec[1], "y": vec[0]})
+			ofile.flush()
+			xs.append(vec[1])
+			ys.append(vec[0])
+			frames.update()
 
-		vec, fopt, *_ = scipy.optimize.fmin(flux_similarity, seed_vec, args=(base, flx, H), full_output=True, disp=False)
-		writer.writerow({"cadence": cadn[idx], "x": vec[1], "y": vec[0]})
-		ofile.flush()
+			# We base the next frame on the previous one, sort of like MC.
+			seed_vec = vec
 
-		# We base the next frame on the previous one, sort of like MC.
-		seed_vec = vec
+	return {"cadence": cadn, "x": numpy.array(xs), "y": numpy.array(ys)}
+
+def main(ofile, config, tracer=progress.NULL):
+	# XXX: This format is horrible...
+	writer = csv.DictWriter(ofile, fieldnames=["cadence", "x", "y"])
+	writer.writeheader()
+	writer.writerow({"cadence": "", "x": -1, "y": -1})
 
-	sys.stdout.write("DONE\n")
-	sys.stdout.flush()
+	# The SSIM plots are only made while tracking, so don't replay a cached
+	# result when they were asked for.
+	store = cache.from_config(config) if not config.plot_ssim else None
+	key = None
+	if store is not None:
+		key = cache.digest("trackframe", cache.input_key(utils.resolve_fits(config.fits)), cache.config_key(config, ignore=["fits", "output"]))
+		data = store.get(key)
+		if data is not None:
+			for row in zip(data["cadence"], data["x"], data["y"]):
+				writer.writerow(dict(zip(["cadence", "x", "y"], row)))
+			return
+
+	data = track(ofile, writer, config, tracer=tracer)
+	if store is not None:
+		store.put(key, data)
 
 if __name__ == "__main__":
 	def __wrapped_main__():
@@ -225,13 +194,16 @@ if __name__ == "__main__":
 		# Cadence options
 		parser.add_argument("-sc", "--start", dest="start", type=int, default=None, help="Start cadence (default: None).")
 		parser.add_argument("-ec", "--end", dest="end", type=int, default=None, help="End cadence (default: None).")
+		cache.add_arguments(parser)
+		progress.add_arguments(parser)
 
+		profiling.add_arguments(parser)
 		args = parser.parse_args()
 		if args.output is None:
 			ofile = sys.stdout
 		else:
 			ofile = open(args.output, "w")
-		with ofile:
-			main(ofile, args)
+		with ofile, progress.from_config(args) as tracer:
+			main(ofile, args, tracer=tracer)
 
-	__wrapped_main__()
+	profiling.main(__wrapped_main__)